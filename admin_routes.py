@@ -1,17 +1,33 @@
-from flask import Blueprint, render_template, request, redirect, url_for, session, flash, jsonify
-from werkzeug.security import check_password_hash, generate_password_hash
-from models import db, Operator, Route, Trip, Booking, Customer, OperatorBusType, OperatorLocation, RouteOperatorAssignment, BusType, SeatBlock
-from forms import OperatorForm
-from datetime import datetime
+from flask import Blueprint, render_template, request, redirect, url_for, session, flash, jsonify, Response, stream_with_context, current_app, abort
+from werkzeug.security import check_password_hash
+from models import db, Operator, Route, Trip, Booking, Customer, OperatorBusType, OperatorLocation, RouteOperatorAssignment, BusType, SeatBlock, AuditLog, DailyRouteStats
+import trip_operations
+from trip_operations import parse_trip_filters, trip_filter_conditions
+from search_index import booking_search_condition
+from pagination import keyset_paginate, cached_count
+from cache import invalidate
+from sessions import regenerate_session
+from exports import export_stream
+import bulk_import
+import archive
+import audit
+import profiler
+from manifests import MANIFEST_FORMATS, MIMETYPES as MANIFEST_MIMETYPES, build_manifest, render_manifest, get_day_manifest, day_overview
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload
+from datetime import datetime, timedelta
 import os
 import json
+import logging
 from werkzeug.utils import secure_filename
 
 admin_bp = Blueprint('admin_bp', __name__)
+logger = logging.getLogger(__name__)
 
 # Simple admin authentication (you may want to enhance this)
 ADMIN_EMAIL = 'admin@nkolopass.com'
-ADMIN_PASSWORD_HASH = generate_password_hash('Aa18552219$')
+# Precomputed: hashing at import cost every worker ~0.35s of startup
+ADMIN_PASSWORD_HASH = 'pbkdf2:sha256:600000$breIvH0UQScVbu28$7324d63b241b773890f33c90fdf458b637df11c16f47e970a27f7385ba319e7c'
 
 @admin_bp.route('/login', methods=['GET', 'POST'])
 def login():
@@ -20,6 +36,7 @@ def login():
         password = request.form.get('password')
         
         if email == ADMIN_EMAIL and check_password_hash(ADMIN_PASSWORD_HASH, password):
+            regenerate_session(session)
             session['admin_id'] = 1
             session['admin_email'] = email
             flash('Login successful!', 'success')
@@ -70,68 +87,198 @@ def dashboard():
                          recent_trips=recent_trips,
                          recent_bookings=recent_bookings)
 
+def parse_booking_filters(source):
+    """Read the bookings list filters from request.args"""
+    return {
+        'status': source.get('status', ''),
+        'payment_status': source.get('payment_status', ''),
+        'date_from': source.get('date_from', ''),
+        'date_to': source.get('date_to', ''),
+        'search': source.get('search', '')
+    }
+
+def booking_filter_conditions(filters):
+    """Build WHERE conditions on Booking from list filters (date_to inclusive)"""
+    conditions = []
+    
+    if filters.get('status'):
+        conditions.append(Booking.status == filters['status'])
+    
+    if filters.get('payment_status'):
+        conditions.append(Booking.payment_status == filters['payment_status'])
+    
+    if filters.get('date_from'):
+        date_from = datetime.strptime(filters['date_from'], '%Y-%m-%d')
+        conditions.append(Booking.created_at >= date_from)
+    
+    if filters.get('date_to'):
+        date_to = datetime.strptime(filters['date_to'], '%Y-%m-%d') + timedelta(days=1)
+        conditions.append(Booking.created_at < date_to)
+    
+    if filters.get('search'):
+        conditions.append(booking_search_condition(filters['search']))
+    
+    return conditions
+
+def _booking_page(filters):
+    """Keyset page of bookings, newest first, with related rows eager-loaded"""
+    query = Booking.query.filter(*booking_filter_conditions(filters))
+    total = cached_count(('bookings', tuple(sorted(filters.items()))), query, tags=('booking', 'customer'))
+    query = query.options(
+        joinedload(Booking.customer),
+        joinedload(Booking.trip).joinedload(Trip.route),
+        joinedload(Booking.trip).joinedload(Trip.operator)
+    )
+    return keyset_paginate(
+        query, Booking.created_at, Booking.id,
+        after=request.args.get('after'),
+        before=request.args.get('before'),
+        per_page=request.args.get('per_page', 25, type=int),
+        total=total
+    )
+
 @admin_bp.route('/bookings')
 def bookings():
     if 'admin_id' not in session:
         return redirect(url_for('admin_bp.login'))
     
-    # Get filter parameters from request
+    filters = parse_booking_filters(request.args)
+    bookings = _booking_page(filters)
+    
+    # Create filters_dict for pagination links
+    filters_dict = {k: v for k, v in filters.items() if v}
+    if bookings.per_page != 25:
+        filters_dict['per_page'] = bookings.per_page
+    
+    return render_template('admin/bookings/list.html', 
+                         bookings=bookings, 
+                         filters=filters,
+                         filters_dict=filters_dict)
+
+@admin_bp.route('/api/bookings')
+def api_bookings():
+    if 'admin_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    try:
+        bookings = _booking_page(parse_booking_filters(request.args))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify(bookings.to_dict(lambda booking: {
+        'id': booking.id,
+        'booking_reference': booking.booking_reference,
+        'customer': {
+            'name': booking.customer.name,
+            'email': booking.customer.email,
+            'phone': booking.customer.phone
+        },
+        'trip_id': booking.trip_id,
+        'route': f"{booking.trip.route.origin} → {booking.trip.route.destination}",
+        'operator': booking.trip.operator.name,
+        'departure_time': booking.trip.departure_time.isoformat(),
+        'seat_numbers': booking.get_seat_numbers(),
+        'total_amount': booking.total_amount,
+        'payment_status': booking.payment_status,
+        'status': booking.status,
+        'created_at': booking.created_at.isoformat() if booking.created_at else None
+    }))
+
+@admin_bp.route('/export/<kind>')
+def export_data(kind):
+    if 'admin_id' not in session:
+        return redirect(url_for('admin_bp.login'))
+    
+    # Same filters as the bookings / trips list pages; settlement uses the trip filters
+    if kind == 'bookings':
+        conditions = booking_filter_conditions(parse_booking_filters(request.args))
+    else:
+        conditions = trip_filter_conditions(parse_trip_filters(request.args))
+    
+    try:
+        body, mimetype, filename = export_stream(kind, conditions, request.args.get('format', 'csv'))
+    except ValueError as e:
+        flash(str(e), 'error')
+        return redirect(request.referrer or url_for('admin_bp.dashboard'))
+    
+    return Response(stream_with_context(body), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename={filename}',
+        'X-Accel-Buffering': 'no'
+    })
+
+@admin_bp.route('/analytics')
+def analytics():
+    if 'admin_id' not in session:
+        return redirect(url_for('admin_bp.login'))
+    
+    from analytics import get_stats, parse_date_range, GROUP_BY_OPTIONS
+    
     filters = {
-        'status': request.args.get('status', ''),
-        'payment_status': request.args.get('payment_status', ''),
         'date_from': request.args.get('date_from', ''),
         'date_to': request.args.get('date_to', ''),
-        'search': request.args.get('search', '')
+        'group_by': request.args.get('group_by', 'route'),
+        'operator_id': request.args.get('operator_id', ''),
+        'bus_category': request.args.get('bus_category', '')
     }
     
-    # Build query with filters
-    query = Booking.query
-    
-    if filters['status']:
-        query = query.filter(Booking.status == filters['status'])
-    
-    if filters['payment_status']:
-        query = query.filter(Booking.payment_status == filters['payment_status'])
-    
-    if filters['date_from']:
-        from datetime import datetime
-        date_from = datetime.strptime(filters['date_from'], '%Y-%m-%d').date()
-        query = query.filter(Booking.created_at >= date_from)
-    
-    if filters['date_to']:
-        from datetime import datetime
-        date_to = datetime.strptime(filters['date_to'], '%Y-%m-%d').date()
-        query = query.filter(Booking.created_at <= date_to)
-    
-    if filters['search']:
-        search_term = f"%{filters['search']}%"
-        query = query.join(Customer).filter(
-            db.or_(
-                Booking.booking_reference.ilike(search_term),
-                Customer.name.ilike(search_term),
-                Customer.email.ilike(search_term),
-                Customer.phone.ilike(search_term)
-            )
-        )
+    start_date, end_date = parse_date_range(filters['date_from'], filters['date_to'])
+    stats = get_stats(start_date, end_date,
+                      group_by=filters['group_by'],
+                      operator_id=filters['operator_id'] or None,
+                      bus_category=filters['bus_category'] or None)
+    daily = get_stats(start_date, end_date,
+                      group_by='day',
+                      operator_id=filters['operator_id'] or None,
+                      bus_category=filters['bus_category'] or None)
     
-    # Get page number from request
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 25, type=int)
+    operators = Operator.query.all()
     
-    # Apply pagination
-    bookings = query.order_by(Booking.created_at.desc()).paginate(
-        page=page, 
-        per_page=per_page, 
-        error_out=False
-    )
+    return render_template('admin/analytics/index.html',
+                         stats=stats,
+                         daily=daily,
+                         filters=filters,
+                         start_date=start_date,
+                         end_date=end_date,
+                         group_by_options=GROUP_BY_OPTIONS,
+                         operators=operators)
+
+@admin_bp.route('/api/analytics')
+def api_analytics():
+    """API endpoint returning rollup statistics for a date range"""
+    if 'admin_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
     
-    # Create filters_dict for pagination links
-    filters_dict = {k: v for k, v in filters.items() if v}
+    from analytics import get_stats, parse_date_range
+    
+    start_date, end_date = parse_date_range(request.args.get('date_from'), request.args.get('date_to'))
+    stats = get_stats(start_date, end_date,
+                      group_by=request.args.get('group_by', 'route'),
+                      route_id=request.args.get('route_id', type=int),
+                      operator_id=request.args.get('operator_id', type=int),
+                      bus_category=request.args.get('bus_category') or None)
+    stats['date_from'] = start_date.isoformat()
+    stats['date_to'] = end_date.isoformat()
+    return jsonify(stats)
+
+@admin_bp.route('/analytics/rebuild', methods=['POST'])
+def rebuild_analytics():
+    if 'admin_id' not in session:
+        return redirect(url_for('admin_bp.login'))
     
-    return render_template('admin/bookings/list.html', 
-                         bookings=bookings, 
-                         filters=filters,
-                         filters_dict=filters_dict)
+    from analytics import rebuild_daily_stats, parse_date_range
+    
+    try:
+        if request.form.get('date_from') or request.form.get('date_to'):
+            start_date, end_date = parse_date_range(request.form.get('date_from'), request.form.get('date_to'))
+            days = rebuild_daily_stats(start_date, end_date)
+        else:
+            days = rebuild_daily_stats()
+        flash(f'Analytics rebuilt for {days} day(s)', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error rebuilding analytics: {str(e)}', 'error')
+    
+    return redirect(url_for('admin_bp.analytics'))
 
 @admin_bp.route('/operators')
 def operators():
@@ -154,6 +301,8 @@ def add_operator():
     if 'admin_id' not in session:
         return redirect(url_for('admin_bp.login'))
     
+    # Flask-WTF/WTForms load on first use; only these two views need them
+    from forms import OperatorForm
     form = OperatorForm()
     
     if form.validate_on_submit():
@@ -181,6 +330,7 @@ def edit_operator(id):
         return redirect(url_for('admin_bp.login'))
     
     operator = Operator.query.get_or_404(id)
+    from forms import OperatorForm
     form = OperatorForm(obj=operator)
     
     if form.validate_on_submit():
@@ -230,6 +380,51 @@ def add_route():
     
     return render_template('admin/routes/form.html', title='Add Route')
 
+@admin_bp.route('/import', methods=['GET', 'POST'])
+def bulk_import_view():
+    if 'admin_id' not in session:
+        return redirect(url_for('admin_bp.login'))
+    
+    result = None
+    if request.method == 'POST':
+        files = {}
+        for kind in bulk_import.IMPORT_KINDS:
+            upload = request.files.get(kind)
+            if upload and upload.filename:
+                files[kind] = upload.read()
+        
+        if not files:
+            flash('Please choose at least one CSV file', 'error')
+            return redirect(url_for('admin_bp.bulk_import_view'))
+        
+        dry_run = request.form.get('dry_run') == 'on'
+        result = bulk_import.run_import(files, dry_run=dry_run)
+        summary = ', '.join(f'{count} {kind}' for kind, count in result.imported.items())
+        if result.ok and dry_run:
+            flash('Validation passed. Upload again without "validate only" to import.', 'success')
+        elif result.ok:
+            flash(f'Imported {summary}', 'success')
+        elif result.imported:
+            flash(f'Import stopped partway; already imported: {summary}', 'warning')
+        else:
+            flash(f'{len(result.errors)} problem(s) found, nothing was imported', 'error')
+    
+    return render_template('admin/import/index.html',
+                         result=result,
+                         kinds=bulk_import.IMPORT_KINDS,
+                         columns=bulk_import.COLUMNS)
+
+@admin_bp.route('/import/template/<kind>')
+def bulk_import_template(kind):
+    if 'admin_id' not in session:
+        return redirect(url_for('admin_bp.login'))
+    
+    if kind not in bulk_import.IMPORT_KINDS:
+        return redirect(url_for('admin_bp.bulk_import_view'))
+    
+    return Response('\ufeff' + bulk_import.template_csv(kind), mimetype='text/csv; charset=utf-8',
+                    headers={'Content-Disposition': f'attachment; filename={kind}_template.csv'})
+
 @admin_bp.route('/api/operators')
 def api_operators():
     """API endpoint to get all operators for AJAX requests"""
@@ -284,59 +479,42 @@ def assign_route_operator(route_id):
     flash('Operator assigned successfully!', 'success')
     return redirect(url_for('admin_bp.route_operators', route_id=route_id))
 
+def _trip_page(filters):
+    """Keyset page of trips, latest departure first, with related rows eager-loaded"""
+    query = Trip.query.filter(*trip_filter_conditions(filters))
+    total = cached_count(('trips', tuple(sorted(filters.items()))), query, tags=('trip',))
+    query = query.options(
+        joinedload(Trip.route),
+        joinedload(Trip.operator),
+        joinedload(Trip.bus_type)
+    )
+    return keyset_paginate(
+        query, Trip.departure_time, Trip.id,
+        after=request.args.get('after'),
+        before=request.args.get('before'),
+        per_page=request.args.get('per_page', 20, type=int),
+        total=total
+    )
+
+def _booking_counts(trips):
+    """Number of bookings per trip id for one page of trips"""
+    trip_ids = [trip.id for trip in trips]
+    if not trip_ids:
+        return {}
+    rows = db.session.query(Booking.trip_id, func.count(Booking.id)) \
+        .filter(Booking.trip_id.in_(trip_ids)) \
+        .group_by(Booking.trip_id).all()
+    return dict(rows)
+
 @admin_bp.route('/trips')
 def trips():
     if 'admin_id' not in session:
         return redirect(url_for('admin_bp.login'))
     
     # Get filter parameters from request
-    filters = {
-        'status': request.args.get('status', ''),
-        'date_from': request.args.get('date_from', ''),
-        'date_to': request.args.get('date_to', ''),
-        'route_id': request.args.get('route_id', ''),
-        'operator_id': request.args.get('operator_id', '')
-    }
-    
-    # Build query with filters
-    query = Trip.query
-    
-    if filters['status']:
-        query = query.filter(Trip.status == filters['status'])
-    
-    if filters['date_from']:
-        from datetime import datetime
-        date_from = datetime.strptime(filters['date_from'], '%Y-%m-%d').date()
-        query = query.filter(Trip.departure_time >= date_from)
-    
-    if filters['date_to']:
-        from datetime import datetime
-        date_to = datetime.strptime(filters['date_to'], '%Y-%m-%d').date()
-        query = query.filter(Trip.departure_time <= date_to)
-    
-    if filters['route_id']:
-        query = query.filter(Trip.route_id == filters['route_id'])
-    
-    if filters['operator_id']:
-        query = query.filter(Trip.operator_id == filters['operator_id'])
-    
-    # Get page number from request
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 20, type=int)
-    
-    # Apply pagination
-    trips = query.order_by(Trip.departure_time.desc()).paginate(
-        page=page, 
-        per_page=per_page, 
-        error_out=False
-    )
-    
-    # Debug: Check total trips in database
-    total_trips = Trip.query.count()
-    print(f"Total trips in database: {total_trips}")
-    print(f"Trips after filtering: {trips.total}")
-    if trips.items:
-        print(f"Sample trip: {trips.items[0].departure_time}, Route: {trips.items[0].route_id}, Operator: {trips.items[0].operator_id}")
+    filters = parse_trip_filters(request.args)
+    trips = _trip_page(filters)
+    booking_counts = _booking_counts(trips.items)
     
     # Get routes and operators for filter dropdowns
     routes = Route.query.all()
@@ -344,14 +522,180 @@ def trips():
     
     # Create filters_dict for pagination links
     filters_dict = {k: v for k, v in filters.items() if v}
+    if trips.per_page != 20:
+        filters_dict['per_page'] = trips.per_page
     
     return render_template('admin/trips/list.html', 
                          trips=trips, 
+                         booking_counts=booking_counts,
                          filters=filters,
                          filters_dict=filters_dict,
                          routes=routes,
                          operators=operators)
 
+@admin_bp.route('/api/trips')
+def api_trips():
+    if 'admin_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    try:
+        trips = _trip_page(parse_trip_filters(request.args))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    booking_counts = _booking_counts(trips.items)
+    
+    return jsonify(trips.to_dict(lambda trip: {
+        'id': trip.id,
+        'route_id': trip.route_id,
+        'route': trip.route.name,
+        'operator_id': trip.operator_id,
+        'operator': trip.operator.name,
+        'bus_type': trip.bus_type.name if trip.bus_type else None,
+        'virtual_bus_id': trip.virtual_bus_id,
+        'departure_time': trip.departure_time.isoformat(),
+        'arrival_time': trip.arrival_time.isoformat(),
+        'seat_price': trip.seat_price,
+        'available_seats': trip.available_seats,
+        'status': trip.status,
+        'bookings': booking_counts.get(trip.id, 0)
+    }))
+
+def _manifest_response(content, export_format, filename):
+    headers = {}
+    if export_format != 'html':
+        headers['Content-Disposition'] = f'attachment; filename={filename}.{export_format}'
+    return Response(content, mimetype=MANIFEST_MIMETYPES[export_format], headers=headers)
+
+@admin_bp.route('/trips/<int:trip_id>/manifest')
+def trip_manifest(trip_id):
+    if 'admin_id' not in session:
+        return redirect(url_for('admin_bp.login'))
+    
+    trip = Trip.query.get_or_404(trip_id)
+    export_format = request.args.get('format', 'html')
+    if export_format not in MANIFEST_FORMATS:
+        flash(f'Unsupported manifest format: {export_format}', 'error')
+        return redirect(url_for('admin_bp.trips'))
+    
+    title = f"Passenger Manifest - {trip.route.origin} → {trip.route.destination} - {trip.departure_time.strftime('%d/%m/%Y %H:%M')}"
+    manifest = build_manifest([Trip.id == trip.id])
+    return _manifest_response(render_manifest(manifest, export_format, title), export_format, f'manifest_trip_{trip.id}')
+
+@admin_bp.route('/manifests')
+def manifests():
+    if 'admin_id' not in session:
+        return redirect(url_for('admin_bp.login'))
+    
+    try:
+        day = datetime.strptime(request.args['date'], '%Y-%m-%d').date() if request.args.get('date') \
+            else datetime.now().date() + timedelta(days=1)
+    except ValueError:
+        flash('Invalid date', 'error')
+        return redirect(url_for('admin_bp.manifests'))
+    
+    operator_id = request.args.get('operator_id', type=int)
+    if not operator_id:
+        return render_template('admin/manifests/index.html', day=day, operators=day_overview(day))
+    
+    operator = Operator.query.get_or_404(operator_id)
+    export_format = request.args.get('format', 'html')
+    if export_format not in MANIFEST_FORMATS:
+        flash(f'Unsupported manifest format: {export_format}', 'error')
+        return redirect(url_for('admin_bp.manifests', date=day.isoformat()))
+    
+    content = get_day_manifest(operator, day, export_format)
+    return _manifest_response(content, export_format, f'manifest_{operator.code}_{day.isoformat()}')
+
+@admin_bp.route('/archive', methods=['GET', 'POST'])
+def data_archive():
+    if 'admin_id' not in session:
+        return redirect(url_for('admin_bp.login'))
+    
+    if request.method == 'POST':
+        dry_run = bool(request.form.get('dry_run'))
+        try:
+            summary = archive.archive_old_data(days=request.form.get('days', type=int), dry_run=dry_run)
+        except Exception as e:
+            flash(f'Error archiving data: {str(e)}', 'error')
+            return redirect(url_for('admin_bp.data_archive'))
+        
+        trips = sum(counts['trips'] for counts in summary['months'].values())
+        bookings = sum(counts['bookings'] for counts in summary['months'].values())
+        action = 'Would archive' if dry_run else 'Archived'
+        flash(f"{action} {trips} trip(s) and {bookings} booking(s) that departed before {summary['cutoff']:%d/%m/%Y}", 'success')
+        return redirect(url_for('admin_bp.data_archive'))
+    
+    # Look up archived bookings by reference, phone or email
+    search = request.args.get('search', '').strip()
+    results = []
+    if search:
+        booking = archive.find_archived_booking(reference=search)
+        results = [booking] if booking else archive.archived_bookings_for_customers(archive.matching_customer_ids(search))
+    
+    return render_template('admin/archive/index.html',
+                         archives=archive.archive_stats(),
+                         after_days=current_app.config.get('ARCHIVE_AFTER_DAYS', archive.DEFAULT_ARCHIVE_AFTER_DAYS),
+                         search=search,
+                         results=results)
+
+@admin_bp.route('/audit')
+def audit_log():
+    if 'admin_id' not in session:
+        return redirect(url_for('admin_bp.login'))
+    
+    # Show entries still waiting in this worker's buffer too
+    audit.flush()
+    
+    filters = {key: request.args.get(key, '').strip()
+               for key in ['actor', 'action', 'entity_type', 'entity_id', 'date_from', 'date_to']}
+    query = AuditLog.query
+    for key in ['actor', 'action', 'entity_type', 'entity_id']:
+        if filters[key]:
+            query = query.filter(getattr(AuditLog, key) == filters[key])
+    try:
+        if filters['date_from']:
+            query = query.filter(AuditLog.created_at >= datetime.strptime(filters['date_from'], '%Y-%m-%d'))
+        if filters['date_to']:
+            query = query.filter(AuditLog.created_at < datetime.strptime(filters['date_to'], '%Y-%m-%d') + timedelta(days=1))
+    except ValueError:
+        flash('Invalid date', 'error')
+        return redirect(url_for('admin_bp.audit_log'))
+    
+    entries = keyset_paginate(
+        query, AuditLog.created_at, AuditLog.id,
+        after=request.args.get('after'),
+        before=request.args.get('before'),
+        per_page=request.args.get('per_page', 50, type=int)
+    )
+    actions = [action for action, in db.session.query(AuditLog.action).distinct().order_by(AuditLog.action)]
+    actors = [actor for actor, in db.session.query(AuditLog.actor).distinct().order_by(AuditLog.actor)]
+    
+    return render_template('admin/audit/index.html',
+                         entries=entries,
+                         filters=filters,
+                         actions=actions,
+                         actors=actors)
+
+@admin_bp.route('/profiler', methods=['GET', 'POST'])
+def profiler_view():
+    if 'admin_id' not in session:
+        return redirect(url_for('admin_bp.login'))
+    
+    if request.method == 'POST':
+        profiler.reset()
+        flash('Profiler data cleared', 'success')
+        return redirect(url_for('admin_bp.profiler_view'))
+    
+    slow_queries = profiler.slowest_queries()
+    for query in slow_queries[:10]:
+        query['plan'] = profiler.explain(query)
+    
+    return render_template('admin/profiler/index.html',
+                         endpoints=profiler.endpoint_stats(),
+                         slow_queries=slow_queries,
+                         enabled=current_app.config.get('PROFILER_ENABLED', False),
+                         slow_query_ms=current_app.config.get('PROFILER_SLOW_QUERY_MS', profiler.DEFAULT_SLOW_QUERY_MS))
+
 @admin_bp.route('/trips/generate', methods=['GET', 'POST'])
 def generate_trips():
     if 'admin_id' not in session:
@@ -422,6 +766,7 @@ def generate_trips():
                 operator_id=operator_id
             ).first()
             
+            previous_prices = None
             if not route_assignment:
                 # Create new route assignment with pricing
                 route_assignment = RouteOperatorAssignment(
@@ -434,6 +779,8 @@ def generate_trips():
                 db.session.add(route_assignment)
             else:
                 # Update existing assignment with new pricing
+                previous_prices = {'regular_seat_price': route_assignment.regular_seat_price,
+                                   'vip_seat_price': route_assignment.vip_seat_price}
                 route_assignment.regular_seat_price = float(regular_seat_price)
                 route_assignment.vip_seat_price = float(vip_seat_price)
                 route_assignment.trips_per_day = trips_per_day
@@ -442,11 +789,7 @@ def generate_trips():
             regular_bus_type = BusType.query.filter(BusType.category.ilike('regular')).first()
             vip_bus_type = BusType.query.filter(BusType.category.ilike('vip')).first()
             
-            # Debug: Check what bus types exist
-            all_bus_types = BusType.query.all()
-            print(f"Available bus types: {[(bt.name, bt.category) for bt in all_bus_types]}")
-            print(f"Regular bus type found: {regular_bus_type}")
-            print(f"VIP bus type found: {vip_bus_type}")
+            logger.debug('Generating trips with bus types regular=%s vip=%s', regular_bus_type, vip_bus_type)
             
             # Fallback: if specific categories not found, use any available bus types
             if not regular_bus_type:
@@ -502,7 +845,7 @@ def generate_trips():
                     departure_times.append(f"{hours:02d}:{minutes:02d}")
                     current_minutes += interval_minutes
                     
-                print(f"Generated {len(departure_times)} trips using {interval_minutes} minute intervals: {departure_times}")
+                logger.debug('%d departure times using %d minute intervals: %s', len(departure_times), interval_minutes, departure_times)
                 
             else:
                 # Use count-based generation (original logic)
@@ -522,7 +865,7 @@ def generate_trips():
                         minutes = int(trip_minutes % 60)
                         departure_times.append(f"{hours:02d}:{minutes:02d}")
                         
-                print(f"Generated {len(departure_times)} trips using count mode ({trips_per_day} per day): {departure_times}")
+                logger.debug('%d departure times using count mode (%d per day): %s', len(departure_times), trips_per_day, departure_times)
             
             if not departure_times:
                 flash('No departure times specified', 'error')
@@ -582,12 +925,9 @@ def generate_trips():
             
             # Generate bidirectional trips if requested
             if bidirectional:
-                print("Generating bidirectional trips...")
-                
                 # Get or create reverse route
                 reverse_route = route.get_reverse_route()
-                print(f"Original route: {route.origin} → {route.destination}")
-                print(f"Reverse route: {reverse_route.origin} → {reverse_route.destination}")
+                logger.debug('Generating return trips on %s → %s', reverse_route.origin, reverse_route.destination)
                 
                 # Create or update RouteOperatorAssignment for reverse route
                 reverse_route_assignment = RouteOperatorAssignment.query.filter_by(
@@ -638,7 +978,6 @@ def generate_trips():
                                 
                                 db.session.add(regular_return_trip)
                                 trips_created += 1
-                                print(f"Created Regular return trip: {departure_datetime} on route {reverse_route.name}")
                                 
                                 # Create VIP return trip (on reverse route)
                                 vip_return_trip = Trip(
@@ -655,29 +994,32 @@ def generate_trips():
                                 
                                 db.session.add(vip_return_trip)
                                 trips_created += 1
-                                print(f"Created VIP return trip: {departure_datetime} on route {reverse_route.name}")
                                 
                             except ValueError:
                                 continue
                     
                     current_date += timedelta(days=1)
-                
-                print(f"Bidirectional generation complete. Created trips on both {route.name} and {reverse_route.name}")
             
             # Commit all trips to database
             db.session.commit()
             
-            # Debug: Verify trips were saved
-            total_trips_after = Trip.query.count()
-            recent_trips = Trip.query.order_by(Trip.created_at.desc()).limit(5).all()
-            print(f"Total trips after creation: {total_trips_after}")
-            print(f"Recent trips created: {[(t.departure_time, t.route_id, t.operator_id, t.bus_type_id) for t in recent_trips]}")
+            new_prices = {'regular_seat_price': route_assignment.regular_seat_price,
+                          'vip_seat_price': route_assignment.vip_seat_price}
+            if new_prices != previous_prices:
+                audit.record('pricing.update', 'route_assignment', route_assignment.id,
+                             route_id=route_assignment.route_id, operator_id=route_assignment.operator_id,
+                             old=previous_prices, new=new_prices)
+            audit.record('trips.generate', 'route', route_id, operator_id=operator_id, trips_created=trips_created,
+                         start_date=start_date, end_date=end_date, bidirectional=bidirectional)
+            
+            logger.info('Generated %d trips for route %s, operator %s (%s to %s)',
+                        trips_created, route_id, operator_id, start_date, end_date)
             
             flash(f'Successfully generated {trips_created} trips!', 'success')
             return redirect(url_for('admin_bp.trips'))
             
         except Exception as e:
-            print(f"Error generating trips: {str(e)}")
+            logger.exception('Error generating trips')
             flash(f'Error generating trips: {str(e)}', 'error')
             routes = Route.query.all()
             operators = Operator.query.all()
@@ -849,6 +1191,7 @@ def contact_settings():
                 with open(env_path, 'w') as f:
                     for key, value in env_vars.items():
                         f.write(f'{key}={value}\n')
+                invalidate('contact_settings')
                 
                 flash('Contact settings saved successfully!', 'success')
                 
@@ -888,27 +1231,12 @@ def bulk_delete_trips():
             flash('No trips selected for deletion', 'error')
             return redirect(url_for('admin_bp.trips'))
         
-        deleted_count = 0
-        skipped_count = 0
+        result = trip_operations.bulk_delete(trip_filter_conditions({}, trip_ids))
         
-        for trip_id in trip_ids:
-            trip = Trip.query.get(trip_id)
-            if trip:
-                # Check if trip has bookings
-                if trip.bookings:
-                    skipped_count += 1
-                    continue
-                
-                # Delete trip if no bookings
-                db.session.delete(trip)
-                deleted_count += 1
-        
-        db.session.commit()
-        
-        if deleted_count > 0:
-            flash(f'Successfully deleted {deleted_count} trips', 'success')
-        if skipped_count > 0:
-            flash(f'{skipped_count} trips were skipped (have bookings)', 'warning')
+        if result['affected'] > 0:
+            flash(f"Successfully deleted {result['affected']} trips", 'success')
+        if result['skipped'] > 0:
+            flash(f"{result['skipped']} trips were skipped (have bookings)", 'warning')
             
     except Exception as e:
         db.session.rollback()
@@ -916,6 +1244,58 @@ def bulk_delete_trips():
     
     return redirect(url_for('admin_bp.trips'))
 
+@admin_bp.route('/trips/bulk-action', methods=['POST'])
+def bulk_trip_action():
+    """Apply delete/cancel/status/reschedule to selected trips or to every trip matching the filters"""
+    if 'admin_id' not in session:
+        return redirect(url_for('admin_bp.login'))
+    
+    action = request.form.get('action')
+    filters = parse_trip_filters(request.form)
+    trip_ids = request.form.getlist('trip_ids')
+    filters_dict = {k: v for k, v in filters.items() if v}
+    
+    if action not in trip_operations.BULK_ACTIONS:
+        flash('Invalid bulk action', 'error')
+        return redirect(url_for('admin_bp.trips', **filters_dict))
+    
+    # Never run a bulk statement over the whole trip table by accident
+    if not trip_ids and not filters_dict:
+        flash('Select trips or apply at least one filter before running a bulk action', 'error')
+        return redirect(url_for('admin_bp.trips'))
+    
+    try:
+        conditions = trip_filter_conditions(filters, trip_ids)
+        
+        if action == 'delete':
+            result = trip_operations.bulk_delete(conditions)
+            flash(f"Deleted {result['affected']} of {result['matched']} trips", 'success')
+            if result['skipped']:
+                flash(f"{result['skipped']} trips were skipped (have bookings)", 'warning')
+        elif action == 'cancel':
+            result = trip_operations.bulk_cancel(conditions)
+            flash(f"Cancelled {result['affected']} of {result['matched']} trips", 'success')
+        elif action == 'status':
+            result = trip_operations.bulk_set_status(conditions, request.form.get('new_status', ''))
+            flash(f"Updated status of {result['affected']} of {result['matched']} trips", 'success')
+        elif action == 'reschedule':
+            result = trip_operations.bulk_reschedule(
+                conditions,
+                request.form.get('shift_minutes', 0, type=int),
+                include_booked=request.form.get('include_booked') == 'on'
+            )
+            flash(f"Rescheduled {result['affected']} of {result['matched']} scheduled trips", 'success')
+            if result['skipped']:
+                flash(f"{result['skipped']} trips were skipped (have bookings)", 'warning')
+    except ValueError as e:
+        db.session.rollback()
+        flash(str(e), 'error')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error running bulk action: {str(e)}', 'error')
+    
+    return redirect(url_for('admin_bp.trips', **filters_dict))
+
 @admin_bp.route('/trips/<int:id>/cancel', methods=['POST'])
 def cancel_trip(id):
     if 'admin_id' not in session:
@@ -981,7 +1361,9 @@ def booking_details(id):
     if 'admin_id' not in session:
         return redirect(url_for('admin_bp.login'))
     
-    booking = Booking.query.get_or_404(id)
+    booking = Booking.query.get(id) or archive.find_archived_booking(booking_id=id)
+    if booking is None:
+        abort(404)
     return render_template('admin/bookings/details.html', booking=booking)
 
 @admin_bp.route('/bookings/<int:id>/cancel', methods=['POST'])
@@ -990,8 +1372,11 @@ def cancel_booking(id):
         return redirect(url_for('admin_bp.login'))
     
     booking = Booking.query.get_or_404(id)
+    previous_status = booking.status
     booking.status = 'cancelled'
     db.session.commit()
+    audit.record('booking.cancel', 'booking', booking.id, reference=booking.booking_reference,
+                 previous_status=previous_status)
     
     flash('Booking cancelled successfully', 'success')
     return redirect(url_for('admin_bp.bookings'))
@@ -1002,9 +1387,12 @@ def confirm_booking_payment(id):
         return redirect(url_for('admin_bp.login'))
     
     booking = Booking.query.get_or_404(id)
+    previous = {'status': booking.status, 'payment_status': booking.payment_status}
     booking.payment_status = 'paid'
     booking.status = 'confirmed'
     db.session.commit()
+    audit.record('booking.confirm_payment', 'booking', booking.id, reference=booking.booking_reference,
+                 amount=booking.total_amount, previous=previous)
     
     flash('Payment confirmed successfully', 'success')
     return redirect(url_for('admin_bp.bookings'))
@@ -1325,8 +1713,10 @@ def delete_operator(id):
         flash('Cannot delete operator with existing trips!', 'error')
         return redirect(url_for('admin_bp.operators'))
     
+    operator_details = {'name': operator.name, 'code': operator.code}
     db.session.delete(operator)
     db.session.commit()
+    audit.record('operator.delete', 'operator', id, **operator_details)
     flash('Operator deleted successfully!', 'success')
     return redirect(url_for('admin_bp.operators'))
 
@@ -1365,6 +1755,7 @@ def clear_database():
         operator_locations_count = OperatorLocation.query.count()
         operator_bus_types_count = OperatorBusType.query.count()
         route_assignments_count = RouteOperatorAssignment.query.count()
+        daily_stats_count = DailyRouteStats.query.count()
         
         # Delete all data in correct order (respecting foreign key constraints)
         # 1. Delete seat blocks first (no foreign key dependencies)
@@ -1388,10 +1779,14 @@ def clear_database():
         # 7. Delete customers (no dependencies)
         Customer.query.delete()
         
-        # 8. Delete routes (no dependencies after assignments are deleted)
+        # 8. Delete analytics rollups (depend on routes and operators; bulk deletes
+        #    don't go through the rollup flush hook, so they must be cleared here)
+        DailyRouteStats.query.delete()
+        
+        # 9. Delete routes (no dependencies after assignments are deleted)
         Route.query.delete()
         
-        # 9. Delete operators (no dependencies after related records are deleted)
+        # 10. Delete operators (no dependencies after related records are deleted)
         Operator.query.delete()
         
         # Note: We don't delete BusType as they are system-level configurations
@@ -1403,18 +1798,22 @@ def clear_database():
         total_deleted = (operators_count + routes_count + trips_count + 
                         bookings_count + customers_count + seat_blocks_count +
                         operator_locations_count + operator_bus_types_count + 
-                        route_assignments_count)
+                        route_assignments_count + daily_stats_count)
+        
+        audit.record('database.clear', 'database', None, total_deleted=total_deleted,
+                     operators=operators_count, routes=routes_count, trips=trips_count,
+                     bookings=bookings_count, customers=customers_count)
         
         flash(f'Database cleared successfully! Deleted {total_deleted} records: '
               f'{operators_count} operators, {routes_count} routes, {trips_count} trips, '
               f'{bookings_count} bookings, {customers_count} customers, and related data.', 'success')
         
-        print(f"Database cleared by admin. Deleted {total_deleted} records.")
+        logger.warning('Database cleared by admin. Deleted %d records.', total_deleted)
         
     except Exception as e:
         # Rollback in case of error
         db.session.rollback()
         flash(f'Error clearing database: {str(e)}', 'error')
-        print(f"Error clearing database: {str(e)}")
+        logger.exception('Error clearing database')
     
     return redirect(url_for('admin_bp.dashboard'))
@@ -0,0 +1,344 @@
+"""Daily revenue and occupancy rollups.
+
+DailyRouteStats keeps one row per (departure date, route, operator, bus
+category). The rows are maintained from a SQLAlchemy ``after_flush`` hook:
+
+* booking inserts/updates/deletes apply a delta (seats sold, revenue,
+  confirmed and cancelled counts) with a single upsert per affected key;
+* new trips add their capacity to ``seats_offered``;
+* edited or deleted trips (rare, admin-only) trigger a recompute of the
+  affected departure dates.
+
+Because every change goes through the same hook, the payment, webhook and
+admin code paths don't need to know about the rollups at all.
+"""
+from collections import defaultdict
+from types import SimpleNamespace
+from datetime import datetime, date, time, timedelta
+
+from sqlalchemy import event, select, delete, func, inspect
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects import sqlite as sqlite_dialect, postgresql as postgresql_dialect
+
+from models import db, Trip, Booking, BusType, Route, Operator, DailyRouteStats, parse_seat_numbers
+
+COUNTER_COLUMNS = ['trips', 'seats_offered', 'seats_sold', 'revenue', 'bookings_confirmed', 'bookings_cancelled']
+KEY_COLUMNS = ['stat_date', 'route_id', 'operator_id', 'bus_category']
+
+# Trip attributes that move a trip (and its bookings) between rollup rows
+TRIP_TRACKED_ATTRIBUTES = ['departure_time', 'status', 'route_id', 'operator_id', 'bus_type_id']
+BOOKING_TRACKED_ATTRIBUTES = ['status', 'trip_id', 'seat_numbers', 'total_amount']
+
+GROUP_BY_OPTIONS = ['route', 'operator', 'bus_category', 'day']
+
+def _normalize_category(category):
+    return (category or 'regular').lower()
+
+def _counter_values(counters):
+    """Counter columns for an insert, with integer columns cast back from float sums"""
+    return {
+        column: float(counters.get(column, 0)) if column == 'revenue' else int(counters.get(column, 0))
+        for column in COUNTER_COLUMNS
+    }
+
+def _booking_contribution(status, seat_numbers, total_amount):
+    """Counters a booking in the given state adds to its trip's rollup row"""
+    if status == 'confirmed':
+        return {
+            'seats_sold': len(parse_seat_numbers(seat_numbers)),
+            'revenue': float(total_amount or 0),
+            'bookings_confirmed': 1,
+        }
+    if status == 'cancelled':
+        return {'bookings_cancelled': 1}
+    return {}
+
+def _attribute_values(obj, attributes, previous=False):
+    """Current or pre-flush values of the given attributes"""
+    state = inspect(obj)
+    values = {}
+    for attr in attributes:
+        history = state.attrs[attr].history
+        if previous and history.deleted:
+            values[attr] = history.deleted[0]
+        elif not previous and history.added:
+            values[attr] = history.added[0]
+        else:
+            values[attr] = getattr(obj, attr)
+    return values
+
+def _has_changes(obj, attributes):
+    state = inspect(obj)
+    return any(state.attrs[attr].history.has_changes() for attr in attributes)
+
+def _load_trip_keys(connection, trip_ids):
+    """Map trip id -> (stat_date, route_id, operator_id, bus_category, capacity, status)"""
+    if not trip_ids:
+        return {}
+    query = select(
+        Trip.id, Trip.departure_time, Trip.route_id, Trip.operator_id,
+        BusType.category, BusType.capacity, Trip.status
+    ).outerjoin(BusType, Trip.bus_type_id == BusType.id).where(Trip.id.in_(trip_ids))
+
+    trip_keys = {}
+    for row in connection.execute(query):
+        trip_keys[row.id] = (
+            row.departure_time.date(), row.route_id, row.operator_id,
+            _normalize_category(row.category), row.capacity or 0, row.status
+        )
+    return trip_keys
+
+def _insert_for(connection):
+    """Dialect-specific INSERT supporting ON CONFLICT upserts, or None"""
+    if connection.dialect.name == 'sqlite':
+        return sqlite_dialect.insert
+    if connection.dialect.name == 'postgresql':
+        return postgresql_dialect.insert
+    return None
+
+def apply_deltas(connection, deltas):
+    """Add counter deltas to rollup rows, creating rows as needed.
+
+    Returns the dates that could not be updated in place (dialects without
+    upsert support) so the caller can recompute them instead.
+    """
+    table = DailyRouteStats.__table__
+    insert = _insert_for(connection)
+    if insert is None:
+        return {key[0] for key in deltas}
+
+    for key, counters in deltas.items():
+        if not any(counters.values()):
+            continue
+        values = dict(zip(KEY_COLUMNS, key), **_counter_values(counters))
+        stmt = insert(table).values(**values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=KEY_COLUMNS,
+            set_={column: table.c[column] + stmt.excluded[column] for column in COUNTER_COLUMNS}
+        )
+        connection.execute(stmt)
+    return set()
+
+def recompute_dates(connection, dates):
+    """Rebuild the rollup rows of the given departure dates from trip/booking"""
+    table = DailyRouteStats.__table__
+
+    for stat_date in sorted(dates):
+        start = datetime.combine(stat_date, time.min)
+        end = start + timedelta(days=1)
+        rows = defaultdict(lambda: defaultdict(float))
+
+        trip_query = select(
+            Trip.route_id, Trip.operator_id, BusType.category,
+            func.count(Trip.id), func.coalesce(func.sum(BusType.capacity), 0)
+        ).outerjoin(BusType, Trip.bus_type_id == BusType.id).where(
+            Trip.departure_time >= start,
+            Trip.departure_time < end,
+            Trip.status != 'cancelled'
+        ).group_by(Trip.route_id, Trip.operator_id, BusType.category)
+
+        for route_id, operator_id, category, trip_count, capacity in connection.execute(trip_query):
+            key = (stat_date, route_id, operator_id, _normalize_category(category))
+            rows[key]['trips'] += trip_count
+            rows[key]['seats_offered'] += capacity
+
+        # Seat counts live in a free-form text column, so bookings are summed here
+        booking_query = select(
+            Trip.route_id, Trip.operator_id, BusType.category,
+            Booking.status, Booking.seat_numbers, Booking.total_amount
+        ).join(Trip, Booking.trip_id == Trip.id).outerjoin(BusType, Trip.bus_type_id == BusType.id).where(
+            Trip.departure_time >= start,
+            Trip.departure_time < end,
+            Booking.status.in_(['confirmed', 'cancelled'])
+        )
+
+        for route_id, operator_id, category, status, seat_numbers, total_amount in connection.execute(booking_query):
+            key = (stat_date, route_id, operator_id, _normalize_category(category))
+            for column, value in _booking_contribution(status, seat_numbers, total_amount).items():
+                rows[key][column] += value
+
+        connection.execute(delete(table).where(table.c.stat_date == stat_date))
+        if rows:
+            connection.execute(table.insert(), [
+                dict(zip(KEY_COLUMNS, key), **_counter_values(counters))
+                for key, counters in rows.items()
+            ])
+
+def _after_flush(session, flush_context):
+    """Translate flushed Trip/Booking changes into rollup updates"""
+    trip_changes = []
+    booking_changes = []  # (sign, values)
+    dirty_dates = set()
+
+    for obj in session.new:
+        if isinstance(obj, Trip):
+            trip_changes.append(obj.id)
+        elif isinstance(obj, Booking):
+            booking_changes.append((1, _attribute_values(obj, BOOKING_TRACKED_ATTRIBUTES)))
+
+    for obj in session.dirty:
+        if isinstance(obj, Booking) and _has_changes(obj, BOOKING_TRACKED_ATTRIBUTES):
+            booking_changes.append((-1, _attribute_values(obj, BOOKING_TRACKED_ATTRIBUTES, previous=True)))
+            booking_changes.append((1, _attribute_values(obj, BOOKING_TRACKED_ATTRIBUTES)))
+        elif isinstance(obj, Trip) and _has_changes(obj, TRIP_TRACKED_ATTRIBUTES):
+            previous = _attribute_values(obj, ['departure_time'], previous=True)['departure_time']
+            dirty_dates.update(d.date() for d in (previous, obj.departure_time) if d)
+
+    for obj in session.deleted:
+        if isinstance(obj, Booking):
+            booking_changes.append((-1, _attribute_values(obj, BOOKING_TRACKED_ATTRIBUTES, previous=True)))
+        elif isinstance(obj, Trip):
+            previous = _attribute_values(obj, ['departure_time'], previous=True)['departure_time']
+            if previous:
+                dirty_dates.add(previous.date())
+
+    if not trip_changes and not booking_changes and not dirty_dates:
+        return
+
+    connection = session.connection()
+    trip_ids = set(trip_changes) | {values['trip_id'] for _, values in booking_changes if values['trip_id']}
+    trip_keys = _load_trip_keys(connection, trip_ids)
+    deltas = defaultdict(lambda: defaultdict(float))
+
+    for trip_id in trip_changes:
+        trip_key = trip_keys.get(trip_id)
+        if trip_key and trip_key[5] != 'cancelled':
+            deltas[trip_key[:4]]['trips'] += 1
+            deltas[trip_key[:4]]['seats_offered'] += trip_key[4]
+
+    for sign, values in booking_changes:
+        trip_key = trip_keys.get(values['trip_id'])
+        if not trip_key:
+            continue
+        for column, value in _booking_contribution(values['status'], values['seat_numbers'], values['total_amount']).items():
+            deltas[trip_key[:4]][column] += sign * value
+
+    # Dates being recomputed from scratch don't need their deltas applied
+    deltas = {key: counters for key, counters in deltas.items() if key[0] not in dirty_dates}
+    dirty_dates |= apply_deltas(connection, deltas)
+    if dirty_dates:
+        recompute_dates(connection, dirty_dates)
+
+def _load_previous_value(target, value, oldvalue, initiator):
+    return value
+
+def register_rollup_listeners():
+    """Keep DailyRouteStats in sync with every flush of db.session"""
+    if event.contains(Session, 'after_flush', _after_flush):
+        return
+    event.listen(Session, 'after_flush', _after_flush)
+
+    # Expired attributes are normally overwritten without loading the old
+    # value; active_history makes it available to the flush hook.
+    for model, attributes in ((Booking, BOOKING_TRACKED_ATTRIBUTES), (Trip, TRIP_TRACKED_ATTRIBUTES)):
+        for attr in attributes:
+            event.listen(getattr(model, attr), 'set', _load_previous_value, active_history=True, retval=True)
+
+def rebuild_daily_stats(start_date=None, end_date=None):
+    """Recompute rollups for a date range (defaults to every date with trips)"""
+    if start_date is None or end_date is None:
+        first, last = db.session.query(func.min(Trip.departure_time), func.max(Trip.departure_time)).one()
+        if not first:
+            return 0
+        start_date = start_date or first.date()
+        end_date = end_date or last.date()
+
+    dates = []
+    current = start_date
+    while current <= end_date:
+        dates.append(current)
+        current += timedelta(days=1)
+
+    recompute_dates(db.session.connection(), dates)
+    db.session.commit()
+    return len(dates)
+
+def _group_columns(group_by):
+    if group_by == 'operator':
+        return [DailyRouteStats.operator_id, Operator.name]
+    if group_by == 'bus_category':
+        return [DailyRouteStats.bus_category]
+    if group_by == 'day':
+        return [DailyRouteStats.stat_date]
+    return [DailyRouteStats.route_id, Route.origin, Route.destination]
+
+def _serialize(row, extra):
+    seats_offered = int(row.seats_offered or 0)
+    seats_sold = int(row.seats_sold or 0)
+    result = dict(extra)
+    result.update({
+        'trips': int(row.trips or 0),
+        'seats_offered': seats_offered,
+        'seats_sold': seats_sold,
+        'revenue': float(row.revenue or 0),
+        'bookings_confirmed': int(row.bookings_confirmed or 0),
+        'bookings_cancelled': int(row.bookings_cancelled or 0),
+        'load_factor': round(seats_sold / seats_offered, 4) if seats_offered else 0.0,
+    })
+    return result
+
+def get_stats(start_date, end_date, group_by='route', route_id=None, operator_id=None, bus_category=None):
+    """Aggregate rollup rows between two dates (inclusive).
+
+    Only DailyRouteStats is read, so the cost depends on the number of days
+    and routes in the range, not on how many bookings they contain.
+    """
+    if group_by not in GROUP_BY_OPTIONS:
+        group_by = 'route'
+
+    group_columns = _group_columns(group_by)
+    sums = [func.sum(getattr(DailyRouteStats, column)).label(column) for column in COUNTER_COLUMNS]
+
+    query = db.session.query(*group_columns, *sums).filter(
+        DailyRouteStats.stat_date >= start_date,
+        DailyRouteStats.stat_date <= end_date
+    )
+    if group_by == 'route':
+        query = query.join(Route, Route.id == DailyRouteStats.route_id)
+    elif group_by == 'operator':
+        query = query.join(Operator, Operator.id == DailyRouteStats.operator_id)
+
+    if route_id:
+        query = query.filter(DailyRouteStats.route_id == route_id)
+    if operator_id:
+        query = query.filter(DailyRouteStats.operator_id == operator_id)
+    if bus_category:
+        query = query.filter(DailyRouteStats.bus_category == bus_category.lower())
+
+    rows = []
+    for row in query.group_by(*group_columns).all():
+        if group_by == 'route':
+            extra = {'route_id': row.route_id, 'label': f"{row.origin} → {row.destination}"}
+        elif group_by == 'operator':
+            extra = {'operator_id': row.operator_id, 'label': row.name}
+        elif group_by == 'bus_category':
+            extra = {'bus_category': row.bus_category, 'label': row.bus_category.upper()}
+        else:
+            extra = {'date': row.stat_date.isoformat(), 'label': row.stat_date.strftime('%d/%m/%Y')}
+        rows.append(_serialize(row, extra))
+
+    if group_by == 'day':
+        rows.sort(key=lambda r: r['date'])
+    else:
+        rows.sort(key=lambda r: r['revenue'], reverse=True)
+
+    totals = _serialize(
+        SimpleNamespace(**{column: sum(r[column] for r in rows) for column in COUNTER_COLUMNS}),
+        {'label': 'Total'}
+    )
+    return {'group_by': group_by, 'rows': rows, 'totals': totals}
+
+def parse_date_range(date_from, date_to, default_days=30):
+    """Parse YYYY-MM-DD strings, defaulting to the last `default_days` days"""
+    today = date.today()
+    try:
+        end_date = datetime.strptime(date_to, '%Y-%m-%d').date() if date_to else today
+    except ValueError:
+        end_date = today
+    try:
+        start_date = datetime.strptime(date_from, '%Y-%m-%d').date() if date_from else end_date - timedelta(days=default_days - 1)
+    except ValueError:
+        start_date = end_date - timedelta(days=default_days - 1)
+    if start_date > end_date:
+        start_date, end_date = end_date, start_date
+    return start_date, end_date
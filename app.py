@@ -1,8 +1,11 @@
-from flask import Flask, render_template, redirect, url_for, flash, request, session
+import time
+_import_started = time.perf_counter()
+
+from flask import Flask, current_app, render_template, redirect, url_for, flash, request, session, jsonify
 from flask_babel import Babel
-from flask_sqlalchemy import SQLAlchemy
 from werkzeug.security import generate_password_hash, check_password_hash
 import os
+import logging
 from datetime import datetime, timedelta
 from functools import wraps
 import pytz
@@ -11,32 +14,11 @@ from dotenv import load_dotenv
 # Load environment variables from .env file
 load_dotenv()
 
-# Initialize Flask app
-app = Flask(__name__)
-app.config['SECRET_KEY'] = os.getenv('FLASK_SECRET_KEY', 'nkolo-pass-secret-key-change-in-production')
-
-# MesomB Payment Configuration
-MESOMB_APPLICATION_KEY = os.getenv('MESOMB_APPLICATION_KEY')
-MESOMB_ACCESS_KEY = os.getenv('MESOMB_ACCESS_KEY')
-MESOMB_SECRET_KEY = os.getenv('MESOMB_SECRET_KEY')
-MESOMB_BASE_URL = os.getenv('MESOMB_BASE_URL', 'https://mesomb.hachther.com')
-
-app.config['MESOMB_APPLICATION_KEY'] = MESOMB_APPLICATION_KEY
-app.config['MESOMB_ACCESS_KEY'] = MESOMB_ACCESS_KEY
-app.config['MESOMB_SECRET_KEY'] = MESOMB_SECRET_KEY
-app.config['MESOMB_BASE_URL'] = MESOMB_BASE_URL
-
-app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///nkolo_pass.db')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['UPLOAD_FOLDER'] = 'static/uploads'
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
-
-# Timezone Configuration - Set to Cameroon timezone
-app.config['TIMEZONE'] = 'Africa/Douala'  # Cameroon timezone (WAT)
+logger = logging.getLogger(__name__)
 
 def get_cameroon_time():
     """Get current time in Cameroon timezone"""
-    cameroon_tz = pytz.timezone(app.config['TIMEZONE'])
+    cameroon_tz = pytz.timezone(current_app.config['TIMEZONE'])
     return datetime.now(cameroon_tz)
 
 def get_cameroon_time_utc():
@@ -44,69 +26,12 @@ def get_cameroon_time_utc():
     cameroon_time = get_cameroon_time()
     return cameroon_time.astimezone(pytz.UTC).replace(tzinfo=None)
 
-# i18n / Localization (URL-based)
-app.config['LANGUAGES'] = ['en', 'fr']
-app.config['BABEL_DEFAULT_LOCALE'] = 'fr'
-
-# Ensure upload directory exists (with error handling for production)
-try:
-    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-    os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'logos'), exist_ok=True)
-except (OSError, PermissionError) as e:
-    print(f"Warning: Could not create upload directories: {e}")
-    # In production, directories might already exist or be read-only
-    pass
-
-# Initialize database
-from models import db
-
-db.init_app(app)
-
-# Import models and routes
-from models import *
-from admin_routes import admin_bp
-from user_routes import user_bp
-
-# Register blueprints
-app.register_blueprint(admin_bp, url_prefix='/admin')
-app.register_blueprint(user_bp)
-
-# Initialize database tables
-with app.app_context():
-    db.create_all()
-    
-    # Create default bus types if not exist
-    if not BusType.query.first():
-        vip_type = BusType(
-            name='VIP',
-            description='Premium bus with enhanced comfort and amenities',
-            base_price_multiplier=1.5
-        )
-        vip_type.set_amenities(['Air Conditioning', 'WiFi', 'Reclining Seats', 'Entertainment System', 'Refreshments'])
-        
-        regular_type = BusType(
-            name='Regular',
-            description='Standard bus service with basic amenities',
-            base_price_multiplier=1.0
-        )
-        regular_type.set_amenities(['Air Conditioning', 'Comfortable Seats'])
-        
-        db.session.add(vip_type)
-        db.session.add(regular_type)
-        db.session.commit()
-        print("Default bus types created")
-    
-    print("Database initialized successfully!")
-
 def get_locale():
     """Select locale from the first path segment like /en/..., /fr/..."""
     path = request.path.strip('/').split('/')
-    if path and path[0] in app.config.get('LANGUAGES', []):
+    if path and path[0] in current_app.config.get('LANGUAGES', []):
         return path[0]
-    return app.config.get('BABEL_DEFAULT_LOCALE', 'fr')
-
-# Initialize Babel (Flask-Babel v3 style)
-babel = Babel(app, locale_selector=get_locale)
+    return current_app.config.get('BABEL_DEFAULT_LOCALE', 'fr')
 
 # Authentication decorator
 def login_required(f):
@@ -117,22 +42,17 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
-@app.route('/')
 def index():
     # Redirect bare root to default language user homepage
-    default_lang = app.config.get('BABEL_DEFAULT_LOCALE', 'fr')
+    default_lang = current_app.config.get('BABEL_DEFAULT_LOCALE', 'fr')
     return redirect(f'/{default_lang}/')
 
-@app.route('/health')
 def health_check():
     """Health check endpoint for monitoring"""
     return {'status': 'healthy', 'timestamp': datetime.utcnow().isoformat()}
 
-@app.route('/api/contact-settings')
 def contact_settings_api():
     """API endpoint to get contact widget settings"""
-    from flask import jsonify
-    
     # Get contact settings from environment variables
     settings = {
         'phone': os.getenv('SUPPORT_PHONE', ''),
@@ -142,29 +62,29 @@ def contact_settings_api():
         'enabled': os.getenv('CONTACT_WIDGET_ENABLED', 'true').lower() == 'true',
         'position': os.getenv('CONTACT_WIDGET_POSITION', 'bottom-right')
     }
-    
+
     # Only return enabled settings with values
     if not settings['enabled']:
         return jsonify({'enabled': False})
-    
+
     # Filter out empty values
     filtered_settings = {k: v for k, v in settings.items() if v}
-    
+
     return jsonify(filtered_settings)
 
 # Add context processor for global template variables
-@app.context_processor
 def inject_globals():
+    languages = current_app.config['LANGUAGES']
     # current language detected from URL
     path_parts = request.path.strip('/').split('/')
-    current_language = path_parts[0] if path_parts and path_parts[0] in app.config['LANGUAGES'] else app.config.get('BABEL_DEFAULT_LOCALE', 'fr')
+    current_language = path_parts[0] if path_parts and path_parts[0] in languages else current_app.config.get('BABEL_DEFAULT_LOCALE', 'fr')
 
     def switch_language_url(target_lang: str):
         """Return current path with the leading language segment replaced by target_lang"""
         # Preserve query string
         path = request.path
         parts = path.strip('/').split('/')
-        if parts and parts[0] in app.config['LANGUAGES']:
+        if parts and parts[0] in languages:
             parts[0] = target_lang
             new_path = '/' + '/'.join(parts)
         else:
@@ -176,10 +96,209 @@ def inject_globals():
     return {
         'site_name': 'Nkolo Pass',
         'current_year': datetime.now().year,
-        'supported_languages': app.config['LANGUAGES'],
+        'supported_languages': languages,
         'current_language': current_language,
         'switch_language_url': switch_language_url,
     }
 
+def create_app(config=None):
+    """Build the Flask application.
+
+    Does not touch the database: run `flask --app app migrate` and
+    `flask --app app seed` once per deploy (see db_setup.py).
+    """
+    global _import_started
+    # The first call is timed from the import of this module (cold start)
+    started = _import_started or time.perf_counter()
+    _import_started = None
+
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = os.getenv('FLASK_SECRET_KEY', 'nkolo-pass-secret-key-change-in-production')
+
+    # MesomB Payment Configuration
+    app.config['MESOMB_APPLICATION_KEY'] = os.getenv('MESOMB_APPLICATION_KEY')
+    app.config['MESOMB_ACCESS_KEY'] = os.getenv('MESOMB_ACCESS_KEY')
+    app.config['MESOMB_SECRET_KEY'] = os.getenv('MESOMB_SECRET_KEY')
+    app.config['MESOMB_BASE_URL'] = os.getenv('MESOMB_BASE_URL', 'https://mesomb.hachther.com')
+
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///nkolo_pass.db')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # SQLite or PostgreSQL (see db_backend.py); searches can read from a replica
+    app.config['DATABASE_READ_URL'] = os.environ.get('DATABASE_READ_URL')
+    app.config['DB_POOL_SIZE'] = int(os.environ.get('DB_POOL_SIZE', 5))
+    app.config['DB_MAX_OVERFLOW'] = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    app.config['DB_POOL_RECYCLE'] = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    app.config['UPLOAD_FOLDER'] = 'static/uploads'
+    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+
+    # Retention: trips older than this move to instance/archive/archive_YYYY_MM.db
+    app.config['ARCHIVE_AFTER_DAYS'] = int(os.environ.get('ARCHIVE_AFTER_DAYS', 180))
+    app.config['ARCHIVE_BATCH_SIZE'] = int(os.environ.get('ARCHIVE_BATCH_SIZE', 500))
+    app.config['ARCHIVE_DIR'] = os.environ.get('ARCHIVE_DIR')
+
+    # Admin audit log: buffered entries are written in batches by a background thread
+    app.config['AUDIT_FLUSH_INTERVAL'] = float(os.environ.get('AUDIT_FLUSH_INTERVAL', 2.0))
+    app.config['AUDIT_BATCH_SIZE'] = int(os.environ.get('AUDIT_BATCH_SIZE', 200))
+
+    # Logging: JSON lines on stdout via a background queue listener (see logging_setup.py)
+    app.config['LOG_LEVEL'] = os.environ.get('LOG_LEVEL', 'INFO')
+    app.config['LOG_FORMAT'] = os.environ.get('LOG_FORMAT', 'json')
+    app.config['LOG_LEVELS'] = os.environ.get('LOG_LEVELS', '')  # e.g. "user_routes=DEBUG"
+    app.config['LOG_SAMPLE_RATES'] = os.environ.get('LOG_SAMPLE_RATES', '')  # e.g. "user_routes=0.1"
+
+    # Request/SQL profiler (admin > Profiler); in-memory, per worker, off unless enabled
+    app.config['PROFILER_ENABLED'] = os.environ.get('PROFILER_ENABLED', 'false').lower() == 'true'
+    app.config['PROFILER_BUFFER_SIZE'] = int(os.environ.get('PROFILER_BUFFER_SIZE', 1000))
+    app.config['PROFILER_SLOW_QUERY_MS'] = float(os.environ.get('PROFILER_SLOW_QUERY_MS', 50))
+    app.config['PROFILER_N_PLUS_ONE_THRESHOLD'] = int(os.environ.get('PROFILER_N_PLUS_ONE_THRESHOLD', 5))
+
+    app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')  # Bearer token required on /metrics when set
+
+    # Response cache (see cache.py): 'simple' is per worker, 'redis' is shared by all workers
+    app.config['CACHE_TYPE'] = os.environ.get('CACHE_TYPE', 'simple')
+    app.config['CACHE_REDIS_URL'] = os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+    app.config['CACHE_KEY_PREFIX'] = os.environ.get('CACHE_KEY_PREFIX', 'nkolo:')
+    app.config['CACHE_DEFAULT_TIMEOUT'] = int(os.environ.get('CACHE_DEFAULT_TIMEOUT', 300))
+    app.config['CACHE_THRESHOLD'] = int(os.environ.get('CACHE_THRESHOLD', 500))  # max entries per worker for 'simple'
+
+    # Server-side sessions (see sessions.py): 'sqlalchemy', 'cache' (with CACHE_TYPE=redis) or 'cookie'
+    app.config['SESSION_TYPE'] = os.environ.get('SESSION_TYPE', 'sqlalchemy')
+    app.config['SESSION_LIFETIME'] = int(os.environ.get('SESSION_LIFETIME', 86400))  # seconds since last write
+    app.config['SESSION_SWEEP_INTERVAL'] = int(os.environ.get('SESSION_SWEEP_INTERVAL', 600))  # per worker
+
+    # Token-bucket rate limits (see ratelimit.py); memory:// is per worker, redis://... is shared
+    app.config['RATE_LIMIT_ENABLED'] = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+    app.config['API_RATE_LIMIT'] = os.environ.get('API_RATE_LIMIT', '300 per minute')  # per IP, /api/ views without their own limit
+    app.config['API_RATE_LIMIT_STORAGE_URL'] = os.environ.get('API_RATE_LIMIT_STORAGE_URL', 'memory://')
+    app.config['RATE_LIMIT_PROXY_COUNT'] = int(os.environ.get('RATE_LIMIT_PROXY_COUNT', 0))  # proxies appending X-Forwarded-For
+
+    # gzip/brotli for pages, JSON and CSV exports (see compression.py)
+    app.config['COMPRESS_ENABLED'] = os.environ.get('COMPRESS_ENABLED', 'true').lower() == 'true'
+    app.config['COMPRESS_MIN_SIZE'] = int(os.environ.get('COMPRESS_MIN_SIZE', 500))  # bytes
+    app.config['COMPRESS_GZIP_LEVEL'] = int(os.environ.get('COMPRESS_GZIP_LEVEL', 6))
+    app.config['COMPRESS_BR_LEVEL'] = int(os.environ.get('COMPRESS_BR_LEVEL', 5))
+    app.config['COMPRESS_SKIP_ENDPOINTS'] = [e for e in os.environ.get('COMPRESS_SKIP_ENDPOINTS', 'metrics').split(',') if e]
+
+    # Import-to-ready time above this is logged as a warning (bench.py measures it in a fresh process)
+    app.config['STARTUP_BUDGET_MS'] = float(os.environ.get('STARTUP_BUDGET_MS', 1000))
+
+    # Timezone Configuration - Set to Cameroon timezone
+    app.config['TIMEZONE'] = 'Africa/Douala'  # Cameroon timezone (WAT)
+
+    # i18n / Localization (URL-based)
+    app.config['LANGUAGES'] = ['en', 'fr']
+    app.config['BABEL_DEFAULT_LOCALE'] = 'fr'
+
+    if config:
+        app.config.update(config)
+
+    from logging_setup import configure_logging
+    configure_logging(app)
+
+    # Ensure upload directory exists (with error handling for production)
+    try:
+        os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+        os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'logos'), exist_ok=True)
+    except (OSError, PermissionError) as e:
+        logger.warning('Could not create upload directories: %s', e)
+        # In production, directories might already exist or be read-only
+        pass
+
+    # Initialize database
+    from models import db
+    from db_backend import init_db_backend, init_read_engine
+    init_db_backend(app)
+    db.init_app(app)
+    init_read_engine(app)
+
+    # Register blueprints
+    from admin_routes import admin_bp
+    from user_routes import user_bp
+    app.register_blueprint(admin_bp, url_prefix='/admin')
+    app.register_blueprint(user_bp)
+
+    # Per-request timing and SQL query profiling
+    from profiler import init_profiler
+    init_profiler(app)
+
+    # Prometheus metrics at /metrics (set PROMETHEUS_MULTIPROC_DIR under gunicorn)
+    from metrics import init_metrics
+    init_metrics(app)
+
+    # Keep daily analytics rollups in sync with booking/trip writes
+    from analytics import register_rollup_listeners
+    register_rollup_listeners()
+
+    # Shared response cache, invalidated when a commit touches a cached table
+    from cache import init_cache
+    init_cache(app)
+
+    # Booking funnel and admin state on the server; the cookie only carries an id
+    from sessions import init_sessions
+    init_sessions(app)
+
+    # Per deploy: flask --app app migrate && flask --app app seed
+    from db_setup import migrate_command, seed_command
+    app.cli.add_command(migrate_command)
+    app.cli.add_command(seed_command)
+
+    # Nightly: flask --app app pregenerate-manifests
+    from manifests import pregenerate_manifests_command
+    app.cli.add_command(pregenerate_manifests_command)
+
+    # Per deploy, after changing static/css or static/js: flask --app app build-assets
+    from assets import build_assets_command
+    app.cli.add_command(build_assets_command)
+
+    # Weekly: flask --app app archive-old-data
+    from archive import archive_old_data_command
+    app.cli.add_command(archive_old_data_command)
+
+    # Optional, e.g. hourly (workers also sweep as they write): flask --app app sweep-sessions
+    from sessions import sweep_sessions_command
+    app.cli.add_command(sweep_sessions_command)
+
+    # Compress responses for the (mostly mobile) clients that accept it
+    from compression import init_compression
+    init_compression(app)
+
+    # Reject over-limit clients before any view touches the database
+    from ratelimit import init_rate_limiter
+    init_rate_limiter(app)
+
+    # Fingerprinted static assets: asset_url() in templates, /static/dist/ served immutable
+    from assets import init_assets
+    init_assets(app)
+
+    # Initialize Babel (Flask-Babel v3 style)
+    Babel(app, locale_selector=get_locale)
+
+    # Per-language translation bundles for JavaScript: translations_url() in templates
+    from i18n import init_i18n
+    init_i18n(app)
+
+    # {% cache %} fragments in templates, keyed by language and data version
+    from template_cache import init_template_cache
+    init_template_cache(app)
+
+    app.add_url_rule('/', 'index', index)
+    app.add_url_rule('/health', 'health_check', health_check)
+    app.add_url_rule('/api/contact-settings', 'contact_settings_api', contact_settings_api)
+    app.context_processor(inject_globals)
+
+    startup_ms = (time.perf_counter() - started) * 1000
+    if startup_ms > app.config['STARTUP_BUDGET_MS']:
+        logger.warning('Startup took %.0f ms, over the %.0f ms budget', startup_ms, app.config['STARTUP_BUDGET_MS'])
+    else:
+        logger.info('Application ready in %.0f ms', startup_ms)
+    return app
+
+app = create_app()
+
 if __name__ == '__main__':
+    # The development server sets up its own database
+    from db_setup import migrate, seed_defaults
+    with app.app_context():
+        migrate()
+        seed_defaults()
     app.run(debug=True, host='0.0.0.0', port=5000)
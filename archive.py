@@ -0,0 +1,360 @@
+"""Retention: move old trips and their bookings to monthly archive files.
+
+Trips that departed more than ARCHIVE_AFTER_DAYS ago are moved, with
+their bookings, into instance/archive/archive_YYYY_MM.db (one SQLite file
+per departure month). Each batch of ARCHIVE_BATCH_SIZE trips is copied
+and deleted from the hot tables in one transaction over an ATTACHed
+archive database; seat blocks for those trips are simply dropped. Route,
+operator, bus type and customer rows stay in the main database.
+
+Archived bookings can still be looked up by id, reference or customer
+(admin booking details, archive page, ticket retrieval and ticket view);
+they come back as detached Booking objects with trip, route, operator,
+bus type and customer filled in, marked with ``archived = True``. Each
+worker keeps an index of which month holds which booking id, reference and
+customer, rebuilt when an archive file changes, so a lookup ATTACHes only
+the file holding the booking and a miss (e.g. a mistyped reference on the
+public ticket pages) ATTACHes none.
+
+The daily analytics rollups are kept as they are. Rebuilding rollups for
+archived days would zero them, since the trips are no longer in the hot
+tables.
+
+SQLite only: on other databases archive_old_data() does nothing.
+"""
+import os
+import re
+import threading
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import select, func, text, bindparam, or_
+from sqlalchemy.orm.attributes import set_committed_value
+
+from models import db, Trip, Booking, Customer, Route, Operator, BusType
+from search_index import normalize_phone
+
+DEFAULT_ARCHIVE_AFTER_DAYS = 180
+DEFAULT_BATCH_SIZE = 500
+ARCHIVED_TABLES = ['trip', 'booking']
+ARCHIVE_FILE_PATTERN = re.compile(r'^archive_(\d{4})_(\d{2})\.db$')
+
+_index = {'signature': None}
+_index_lock = threading.Lock()
+
+def archive_dir():
+    return current_app.config.get('ARCHIVE_DIR') or os.path.join(current_app.instance_path, 'archive')
+
+def _archive_path(month):
+    return os.path.join(archive_dir(), f'archive_{month}.db')
+
+def list_archives():
+    """Archive months ('YYYY_MM') on disk, newest first"""
+    try:
+        names = os.listdir(archive_dir())
+    except OSError:
+        return []
+    months = [f'{match.group(1)}_{match.group(2)}' for match in map(ARCHIVE_FILE_PATTERN.match, names) if match]
+    return sorted(months, reverse=True)
+
+def _supported():
+    return db.engine.dialect.name == 'sqlite'
+
+class _Attached:
+    """Autocommit connection with one archive file ATTACHed as `schema`"""
+
+    def __init__(self, month, create=False):
+        self.month = month
+        self.schema = f'archive_{month}'
+        self.path = _archive_path(month)
+        self.create = create
+
+    def __enter__(self):
+        if self.create:
+            os.makedirs(archive_dir(), exist_ok=True)
+        self.connection = db.engine.connect().execution_options(isolation_level='AUTOCOMMIT')
+        self.connection.exec_driver_sql(f'ATTACH DATABASE ? AS {self.schema}', (self.path,))
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            self.connection.exec_driver_sql(f'DETACH DATABASE {self.schema}')
+        finally:
+            self.connection.close()
+
+    def columns(self, table, schema='main'):
+        return [row[1] for row in self.connection.exec_driver_sql(f'PRAGMA {schema}.table_info({table})')]
+
+    def ensure_tables(self):
+        """Create archive tables shaped like the hot ones, adding columns added since"""
+        for table in ARCHIVED_TABLES:
+            existing = self.columns(table, self.schema)
+            if not existing:
+                self.connection.exec_driver_sql(
+                    f'CREATE TABLE {self.schema}.{table} AS SELECT * FROM main.{table} WHERE 0'
+                )
+                self.connection.exec_driver_sql(
+                    f'CREATE UNIQUE INDEX IF NOT EXISTS {self.schema}.ix_{table}_id ON {table} (id)'
+                )
+                continue
+            for column in self.columns(table):
+                if column not in existing:
+                    self.connection.exec_driver_sql(f'ALTER TABLE {self.schema}.{table} ADD COLUMN {column}')
+
+        for column in ['booking_reference', 'customer_id', 'trip_id']:
+            self.connection.exec_driver_sql(
+                f'CREATE INDEX IF NOT EXISTS {self.schema}.ix_booking_{column} ON booking ({column})'
+            )
+
+    def execute(self, statement, parameters=None):
+        """Run a Core statement with the hot tables mapped onto the archive schema"""
+        return self.connection.execution_options(
+            schema_translate_map={None: self.schema}
+        ).execute(statement, parameters or {})
+
+def _month_bounds(month):
+    start = datetime.strptime(month, '%Y_%m')
+    end = (start + timedelta(days=32)).replace(day=1)
+    return start, end
+
+def _protected_trip_ids(connection):
+    """Trips holding the highest trip/booking ids.
+
+    SQLite hands out max(id) + 1 for new rows, so archiving the newest row
+    would let a new booking or trip reuse an archived id.
+    """
+    max_trip = connection.execute(select(func.max(Trip.id))).scalar()
+    max_booking_trip = connection.execute(
+        select(Booking.trip_id).order_by(Booking.id.desc()).limit(1)
+    ).scalar()
+    return [trip_id for trip_id in (max_trip, max_booking_trip) if trip_id is not None]
+
+def archive_old_data(days=None, batch_size=None, dry_run=False):
+    """Move trips departed more than `days` ago (and their bookings) to archive files.
+
+    Returns {'cutoff', 'months': {month: {'trips', 'bookings'}}}.
+    """
+    days = days if days is not None else current_app.config.get('ARCHIVE_AFTER_DAYS', DEFAULT_ARCHIVE_AFTER_DAYS)
+    batch_size = batch_size or current_app.config.get('ARCHIVE_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    summary = {'cutoff': cutoff, 'months': {}}
+    if not _supported():
+        return summary
+
+    with db.engine.connect() as connection:
+        months = [row[0] for row in connection.execute(
+            select(func.strftime('%Y_%m', Trip.departure_time)).where(Trip.departure_time < cutoff).distinct()
+        )]
+        protected = _protected_trip_ids(connection)
+
+    for month in sorted(months):
+        start, end = _month_bounds(month)
+        eligible = select(Trip.id).where(
+            Trip.departure_time >= start, Trip.departure_time < min(end, cutoff), Trip.id.notin_(protected)
+        )
+        if dry_run:
+            with db.engine.connect() as connection:
+                trips = connection.execute(select(func.count()).select_from(eligible.subquery())).scalar()
+                bookings = connection.execute(
+                    select(func.count(Booking.id)).where(Booking.trip_id.in_(eligible))
+                ).scalar()
+            summary['months'][month] = {'trips': trips, 'bookings': bookings}
+            continue
+
+        moved = {'trips': 0, 'bookings': 0}
+        with _Attached(month, create=True) as archive:
+            archive.ensure_tables()
+            trip_columns = ', '.join(archive.columns('trip'))
+            booking_columns = ', '.join(archive.columns('booking'))
+            ids_param = bindparam('ids', expanding=True)
+
+            while True:
+                trip_ids = [row[0] for row in archive.connection.execute(eligible.order_by(Trip.id).limit(batch_size))]
+                if not trip_ids:
+                    break
+
+                archive.connection.exec_driver_sql('BEGIN IMMEDIATE')
+                try:
+                    archive.connection.execute(text(
+                        f'INSERT OR REPLACE INTO {archive.schema}.trip ({trip_columns}) '
+                        f'SELECT {trip_columns} FROM main.trip WHERE id IN :ids'
+                    ).bindparams(ids_param), {'ids': trip_ids})
+                    bookings = archive.connection.execute(text(
+                        f'INSERT INTO {archive.schema}.booking ({booking_columns}) '
+                        f'SELECT {booking_columns} FROM main.booking WHERE trip_id IN :ids '
+                        f'AND id NOT IN (SELECT id FROM {archive.schema}.booking WHERE trip_id IN :ids)'
+                    ).bindparams(ids_param), {'ids': trip_ids}).rowcount
+                    for statement in ['DELETE FROM main.seat_block WHERE trip_id IN :ids',
+                                      'DELETE FROM main.booking WHERE trip_id IN :ids',
+                                      'DELETE FROM main.trip WHERE id IN :ids']:
+                        archive.connection.execute(text(statement).bindparams(ids_param), {'ids': trip_ids})
+                    archive.connection.exec_driver_sql('COMMIT')
+                except Exception:
+                    archive.connection.exec_driver_sql('ROLLBACK')
+                    raise
+
+                moved['trips'] += len(trip_ids)
+                moved['bookings'] += bookings
+
+        summary['months'][month] = moved
+
+    # Rows were deleted outside db.session, so the commit hooks didn't see them
+    from cache import invalidate
+    invalidate('trip', 'booking', 'seat_block')
+    return summary
+
+def archive_stats():
+    """Per-month trip/booking counts and file sizes"""
+    stats = []
+    if not _supported():
+        return stats
+    for month in list_archives():
+        with _Attached(month) as archive:
+            trips = archive.execute(select(func.count()).select_from(Trip.__table__)).scalar()
+            bookings = archive.execute(select(func.count()).select_from(Booking.__table__)).scalar()
+        stats.append({'month': month, 'trips': trips, 'bookings': bookings,
+                      'size': os.path.getsize(_archive_path(month))})
+    return stats
+
+# Lookups
+
+def _hydrate(archive, booking_rows):
+    """Detached Booking objects (with related rows) for archived booking rows"""
+    if not booking_rows:
+        return []
+
+    trip_ids = {row.trip_id for row in booking_rows}
+    trip_rows = archive.execute(select(Trip.__table__).where(Trip.__table__.c.id.in_(trip_ids))).all()
+    routes = {route.id: route for route in Route.query.filter(Route.id.in_({row.route_id for row in trip_rows}))}
+    operators = {operator.id: operator for operator in Operator.query.filter(Operator.id.in_({row.operator_id for row in trip_rows}))}
+    bus_types = {bus_type.id: bus_type for bus_type in BusType.query.filter(BusType.id.in_({row.bus_type_id for row in trip_rows}))}
+    customers = {customer.id: customer for customer in Customer.query.filter(Customer.id.in_({row.customer_id for row in booking_rows}))}
+
+    # set_committed_value avoids backrefs, which would pull these objects into the session
+    trips = {}
+    for row in trip_rows:
+        trip = Trip(**row._mapping)
+        trip.archived = True
+        set_committed_value(trip, 'route', routes.get(row.route_id))
+        set_committed_value(trip, 'operator', operators.get(row.operator_id))
+        set_committed_value(trip, 'bus_type', bus_types.get(row.bus_type_id))
+        trips[row.id] = trip
+
+    bookings = []
+    for row in booking_rows:
+        booking = Booking(**row._mapping)
+        booking.archived = True
+        set_committed_value(booking, 'trip', trips.get(row.trip_id))
+        set_committed_value(booking, 'customer', customers.get(row.customer_id))
+        bookings.append(booking)
+    return bookings
+
+def _archive_signature(months):
+    signature = []
+    for month in months:
+        try:
+            stat = os.stat(_archive_path(month))
+        except OSError:
+            continue
+        signature.append((month, _archive_path(month), stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+def archive_index():
+    """{'ids', 'references', 'customers'}: the month(s) holding each archived booking id,
+    reference and customer id, rebuilt when an archive file is added or changed"""
+    signature = _archive_signature(list_archives())
+    if _index['signature'] == signature:
+        return _index
+    with _index_lock:
+        if _index['signature'] != signature:
+            ids, references, customers = {}, {}, {}
+            column = Booking.__table__.c
+            for month, _, _, _ in signature:
+                with _Attached(month) as archive:
+                    rows = archive.execute(select(column.id, column.booking_reference, column.customer_id))
+                    for row in rows:
+                        booking_id, reference, customer_id = tuple(row)
+                        ids[booking_id] = month
+                        references[reference] = month
+                        customers.setdefault(customer_id, set()).add(month)
+            _index.update(ids=ids, references=references, customers=customers, signature=signature)
+    return _index
+
+def find_archived_bookings(conditions, limit=50, months=None):
+    """Archived bookings matching Core conditions on Booking, newest month first
+
+    `months` limits the search to those archive files (default: all).
+    """
+    if not _supported():
+        return []
+    results = []
+    for month in (sorted(months, reverse=True) if months is not None else list_archives()):
+        with _Attached(month) as archive:
+            rows = archive.execute(
+                select(Booking.__table__).where(*conditions)
+                .order_by(Booking.__table__.c.created_at.desc()).limit(limit - len(results))
+            ).all()
+            results.extend(_hydrate(archive, rows))
+        if len(results) >= limit:
+            break
+    return results
+
+def find_archived_booking(booking_id=None, reference=None):
+    """One archived booking by id or reference, or None"""
+    if not _supported():
+        return None
+    column = Booking.__table__.c
+    index = archive_index()
+    if booking_id is not None:
+        month = index['ids'].get(booking_id)
+        condition = column.id == booking_id
+    else:
+        reference = (reference or '').upper()
+        month = index['references'].get(reference)
+        condition = column.booking_reference == reference
+    if month is None:
+        return None
+    bookings = find_archived_bookings([condition], limit=1, months=[month])
+    return bookings[0] if bookings else None
+
+def archived_bookings_for_customers(customer_ids, status=None, limit=50):
+    if not customer_ids or not _supported():
+        return []
+    customers = archive_index()['customers']
+    months = set().union(*(customers.get(customer_id, ()) for customer_id in customer_ids))
+    if not months:
+        return []
+    conditions = [Booking.__table__.c.customer_id.in_(list(customer_ids))]
+    if status:
+        conditions.append(Booking.__table__.c.status == status)
+    return find_archived_bookings(conditions, limit=limit, months=months)
+
+def matching_customer_ids(term):
+    """Ids of customers whose email or phone matches `term`"""
+    term = (term or '').strip()
+    if not term:
+        return []
+    conditions = [func.lower(Customer.email) == term.lower()]
+    digits = normalize_phone(term)
+    if len(digits) >= 6:
+        phone = Customer.phone
+        for char in [' ', '+', '-', '(', ')', '.', '/']:
+            phone = func.replace(phone, char, '')
+        conditions.append(phone.like(f'%{digits}'))
+    return [customer_id for customer_id, in db.session.query(Customer.id).filter(or_(*conditions))]
+
+@click.command('archive-old-data')
+@click.option('--days', type=int, default=None, help='Archive trips that departed more than this many days ago')
+@click.option('--batch-size', type=int, default=None, help='Trips moved per transaction')
+@click.option('--dry-run', is_flag=True, help='Only report what would be archived')
+@with_appcontext
+def archive_old_data_command(days, batch_size, dry_run):
+    """Move old trips and bookings to the monthly archive files."""
+    summary = archive_old_data(days=days, batch_size=batch_size, dry_run=dry_run)
+    action = 'Would archive' if dry_run else 'Archived'
+    for month, counts in sorted(summary['months'].items()):
+        click.echo(f"{action} {counts['trips']} trip(s), {counts['bookings']} booking(s) into {month}")
+    if not summary['months']:
+        click.echo(f"Nothing departed before {summary['cutoff']:%Y-%m-%d}")
@@ -0,0 +1,164 @@
+"""Static asset build: minified, content-hashed, precompressed copies.
+
+    flask --app app build-assets
+
+Minifies every file under static/css and static/js into static/dist with the
+content hash in its name (css/admin.css -> dist/css/admin.3f2a9c01de.css),
+writes .gz and .br variants next to it and records the mapping in
+static/dist/manifest.json. Templates link assets with asset_url('css/admin.css'),
+which resolves through the manifest and falls back to the unbuilt file when
+there is none, so development works without a build.
+
+The same build compiles the translation catalogs and adds a bundle per
+language (js/translations.<lang>.js, see i18n.py).
+
+Hashed files never change, so /static/dist/ is served with a one-year
+immutable Cache-Control, as the brotli or gzip variant when the browser
+accepts it. Run the build on every deploy; files from earlier builds are kept
+for pages still open in browsers until --clean removes them.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+
+import click
+from flask import current_app, request, send_from_directory, url_for
+from flask.cli import with_appcontext
+
+logger = logging.getLogger(__name__)
+
+SOURCE_DIRS = ('css', 'js')
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+IMMUTABLE = 'public, max-age=31536000, immutable'
+MIMETYPES = {'.css': 'text/css', '.js': 'text/javascript'}
+# Variants in order of preference, with the file suffix each is stored under
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+_manifest = None
+
+def minify(source, extension):
+    import rcssmin
+    import rjsmin
+
+    if extension == '.css':
+        return rcssmin.cssmin(source)
+    return rjsmin.jsmin(source)
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+def _build_one(static_folder, logical, source):
+    """Write the minified, hashed and precompressed files for `logical`; returns (built path, sizes)"""
+    import brotli
+
+    source_dir, name = os.path.split(logical)
+    stem, extension = os.path.splitext(name)
+    minified = minify(source, extension).encode('utf-8')
+    digest = hashlib.sha256(minified).hexdigest()[:10]
+    built = f'{DIST_DIR}/{source_dir}/{stem}.{digest}{extension}'
+    path = os.path.join(static_folder, built)
+    gzipped = gzip.compress(minified, compresslevel=9, mtime=0)
+    brotlied = brotli.compress(minified, quality=11)
+    _write(path, minified)
+    _write(path + '.gz', gzipped)
+    _write(path + '.br', brotlied)
+    return built, (len(source.encode('utf-8')), len(minified), len(gzipped), len(brotlied))
+
+def build_assets(static_folder, clean=False, bundles=None):
+    """Build static/dist and its manifest; returns the manifest entries with sizes
+
+    `bundles` maps further logical names to generated sources, e.g. the
+    translation bundles.
+    """
+    dist = os.path.join(static_folder, DIST_DIR)
+    sources = {}
+    for source_dir in SOURCE_DIRS:
+        for name in sorted(os.listdir(os.path.join(static_folder, source_dir))):
+            if os.path.splitext(name)[1] not in MIMETYPES:
+                continue
+            logical = f'{source_dir}/{name}'
+            with open(os.path.join(static_folder, logical), encoding='utf-8') as f:
+                sources[logical] = f.read()
+    sources.update(bundles or {})
+
+    manifest = {}
+    report = []
+    for logical, source in sources.items():
+        built, sizes = _build_one(static_folder, logical, source)
+        manifest[logical] = built
+        report.append((logical, built) + sizes)
+
+    if clean:
+        keep = {os.path.normpath(os.path.join(static_folder, built)) for built in manifest.values()}
+        for root, _, files in os.walk(dist):
+            for name in files:
+                path = os.path.normpath(os.path.join(root, name))
+                base = path[:-3] if path.endswith(('.gz', '.br')) else path
+                if name != MANIFEST_NAME and base not in keep:
+                    os.remove(path)
+
+    _write(os.path.join(dist, MANIFEST_NAME), json.dumps(manifest, indent=2, sort_keys=True).encode())
+    return report
+
+def load_manifest():
+    """The built manifest, read once per worker ({} when assets were not built)"""
+    global _manifest
+    if _manifest is None:
+        path = os.path.join(current_app.static_folder, DIST_DIR, MANIFEST_NAME)
+        try:
+            with open(path, encoding='utf-8') as f:
+                _manifest = json.load(f)
+        except FileNotFoundError:
+            _manifest = {}
+        except ValueError:
+            logger.error('Unreadable asset manifest %s, serving unbuilt assets', path)
+            _manifest = {}
+    return _manifest
+
+def asset_url(filename):
+    """URL of the built asset for `filename` (e.g. 'js/script.js'), or of the file itself"""
+    return url_for('static', filename=load_manifest().get(filename, filename))
+
+def serve_dist(filename):
+    """Serve a hashed asset, precompressed when the browser accepts it"""
+    folder = os.path.join(current_app.static_folder, DIST_DIR)
+    mimetype = MIMETYPES.get(os.path.splitext(filename)[1])
+    response = None
+    if mimetype:
+        for encoding, suffix in ENCODINGS:
+            if encoding in request.accept_encodings and os.path.isfile(os.path.join(folder, filename + suffix)):
+                response = send_from_directory(folder, filename + suffix, mimetype=mimetype)
+                response.headers['Content-Encoding'] = encoding
+                break
+    if response is None:
+        response = send_from_directory(folder, filename, mimetype=mimetype)
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = IMMUTABLE
+    return response
+
+def init_assets(app):
+    """Serve /static/dist/ and make asset_url() available to templates"""
+    global _manifest
+    _manifest = None
+    app.add_url_rule(f'{app.static_url_path}/{DIST_DIR}/<path:filename>', 'assets', serve_dist)
+    app.add_template_global(asset_url)
+
+@click.command('build-assets')
+@click.option('--clean', is_flag=True, help='Delete files left by earlier builds.')
+@with_appcontext
+def build_assets_command(clean):
+    """Minify, fingerprint and precompress static/css and static/js; compile translations."""
+    import i18n
+
+    directory = os.path.join(current_app.root_path, i18n.CATALOG_DIR)
+    for lang, count in i18n.compile_catalogs(directory):
+        click.echo(f'Compiled {i18n.CATALOG_DIR}/{lang} ({count} messages)')
+    report = build_assets(current_app.static_folder, clean=clean, bundles=i18n.translation_bundles(current_app))
+    for logical, built, original, minified, gzipped, brotlied in report:
+        click.echo(f'{logical:<36} -> {built:<44} {original:>7} B  min {minified:>7}  gz {gzipped:>6}  br {brotlied:>6}')
+    click.echo(f'Wrote {len(report)} asset(s) and {DIST_DIR}/{MANIFEST_NAME}')
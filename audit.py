@@ -0,0 +1,113 @@
+"""Append-only audit log of admin actions.
+
+record() only appends the entry to an in-memory buffer; a background thread
+per worker writes buffered entries to ``audit_log`` in one multi-row insert
+every AUDIT_FLUSH_INTERVAL seconds, or sooner once AUDIT_BATCH_SIZE entries
+are waiting. Anything still buffered is written at interpreter exit.
+
+On SQLite, triggers reject UPDATE and DELETE on ``audit_log``, so entries
+cannot be changed or removed through the application (clear_database leaves
+the table alone).
+"""
+import atexit
+import json
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+
+from flask import current_app, has_request_context, request, session
+from sqlalchemy import text
+
+from models import db, AuditLog
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_INTERVAL = 2.0  # seconds
+DEFAULT_BATCH_SIZE = 200
+MAX_BUFFERED = 10000  # Oldest entries are dropped if the database stays unavailable
+
+_buffer = deque(maxlen=MAX_BUFFERED)
+_wakeup = threading.Event()
+_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_writer = None
+_app = None
+
+def ensure_audit_log():
+    """Install the triggers that make audit_log append-only (SQLite)"""
+    if db.engine.dialect.name != 'sqlite':
+        return
+    with db.engine.begin() as connection:
+        for operation in ['UPDATE', 'DELETE']:
+            connection.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS audit_log_no_{operation.lower()} BEFORE {operation} ON audit_log "
+                f"BEGIN SELECT RAISE(ABORT, 'audit_log is append-only'); END"
+            ))
+
+def record(action, entity_type, entity_id=None, **details):
+    """Queue an audit entry for the current admin; never touches the database"""
+    entry = {
+        'created_at': datetime.utcnow(),
+        'actor': 'system',
+        'action': action,
+        'entity_type': entity_type,
+        'entity_id': str(entity_id) if entity_id is not None else None,
+        'details': json.dumps(details, default=str) if details else None,
+        'ip_address': None,
+    }
+    if has_request_context():
+        entry['actor'] = session.get('admin_email') or f"admin:{session.get('admin_id', '?')}"
+        entry['ip_address'] = request.headers.get('X-Forwarded-For', request.remote_addr or '').split(',')[0].strip() or None
+
+    _buffer.append(entry)
+    _start_writer()
+    if len(_buffer) >= current_app.config.get('AUDIT_BATCH_SIZE', DEFAULT_BATCH_SIZE):
+        _wakeup.set()
+
+def flush():
+    """Write all buffered entries now. Returns the number written."""
+    with _flush_lock:
+        entries = []
+        while _buffer:
+            try:
+                entries.append(_buffer.popleft())
+            except IndexError:
+                break
+        if not entries:
+            return 0
+
+        app = _app or current_app._get_current_object()
+        try:
+            with app.app_context(), db.engine.begin() as connection:
+                connection.execute(AuditLog.__table__.insert(), entries)
+        except Exception as e:
+            # Keep the entries for the next attempt
+            _buffer.extendleft(reversed(entries))
+            logger.warning('Could not write audit log: %s', e)
+            return 0
+        return len(entries)
+
+def _run_writer():
+    interval = _app.config.get('AUDIT_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL)
+    while True:
+        _wakeup.wait(interval)
+        _wakeup.clear()
+        flush()
+
+def _start_writer():
+    """Start this worker's writer thread on first use (after any fork)"""
+    global _writer, _app
+    if _writer is not None and _writer.is_alive():
+        return
+    with _lock:
+        if _writer is not None and _writer.is_alive():
+            return
+        _app = current_app._get_current_object()
+        _writer = threading.Thread(target=_run_writer, name='audit-log-writer', daemon=True)
+        _writer.start()
+
+@atexit.register
+def _flush_at_exit():
+    if _app is not None:
+        flush()
@@ -0,0 +1,271 @@
+"""Microbenchmarks for model hot paths and the search/seat map routes.
+
+Model methods run on in-memory objects. The routes run through Flask's test
+client against a database seeded by seed_data.seed_dataset() (a temporary
+SQLite file unless --database is given), so results are comparable across
+machines only as far as the hardware is.
+
+    python bench.py                      # run everything, print a table
+    python bench.py -k seat              # only benchmarks whose name contains "seat"
+    python bench.py --record             # append the run to bench_history.jsonl
+    python bench.py --compare            # compare with the last recorded run; exit 1 on regressions
+    python bench.py -k startup           # only the cold start: `import app` in a fresh interpreter
+    python bench.py --compression        # body bytes and time to first byte per content encoding
+
+Each benchmark is calibrated to take about 0.2s per round and run --rounds
+times; the fastest round is reported (the least disturbed by other load) with
+the median alongside. The startup benchmark runs a new interpreter per round
+and is also checked against STARTUP_BUDGET_MS (--startup-budget-ms).
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+from datetime import datetime
+
+HISTORY_FILE = 'bench_history.jsonl'
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def measure(func, rounds):
+    """(best, median) seconds per call of `func`"""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    # autorange stops at >= 0.2s; use that loop count for every round
+    times = [t / number for t in timer.repeat(repeat=rounds, number=number)]
+    return min(times), statistics.median(times)
+
+def model_benchmarks():
+    """name -> zero-argument callable, on transient objects"""
+    from models import BusType, OperatorBusType, RouteOperatorAssignment, Trip, Booking
+
+    json_booking = Booking(seat_numbers=json.dumps(['12', '13', '14']))
+    csv_booking = Booking(seat_numbers='12, 13, 14')
+    bus_type = BusType(name='Regular', category='regular', capacity=70, seats_per_row=5)
+    config = OperatorBusType(capacity=70, seats_per_row=5)
+    stored_times = RouteOperatorAssignment(trips_per_day=4, departure_times=json.dumps(['06:00', '10:00', '14:00', '18:00']))
+    default_times = RouteOperatorAssignment(trips_per_day=6, departure_times=None)
+
+    # A 70 seat bus with ~30 bookings of 1-3 seats
+    full_trip = Trip(available_seats=70)
+    seat = 1
+    for index in range(30):
+        count = index % 3 + 1
+        full_trip.bookings.append(Booking(seat_numbers=json.dumps([str(s) for s in range(seat, seat + count)])))
+        seat += count
+
+    return {
+        'booking.get_seat_numbers[json]': json_booking.get_seat_numbers,
+        'booking.get_seat_numbers[csv]': csv_booking.get_seat_numbers,
+        'bus_type.generate_default_layout[70]': bus_type.generate_default_layout,
+        'operator_bus_type.generate_default_layout[70]': config.generate_default_layout,
+        'assignment.get_departure_times[json]': stored_times.get_departure_times,
+        'assignment.get_departure_times[default]': default_times.get_departure_times,
+        'trip.get_booked_seats[30 bookings]': full_trip.get_booked_seats,
+        'trip.get_available_seat_count[30 bookings]': full_trip.get_available_seat_count,
+    }
+
+def _sample_urls(app):
+    """URLs of the search API, search page, seat map and a ticket for an upcoming trip"""
+    from models import db, Booking, Route, Trip
+
+    with app.app_context():
+        trip = (Trip.query.join(Route).filter(Trip.departure_time > datetime.utcnow())
+                .order_by(Trip.departure_time).first())
+        if trip is None:
+            raise SystemExit('No upcoming trips in the database; seed it first')
+        route = trip.route
+        query = f'from={route.origin}&to={route.destination}&operator={trip.operator_id}&date={trip.departure_time.date().isoformat()}'
+        booking = Booking.query.filter_by(status='confirmed').first()
+        urls = {
+            'routes': '/api/routes',
+            'route_operators': f'/api/route-operators?from={route.origin}&to={route.destination}',
+            'search_api': f'/api/search-trips?{query}',
+            'search_page': f'/fr/search?{query}',
+            'seat_map': f'/fr/booking/seats?trip={trip.id}',
+            'ticket': f'/fr/booking/ticket/{booking.id}' if booking else None,
+        }
+        db.session.remove()
+    return urls
+
+def route_benchmarks(app):
+    """name -> callable issuing one request through the test client"""
+    urls = _sample_urls(app)
+
+    # No app context around the calls: each request gets its own, and with it
+    # a fresh session, as in production
+    client = app.test_client()
+    search_url = urls['search_api']
+    seat_map_url = urls['seat_map']
+
+    def get(url):
+        def request():
+            response = client.get(url)
+            if response.status_code != 200:
+                raise RuntimeError(f'{url} returned {response.status_code}')
+        return request
+
+    return {
+        'route./api/routes': get('/api/routes'),
+        'route./api/route-operators': get(urls['route_operators']),
+        'route./api/search-trips': get(search_url),
+        'route./<lang>/booking/seats': get(seat_map_url),
+    }
+
+def compression_report(app, requests_per_encoding=20):
+    """Body size and median time to first byte of the main pages for each Accept-Encoding"""
+    urls = _sample_urls(app)
+    client = app.test_client()
+    encodings = [('identity', 'identity'), ('gzip', 'gzip'), ('br', 'br, gzip')]
+    print(f"{'page':<18}{'encoding':<10}{'bytes':>9}{'saved':>8}{'ttfb':>10}")
+    for name in ('search_page', 'seat_map', 'ticket', 'search_api', 'routes'):
+        url = urls[name]
+        if url is None:
+            continue
+        identity_bytes = None
+        for label, header in encodings:
+            ttfbs = []
+            for _ in range(requests_per_encoding):
+                started = time.perf_counter()
+                response = client.get(url, headers={'Accept-Encoding': header}, buffered=False)
+                chunks = iter(response.response)
+                body = next(chunks, b'')
+                ttfbs.append(time.perf_counter() - started)
+                body += b''.join(chunks)
+                response.close()
+            if response.headers.get('Content-Encoding', 'identity') != label:
+                print(f'{name:<18}{label:<10}{"not compressed":>27}')
+                continue
+            if identity_bytes is None:
+                identity_bytes = len(body)
+            saved = f'{(1 - len(body) / identity_bytes) * 100:.0f}%'
+            print(f'{name:<18}{label:<10}{len(body):>9}{saved:>8}{statistics.median(ttfbs) * 1000:>8.2f}ms')
+
+def measure_startup(database, rounds):
+    """(best, median) seconds for `import app` (create_app included) in a new interpreter"""
+    env = dict(os.environ, DATABASE_URL=database, LOG_LEVEL='WARNING')
+    script = 'import time; started = time.perf_counter(); import app; print(time.perf_counter() - started)'
+    times = []
+    for _ in range(rounds):
+        output = subprocess.run([sys.executable, '-c', script], env=env, capture_output=True, text=True, check=True).stdout
+        times.append(float(output.strip().splitlines()[-1]))
+    return min(times), statistics.median(times)
+
+def _load_app(database):
+    if database is None:
+        path = os.path.join(tempfile.mkdtemp(prefix='nkolo-bench-'), 'bench.db')
+        database = f'sqlite:///{path}'
+        seed = True
+    else:
+        seed = False
+    os.environ['DATABASE_URL'] = database
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    # Measure the routes, not the profiler's bookkeeping (or its N+1 warnings)
+    os.environ.setdefault('PROFILER_ENABLED', 'false')
+    # Thousands of calls from one client would exhaust the per-IP buckets
+    os.environ.setdefault('RATE_LIMIT_ENABLED', 'false')
+
+    from app import app
+    if seed:
+        from db_setup import migrate
+        from seed_data import seed_dataset
+        with app.app_context():
+            migrate()
+            seed_dataset(days=7)
+    return app
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def regressions(results, previous, tolerance):
+    """Benchmarks whose best time grew by more than `tolerance` (a fraction)"""
+    found = []
+    for name, stats in results.items():
+        before = previous['results'].get(name)
+        if before and stats['best_us'] > before['best_us'] * (1 + tolerance):
+            found.append(f"{name}: {before['best_us']:.1f} -> {stats['best_us']:.1f} us")
+    return found
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('-k', dest='keyword', help='Only run benchmarks whose name contains this')
+    parser.add_argument('--database', help='Existing database URL to benchmark routes against (default: seed a temporary SQLite file)')
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--skip-routes', action='store_true')
+    parser.add_argument('--startup-budget-ms', type=float, default=float(os.environ.get('STARTUP_BUDGET_MS', 1000)),
+                        help='Fail when the cold start (best round) takes longer')
+    parser.add_argument('--history', default=HISTORY_FILE)
+    parser.add_argument('--record', action='store_true', help='Append this run to the history file')
+    parser.add_argument('--compare', action='store_true', help='Compare with the last recorded run; exit 1 on regressions')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed slowdown before flagging (0.25 = 25%%)')
+    parser.add_argument('--compression', action='store_true', help='Only report response sizes and TTFB per encoding')
+    args = parser.parse_args(argv)
+
+    app = _load_app(args.database)
+    if args.compression:
+        compression_report(app)
+        return 0
+    benchmarks = model_benchmarks()
+    if not args.skip_routes:
+        benchmarks.update(route_benchmarks(app))
+    benchmarks['startup.import_app'] = None
+    if args.keyword:
+        benchmarks = {name: func for name, func in benchmarks.items() if args.keyword in name}
+
+    history = load_history(args.history)
+    previous = history[-1] if args.compare and history else None
+
+    results = {}
+    print(f"{'benchmark':<52}{'best':>12}{'median':>12}{'vs last':>10}")
+    over_budget = False
+    for name, func in benchmarks.items():
+        if name == 'startup.import_app':
+            best, median = measure_startup(app.config['SQLALCHEMY_DATABASE_URI'], args.rounds)
+            over_budget = best * 1000 > args.startup_budget_ms
+        else:
+            best, median = measure(func, args.rounds)
+        results[name] = {'best_us': best * 1e6, 'median_us': median * 1e6}
+        change = ''
+        if previous and name in previous['results']:
+            change = f"{(best * 1e6 / previous['results'][name]['best_us'] - 1) * 100:+.0f}%"
+        print(f'{name:<52}{best * 1e6:>10.1f}us{median * 1e6:>10.1f}us{change:>10}')
+
+    if args.record:
+        with open(args.history, 'a') as f:
+            f.write(json.dumps({
+                'run_at': datetime.utcnow().isoformat(timespec='seconds'),
+                'commit': _git_commit(),
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'results': results,
+            }) + '\n')
+        print(f'Recorded in {args.history}')
+
+    failed = False
+    if over_budget:
+        print(f"OVER BUDGET startup.import_app: {results['startup.import_app']['best_us'] / 1000:.0f} ms "
+              f"> {args.startup_budget_ms:.0f} ms")
+        failed = True
+    if previous:
+        found = regressions(results, previous, args.tolerance)
+        for line in found:
+            print(f'REGRESSION {line}')
+        failed = failed or bool(found)
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
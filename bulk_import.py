@@ -0,0 +1,370 @@
+"""Bulk CSV import of operators, locations, routes and schedules.
+
+All uploaded files are parsed and validated in memory first and every
+problem is reported at once (file, line, column, message); nothing is
+written unless the whole batch is clean. Files are processed in
+dependency order (operators -> locations -> routes -> schedules), so a
+new agency can be onboarded in one upload: later files may reference
+operators and routes defined earlier in the same batch.
+
+References are resolved by operator code and city name. City names are
+matched case- and accent-insensitively against cities already known
+(routes, operator locations and the batch itself), so "yaounde" in a
+file is stored as the existing "Yaoundé".
+
+Rows are inserted with executemany INSERTs, CHUNK_SIZE rows per
+transaction.
+"""
+import csv
+import io
+import json
+import re
+import unicodedata
+
+from sqlalchemy import insert, select
+
+from models import db, Operator, OperatorLocation, Route, RouteOperatorAssignment
+
+CHUNK_SIZE = 500
+
+IMPORT_KINDS = ['operators', 'locations', 'routes', 'schedules']
+
+# kind -> (columns, required columns)
+COLUMNS = {
+    'operators': (['code', 'name', 'contact_person', 'email', 'phone', 'address', 'logo_url', 'is_active'],
+                  ['code', 'name']),
+    'locations': (['operator_code', 'city', 'address', 'location_type', 'phone', 'is_main_office'],
+                  ['operator_code', 'city']),
+    'routes': (['origin', 'destination', 'name', 'distance_km', 'estimated_duration', 'waypoints', 'is_active'],
+               ['origin', 'destination']),
+    'schedules': (['operator_code', 'origin', 'destination', 'regular_seat_price', 'vip_seat_price',
+                   'departure_times', 'service_days', 'pickup_city', 'dropoff_city', 'notes', 'is_active'],
+                  ['operator_code', 'origin', 'destination', 'regular_seat_price']),
+}
+
+EXAMPLE_ROWS = {
+    'operators': ['GEN', 'General Express', 'Paul Mbarga', 'contact@general.cm', '+237 677000000', 'Mvan, Yaoundé', '', 'yes'],
+    'locations': ['GEN', 'Yaoundé', 'Gare routière de Mvan', 'terminal', '+237 677000001', 'yes'],
+    'routes': ['Yaoundé', 'Douala', '', '240', '240', 'Edéa', 'yes'],
+    'schedules': ['GEN', 'Yaoundé', 'Douala', '5000', '8000', '06:00|10:00|14:00', '1234567', 'Yaoundé', 'Douala', '', 'yes'],
+}
+
+LOCATION_TYPES = ['terminal', 'office', 'depot']
+TRUE_VALUES = {'1', 'yes', 'y', 'true', 'oui', 'on'}
+FALSE_VALUES = {'0', 'no', 'n', 'false', 'non', 'off'}
+LIST_SEPARATOR = '|'
+
+class ImportResult:
+    """Outcome of validating (and possibly importing) one batch of files"""
+
+    def __init__(self):
+        self.errors = []
+        self.rows = {kind: [] for kind in IMPORT_KINDS}
+        self.imported = {}
+
+    def error(self, kind, line, column, message):
+        self.errors.append({'file': kind, 'line': line, 'column': column, 'message': message})
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    @property
+    def counts(self):
+        return {kind: len(rows) for kind, rows in self.rows.items() if rows}
+
+def city_key(name):
+    """Case/accent/space-insensitive key for matching city names"""
+    decomposed = unicodedata.normalize('NFKD', name or '')
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return re.sub(r'[\s\-]+', ' ', stripped).strip().casefold()
+
+def template_csv(kind):
+    """Header plus one example row for a kind"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS[kind][0])
+    writer.writerow(EXAMPLE_ROWS[kind])
+    return buffer.getvalue()
+
+def _read_csv(kind, content, result):
+    """Decoded rows as (line number, dict) after checking the header"""
+    if isinstance(content, bytes):
+        try:
+            content = content.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            content = content.decode('cp1252')
+
+    reader = csv.DictReader(io.StringIO(content))
+    header = [name.strip().lower() for name in (reader.fieldnames or [])]
+    columns, required = COLUMNS[kind]
+    missing = [column for column in required if column not in header]
+    if missing:
+        result.error(kind, 1, ', '.join(missing), 'Missing required column(s)')
+        return []
+    unknown = [column for column in header if column and column not in columns]
+    if unknown:
+        result.error(kind, 1, ', '.join(unknown), 'Unknown column(s)')
+
+    reader.fieldnames = header
+    rows = []
+    for line, raw in enumerate(reader, start=2):
+        row = {key: (value or '').strip() for key, value in raw.items() if key}
+        if any(row.values()):
+            rows.append((line, row))
+    return rows
+
+class _Validator:
+    """Holds lookups of existing data plus everything accepted so far in the batch"""
+
+    def __init__(self, result):
+        self.result = result
+        self.operator_codes = {code.upper() for code, in db.session.execute(select(Operator.code))}
+        self.route_keys = {
+            (city_key(origin), city_key(destination))
+            for origin, destination in db.session.execute(select(Route.origin, Route.destination))
+        }
+        self.assignment_keys = {
+            (code.upper(), city_key(origin), city_key(destination))
+            for code, origin, destination in db.session.execute(
+                select(Operator.code, Route.origin, Route.destination)
+                .join(RouteOperatorAssignment, RouteOperatorAssignment.operator_id == Operator.id)
+                .join(Route, Route.id == RouteOperatorAssignment.route_id)
+            )
+        }
+        self.operator_cities = set()
+        self.cities = {}
+        for code, city in db.session.execute(
+            select(Operator.code, OperatorLocation.city).join(OperatorLocation, OperatorLocation.operator_id == Operator.id)
+        ):
+            self.operator_cities.add((code.upper(), city_key(city)))
+            self.cities.setdefault(city_key(city), city)
+        for origin, destination in db.session.execute(select(Route.origin, Route.destination)):
+            self.cities.setdefault(city_key(origin), origin)
+            self.cities.setdefault(city_key(destination), destination)
+
+    def city(self, name):
+        """Canonical spelling of a city, registering new ones"""
+        return self.cities.setdefault(city_key(name), name)
+
+    def _error(self, kind, line, column, message):
+        self.result.error(kind, line, column, message)
+
+    def _bool(self, kind, line, row, column, default=True):
+        value = row.get(column, '').lower()
+        if not value:
+            return default
+        if value in TRUE_VALUES:
+            return True
+        if value in FALSE_VALUES:
+            return False
+        self._error(kind, line, column, f'Expected yes/no, got "{row[column]}"')
+        return default
+
+    def _number(self, kind, line, row, column, cast=float, minimum=0):
+        value = row.get(column, '')
+        if not value:
+            return None
+        try:
+            number = cast(value.replace(' ', '').replace(',', '.') if cast is float else value)
+        except ValueError:
+            self._error(kind, line, column, f'Not a valid number: "{value}"')
+            return None
+        if number < minimum:
+            self._error(kind, line, column, f'Must be at least {minimum}')
+        return number
+
+    def _length(self, kind, line, row, column, limit):
+        if len(row.get(column, '')) > limit:
+            self._error(kind, line, column, f'Longer than {limit} characters')
+
+    def _operator(self, kind, line, row):
+        code = row['operator_code'].upper()
+        if code not in self.operator_codes:
+            self._error(kind, line, 'operator_code', f'Unknown operator code "{row["operator_code"]}"')
+        return code
+
+    def operators(self, line, row):
+        code = row['code'].upper()
+        if not 2 <= len(code) <= 10:
+            self._error('operators', line, 'code', 'Operator code must be 2-10 characters')
+        if code in self.operator_codes:
+            self._error('operators', line, 'code', f'Operator code "{code}" already exists')
+        self._length('operators', line, row, 'name', 100)
+        self._length('operators', line, row, 'phone', 20)
+        email = row.get('email', '')
+        if email and not re.fullmatch(r'[^@\s]+@[^@\s]+\.[^@\s]+', email):
+            self._error('operators', line, 'email', f'Invalid email "{email}"')
+        self.operator_codes.add(code)
+        return {
+            'code': row['code'],
+            'name': row['name'],
+            'contact_person': row.get('contact_person') or None,
+            'email': email or None,
+            'phone': row.get('phone') or None,
+            'address': row.get('address') or None,
+            'logo_url': row.get('logo_url') or None,
+            'is_active': self._bool('operators', line, row, 'is_active')
+        }
+
+    def locations(self, line, row):
+        code = self._operator('locations', line, row)
+        location_type = (row.get('location_type') or 'terminal').lower()
+        if location_type not in LOCATION_TYPES:
+            self._error('locations', line, 'location_type', f'Must be one of {", ".join(LOCATION_TYPES)}')
+        city = self.city(row['city'])
+        self.operator_cities.add((code, city_key(city)))
+        return {
+            'operator_code': code,
+            'city': city,
+            'address': row.get('address') or None,
+            'location_type': location_type,
+            'phone': row.get('phone') or None,
+            'is_main_office': self._bool('locations', line, row, 'is_main_office', default=False),
+            'is_active': True
+        }
+
+    def routes(self, line, row):
+        origin, destination = self.city(row['origin']), self.city(row['destination'])
+        key = (city_key(origin), city_key(destination))
+        if key[0] == key[1]:
+            self._error('routes', line, 'destination', 'Origin and destination are the same')
+        elif key in self.route_keys:
+            self._error('routes', line, 'destination', f'Route {origin} → {destination} already exists')
+        self.route_keys.add(key)
+        waypoints = [self.city(stop.strip()) for stop in row.get('waypoints', '').split(LIST_SEPARATOR) if stop.strip()]
+        return {
+            'name': row.get('name') or f'{origin} → {destination}',
+            'origin': origin,
+            'destination': destination,
+            'distance_km': self._number('routes', line, row, 'distance_km'),
+            'estimated_duration': self._number('routes', line, row, 'estimated_duration', cast=int, minimum=1),
+            'waypoints': json.dumps(waypoints) if waypoints else None,
+            'is_active': self._bool('routes', line, row, 'is_active')
+        }
+
+    def schedules(self, line, row):
+        code = self._operator('schedules', line, row)
+        origin, destination = self.city(row['origin']), self.city(row['destination'])
+        route_key = (city_key(origin), city_key(destination))
+        if route_key not in self.route_keys:
+            self._error('schedules', line, 'destination', f'Unknown route {origin} → {destination}')
+        if (code,) + route_key in self.assignment_keys:
+            self._error('schedules', line, 'operator_code', f'{code} already runs {origin} → {destination}')
+        self.assignment_keys.add((code,) + route_key)
+
+        times = [time.strip() for time in row.get('departure_times', '').split(LIST_SEPARATOR) if time.strip()]
+        for time in times:
+            if not re.fullmatch(r'([01]\d|2[0-3]):[0-5]\d', time):
+                self._error('schedules', line, 'departure_times', f'Invalid time "{time}" (use HH:MM)')
+        service_days = row.get('service_days') or '1234567'
+        if not re.fullmatch(r'[1-7]{1,7}', service_days):
+            self._error('schedules', line, 'service_days', 'Use day numbers 1 (Monday) to 7 (Sunday), e.g. 12345')
+
+        locations = {}
+        for column in ['pickup_city', 'dropoff_city']:
+            if row.get(column):
+                if (code, city_key(row[column])) not in self.operator_cities:
+                    self._error('schedules', line, column, f'{code} has no location in "{row[column]}"')
+                locations[column] = self.city(row[column])
+
+        regular_price = self._number('schedules', line, row, 'regular_seat_price')
+        return {
+            'operator_code': code,
+            'origin': origin,
+            'destination': destination,
+            'regular_seat_price': regular_price or 0,
+            'vip_seat_price': self._number('schedules', line, row, 'vip_seat_price') or 0,
+            'trips_per_day': len(times) or 3,
+            'departure_times': json.dumps(sorted(times)) if times else None,
+            'service_days': ''.join(sorted(set(service_days))),
+            'pickup_city': locations.get('pickup_city'),
+            'dropoff_city': locations.get('dropoff_city'),
+            'notes': row.get('notes') or None,
+            'is_active': self._bool('schedules', line, row, 'is_active')
+        }
+
+def validate_files(files):
+    """Parse and validate {kind: csv content}; returns an ImportResult"""
+    result = ImportResult()
+    unknown = [kind for kind in files if kind not in IMPORT_KINDS]
+    for kind in unknown:
+        result.error(kind, 0, '', 'Unknown import type')
+
+    validator = _Validator(result)
+    for kind in IMPORT_KINDS:
+        if not files.get(kind):
+            continue
+        rows = _read_csv(kind, files[kind], result)
+        required = COLUMNS[kind][1]
+        for line, row in rows:
+            missing = [column for column in required if not row.get(column)]
+            for column in missing:
+                result.error(kind, line, column, 'Required')
+            if missing:
+                continue
+            result.rows[kind].append(getattr(validator, kind)(line, row))
+
+    return result
+
+def _insert_chunks(model, rows):
+    for start in range(0, len(rows), CHUNK_SIZE):
+        db.session.execute(insert(model), rows[start:start + CHUNK_SIZE])
+        db.session.commit()
+    return len(rows)
+
+def _operator_ids():
+    return {code.upper(): operator_id for operator_id, code in db.session.execute(select(Operator.id, Operator.code))}
+
+def run_import(files, dry_run=False):
+    """Validate `files` and, if everything is valid, insert them in dependency order"""
+    result = validate_files(files)
+    if not result.ok or dry_run:
+        return result
+
+    try:
+        if result.rows['operators']:
+            result.imported['operators'] = _insert_chunks(Operator, result.rows['operators'])
+        operator_ids = _operator_ids()
+
+        if result.rows['locations']:
+            rows = []
+            for row in result.rows['locations']:
+                row = dict(row)
+                row['operator_id'] = operator_ids[row.pop('operator_code')]
+                rows.append(row)
+            result.imported['locations'] = _insert_chunks(OperatorLocation, rows)
+
+        if result.rows['routes']:
+            result.imported['routes'] = _insert_chunks(Route, result.rows['routes'])
+
+        if result.rows['schedules']:
+            route_ids = {
+                (city_key(origin), city_key(destination)): route_id
+                for route_id, origin, destination in db.session.execute(select(Route.id, Route.origin, Route.destination))
+            }
+            location_ids = {}
+            for location_id, operator_id, city in db.session.execute(
+                select(OperatorLocation.id, OperatorLocation.operator_id, OperatorLocation.city)
+                .order_by(OperatorLocation.is_main_office.desc(), OperatorLocation.id)
+            ):
+                location_ids.setdefault((operator_id, city_key(city)), location_id)
+
+            rows = []
+            for row in result.rows['schedules']:
+                row = dict(row)
+                operator_id = operator_ids[row.pop('operator_code')]
+                pickup, dropoff = row.pop('pickup_city'), row.pop('dropoff_city')
+                row.update(
+                    operator_id=operator_id,
+                    route_id=route_ids[(city_key(row.pop('origin')), city_key(row.pop('destination')))],
+                    pickup_location_id=location_ids.get((operator_id, city_key(pickup))) if pickup else None,
+                    dropoff_location_id=location_ids.get((operator_id, city_key(dropoff))) if dropoff else None
+                )
+                rows.append(row)
+            result.imported['schedules'] = _insert_chunks(RouteOperatorAssignment, rows)
+    except Exception as e:
+        db.session.rollback()
+        result.error('database', 0, '', f'Import stopped: {e}')
+
+    return result
@@ -0,0 +1,239 @@
+"""Shared cache for read-heavy endpoints, invalidated by tag.
+
+CACHE_TYPE selects the backend:
+
+- ``simple`` (default): an in-process LRU, one per worker.
+- ``redis``: any Redis-protocol server at CACHE_REDIS_URL, shared by all
+  workers (``pip install redis``). A local ``redis-server`` is enough for
+  development and tests.
+- ``null``: no caching, every lookup computes.
+
+Entries carry tags, normally table names. A committed session that wrote to
+a table bumps that table's tag version (see register_invalidation_listeners)
+and every entry stored under an older version becomes a miss, in all workers
+when the backend is Redis. Writes that bypass db.session, like the archive
+job, call invalidate() themselves. A version is the time of the tag's last
+invalidation in nanoseconds, so data_version() also serves HTTP validators
+(see http_cache.py).
+
+Values are stored as JSON, so cache plain dicts/lists, not model instances.
+"""
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY = 'nkolo_cache'
+PENDING_TAGS_KEY = 'nkolo_cache_pending_tags'
+
+class SimpleCache:
+    """In-process LRU with per-entry expiry"""
+
+    def __init__(self, max_entries=500):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._tag_versions = {}
+        self._started = time.time_ns()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, timeout):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + timeout, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def tag_versions(self, tags):
+        # Kept apart from the entries so LRU eviction can't reset a version
+        with self._lock:
+            return [self._tag_versions.get(tag, self._started) for tag in tags]
+
+    def bump_tags(self, tags):
+        now = time.time_ns()
+        with self._lock:
+            for tag in tags:
+                self._tag_versions[tag] = max(now, self._tag_versions.get(tag, self._started) + 1)
+
+class RedisCache:
+    """Redis-protocol backend shared by every worker"""
+
+    def __init__(self, url, key_prefix='nkolo:', socket_timeout=0.5):
+        import redis  # only needed with CACHE_TYPE=redis
+
+        self.client = redis.Redis.from_url(url, socket_timeout=socket_timeout, socket_connect_timeout=socket_timeout)
+        self.prefix = key_prefix
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        return None if raw is None else json.loads(raw)
+
+    def set(self, key, value, timeout):
+        self.client.set(self.prefix + key, json.dumps(value, separators=(',', ':')), ex=max(1, int(timeout)))
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=self.prefix + '*'))
+        for start in range(0, len(keys), 500):
+            self.client.delete(*keys[start:start + 500])
+
+    def tag_versions(self, tags):
+        keys = [f'{self.prefix}tag:{tag}' for tag in tags]
+        versions = self.client.mget(keys)
+        missing = [key for key, version in zip(keys, versions) if version is None]
+        if missing:
+            # A tag key lost to a restart or eviction must not restart at a
+            # version old entries were stored under, so seed it from the clock
+            pipe = self.client.pipeline()
+            for key in missing:
+                pipe.set(key, time.time_ns(), nx=True)
+            pipe.execute()
+            versions = self.client.mget(keys)
+        return [int(version) for version in versions]
+
+    def bump_tags(self, tags):
+        now = time.time_ns()
+        pipe = self.client.pipeline()
+        for tag in tags:
+            pipe.set(f'{self.prefix}tag:{tag}', now)
+        pipe.execute()
+
+class NullCache:
+    def get(self, key):
+        return None
+
+    def set(self, key, value, timeout):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+    def tag_versions(self, tags):
+        # Always new: nothing cached is ever current
+        return [time.time_ns()] * len(tags)
+
+    def bump_tags(self, tags):
+        pass
+
+def create_backend(config):
+    cache_type = config.get('CACHE_TYPE', 'simple')
+    if cache_type == 'simple':
+        return SimpleCache(config.get('CACHE_THRESHOLD', 500))
+    if cache_type == 'redis':
+        return RedisCache(config['CACHE_REDIS_URL'], config.get('CACHE_KEY_PREFIX', 'nkolo:'))
+    if cache_type == 'null':
+        return NullCache()
+    raise ValueError(f'Unknown CACHE_TYPE: {cache_type}')
+
+def init_cache(app):
+    """Create the backend for `app` and hook invalidation into session commits"""
+    app.extensions[CACHE_KEY] = create_backend(app.config)
+    register_invalidation_listeners()
+
+def get_cache():
+    return current_app.extensions[CACHE_KEY]
+
+def data_version(tags):
+    """Current versions of `tags` (nanosecond times of their last invalidation)"""
+    return get_cache().tag_versions(sorted(tags))
+
+def cached(key, compute, tags=(), timeout=None):
+    """Return the cached value for `key`, or compute() and store it.
+
+    The entry is dropped once any of `tags` is invalidated. If the backend is
+    unreachable the value is computed on every call rather than failing.
+    """
+    backend = get_cache()
+    tags = sorted(tags)
+    try:
+        versions = backend.tag_versions(tags)
+        entry = backend.get(key)
+    except Exception as e:
+        logger.warning('Cache read failed for %s: %s', key, e)
+        return compute()
+
+    if entry is not None and entry[0] == versions:
+        return entry[1]
+
+    value = compute()
+    if timeout is None:
+        timeout = current_app.config.get('CACHE_DEFAULT_TIMEOUT', 300)
+    try:
+        backend.set(key, [versions, value], timeout)
+    except Exception as e:
+        logger.warning('Cache write failed for %s: %s', key, e)
+    return value
+
+def invalidate(*tags):
+    """Expire every entry stored under any of `tags`"""
+    if not tags or not has_app_context() or CACHE_KEY not in current_app.extensions:
+        return
+    try:
+        get_cache().bump_tags(sorted(set(tags)))
+    except Exception:
+        logger.error('Cache invalidation failed for %s', ', '.join(tags), exc_info=True)
+
+def _pending_tags(session):
+    return session.info.setdefault(PENDING_TAGS_KEY, set())
+
+def _after_flush(session, flush_context):
+    tables = _pending_tags(session)
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        table = getattr(obj, '__tablename__', None)
+        if table:
+            tables.add(table)
+
+def _do_orm_execute(orm_execute_state):
+    # Bulk insert/update/delete statements run through db.session.execute()
+    # and never show up in a flush
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, 'table', None)
+        if table is not None:
+            _pending_tags(orm_execute_state.session).add(table.name)
+
+def _after_commit(session):
+    tables = session.info.pop(PENDING_TAGS_KEY, None)
+    if tables:
+        invalidate(*tables)
+
+def _after_rollback(session):
+    session.info.pop(PENDING_TAGS_KEY, None)
+
+def register_invalidation_listeners():
+    """Invalidate the tags of tables written in every committed session"""
+    if event.contains(Session, 'after_commit', _after_commit):
+        return
+    event.listen(Session, 'after_flush', _after_flush)
+    event.listen(Session, 'do_orm_execute', _do_orm_execute)
+    event.listen(Session, 'after_commit', _after_commit)
+    event.listen(Session, 'after_rollback', _after_rollback)
@@ -0,0 +1,164 @@
+"""gzip/brotli compression of dynamic responses.
+
+Pages, JSON and CSV exports go out compressed when the browser accepts it,
+brotli first (if the Brotli package is installed), then gzip. Skipped:
+
+- bodies under COMPRESS_MIN_SIZE bytes, where the framing costs more than it saves
+- types outside COMPRESSIBLE_TYPES (images, PDFs, XLSX are compressed already)
+- responses that already have a Content-Encoding (precompressed /static/dist/)
+- file responses (send_file) and partial content
+- endpoints in COMPRESS_SKIP_ENDPOINTS and anything marked no-transform
+
+Streamed responses (CSV exports) are compressed chunk by chunk and flushed
+after each one, so the download still starts as soon as the first rows are
+ready. Bytes before and after compression are counted in
+nkolo_response_bytes_total; `python bench.py --compression` compares sizes
+and time to first byte per encoding.
+"""
+import logging
+import zlib
+
+from flask import request
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIBLE_TYPES = {
+    'text/html', 'text/css', 'text/javascript', 'text/plain', 'text/csv', 'text/xml',
+    'application/json', 'application/javascript', 'application/xml', 'image/svg+xml',
+}
+# Scraped over the local network every few seconds; compressing it only costs CPU
+DEFAULT_SKIP_ENDPOINTS = ('metrics',)
+
+_settings = {}
+
+class GzipEncoder:
+    name = 'gzip'
+
+    def __init__(self, level):
+        # wbits 16 + MAX_WBITS writes the gzip header and trailer
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush(zlib.Z_FINISH)
+
+class BrotliEncoder:
+    name = 'br'
+
+    def __init__(self, level):
+        import brotli
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+def _brotli_available():
+    try:
+        import brotli  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+def choose_encoder():
+    """Encoder for the best encoding the request accepts, or None"""
+    accepted = request.accept_encodings
+    candidates = []
+    if _settings['brotli'] and accepted['br']:
+        candidates.append((accepted['br'], 1, 'br'))
+    if accepted['gzip']:
+        candidates.append((accepted['gzip'], 0, 'gzip'))
+    if not candidates:
+        return None
+    # Highest quality wins; on a tie brotli, which is smaller
+    _, _, name = max(candidates)
+    if name == 'br':
+        return BrotliEncoder(_settings['br_level'])
+    return GzipEncoder(_settings['gzip_level'])
+
+def _compressible(response):
+    if response.status_code < 200 or response.status_code in (204, 206, 304):
+        return False
+    if request.method == 'HEAD' or request.endpoint in _settings['skip_endpoints']:
+        return False
+    if response.mimetype not in COMPRESSIBLE_TYPES:
+        return False
+    if 'Content-Encoding' in response.headers or 'Content-Range' in response.headers:
+        return False
+    if response.direct_passthrough or response.cache_control.no_transform:
+        return False
+    return True
+
+def _compress_stream(chunks, encoder):
+    sent = 0
+    original = 0
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        original += len(chunk)
+        data = encoder.compress(chunk) + encoder.flush()
+        sent += len(data)
+        if data:
+            yield data
+    data = encoder.finish()
+    sent += len(data)
+    yield data
+    _count(encoder.name, original, sent)
+
+def _count(encoding, original, sent):
+    metrics.RESPONSE_BYTES.labels(encoding, 'original').inc(original)
+    metrics.RESPONSE_BYTES.labels(encoding, 'sent').inc(sent)
+
+def compress_response(response):
+    if not _compressible(response):
+        return response
+    response.vary.add('Accept-Encoding')
+
+    if not response.is_streamed and response.calculate_content_length() < _settings['min_size']:
+        return response
+    encoder = choose_encoder()
+    if encoder is None:
+        return response
+
+    response.headers['Content-Encoding'] = encoder.name
+    # The body changes with the encoding, so a strong validator no longer fits
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+
+    if response.is_streamed:
+        response.response = _compress_stream(response.response, encoder)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        compressed = encoder.compress(data) + encoder.finish()
+        response.set_data(compressed)
+        _count(encoder.name, len(data), len(compressed))
+    return response
+
+def init_compression(app):
+    """Compress responses of `app` if COMPRESS_ENABLED"""
+    if not app.config.get('COMPRESS_ENABLED', True):
+        return
+    _settings.update(
+        min_size=app.config.get('COMPRESS_MIN_SIZE', 500),
+        gzip_level=app.config.get('COMPRESS_GZIP_LEVEL', 6),
+        br_level=app.config.get('COMPRESS_BR_LEVEL', 5),
+        skip_endpoints=set(app.config.get('COMPRESS_SKIP_ENDPOINTS') or DEFAULT_SKIP_ENDPOINTS),
+        brotli=_brotli_available(),
+    )
+    if not _settings['brotli']:
+        logger.info('Brotli not installed, compressing with gzip only')
+    app.after_request(compress_response)
@@ -12,7 +12,7 @@ ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB
 
 # Session Configuration
-SESSION_TYPE = 'filesystem'
+SESSION_TYPE = 'sqlalchemy'  # see sessions.py
 SESSION_PERMANENT = False
 PERMANENT_SESSION_LIFETIME = 3600  # 1 hour
 
@@ -0,0 +1,69 @@
+"""Schema creation and default data, run once per deploy instead of at import.
+
+    flask --app app migrate   # create missing tables, indexes, search index, audit triggers
+    flask --app app seed      # default bus types
+
+Both are idempotent. Workers never run them, so they start without touching
+the database and cannot race each other creating tables or seed rows.
+"""
+import logging
+
+import click
+from flask.cli import with_appcontext
+
+from models import db, BusType, ensure_indexes
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUS_TYPES = [
+    {
+        'name': 'VIP',
+        'category': 'vip',
+        'description': 'Premium bus with enhanced comfort and amenities',
+        'amenities': ['Air Conditioning', 'WiFi', 'Reclining Seats', 'Entertainment System', 'Refreshments'],
+    },
+    {
+        'name': 'Regular',
+        'category': 'regular',
+        'description': 'Standard bus service with basic amenities',
+        'amenities': ['Air Conditioning', 'Comfortable Seats'],
+    },
+]
+
+def migrate():
+    """Bring the schema up to date with the models"""
+    from search_index import ensure_search_index
+    from audit import ensure_audit_log
+
+    db.create_all()
+    ensure_indexes()
+    ensure_search_index()
+    ensure_audit_log()
+    logger.info('Database schema up to date')
+
+def seed_defaults():
+    """Create the default bus types if there are none yet; returns how many were added"""
+    if BusType.query.first():
+        return 0
+
+    for values in DEFAULT_BUS_TYPES:
+        bus_type = BusType(name=values['name'], category=values['category'], description=values['description'])
+        bus_type.set_amenities(values['amenities'])
+        db.session.add(bus_type)
+    db.session.commit()
+    logger.info('Default bus types created')
+    return len(DEFAULT_BUS_TYPES)
+
+@click.command('migrate')
+@with_appcontext
+def migrate_command():
+    """Create missing tables, indexes and triggers."""
+    migrate()
+    click.echo('Database schema up to date')
+
+@click.command('seed')
+@with_appcontext
+def seed_command():
+    """Create default bus types in an empty database."""
+    added = seed_defaults()
+    click.echo(f'Created {added} bus type(s)' if added else 'Bus types already present')
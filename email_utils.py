@@ -1,12 +1,11 @@
-import smtplib
 import os
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.mime.base import MIMEBase
-from email import encoders
 from datetime import datetime
 import io
 import base64
+import logging
+import metrics
+
+logger = logging.getLogger(__name__)
 
 def get_smtp_config():
     """Get SMTP configuration from environment variables"""
@@ -27,9 +26,14 @@ def send_test_email(to_email):
         config = get_smtp_config()
         
         if not all([config['server'], config['username'], config['password']]):
-            print("SMTP configuration incomplete")
+            logger.warning('SMTP configuration incomplete')
             return False
         
+        # Imported on first send rather than at worker startup
+        import smtplib
+        from email.mime.text import MIMEText
+        from email.mime.multipart import MIMEMultipart
+        
         # Create message
         msg = MIMEMultipart()
         msg['From'] = f"{config['from_name']} <{config['from_email']}>"
@@ -64,11 +68,11 @@ def send_test_email(to_email):
         server.send_message(msg)
         server.quit()
         
-        print(f"Test email sent successfully to {to_email}")
+        logger.info('Test email sent successfully to %s', to_email)
         return True
         
     except Exception as e:
-        print(f"Error sending test email: {str(e)}")
+        logger.warning('Error sending test email: %s', e)
         return False
 
 def generate_ticket_html(booking):
@@ -441,36 +445,45 @@ def generate_ticket_html(booking):
         return html_content
         
     except Exception as e:
-        print(f"Error generating ticket HTML: {str(e)}")
+        logger.exception('Error generating ticket HTML')
         return None
 
 def send_ticket_email(booking):
     """Send e-ticket to customer after successful payment"""
+    # Tickets are sent inline, so the outbox is the sends currently in progress
+    metrics.EMAIL_OUTBOX.inc()
     try:
         config = get_smtp_config()
         
         # Check if email tickets are enabled
         if not config['email_tickets']:
-            print("Email tickets are disabled")
+            logger.debug('Email tickets are disabled')
             return False
         
         # Check if SMTP is configured
         if not all([config['server'], config['username'], config['password']]):
-            print("SMTP configuration incomplete")
+            logger.warning('SMTP configuration incomplete')
             return False
         
         # Check if customer has email
         customer = booking.customer
         if not customer or not customer.email:
-            print("Customer email not available")
+            logger.debug('Customer email not available for booking %s', booking.id)
             return False
         
         # Generate ticket HTML
         ticket_html = generate_ticket_html(booking)
         if not ticket_html:
-            print("Failed to generate ticket HTML")
+            logger.warning('Failed to generate ticket HTML for booking %s', booking.id)
             return False
         
+        # Imported on first send rather than at worker startup
+        import smtplib
+        from email import encoders
+        from email.mime.base import MIMEBase
+        from email.mime.text import MIMEText
+        from email.mime.multipart import MIMEMultipart
+        
         # Create message
         msg = MIMEMultipart()
         msg['From'] = f"{config['from_name']} <{config['from_email']}>"
@@ -527,9 +540,13 @@ def send_ticket_email(booking):
         server.send_message(msg)
         server.quit()
         
-        print(f"Ticket email sent successfully to {customer.email}")
+        logger.info('Ticket email sent for booking %s', booking.id)
+        metrics.EMAILS.labels('sent').inc()
         return True
         
     except Exception as e:
-        print(f"Error sending ticket email: {str(e)}")
+        logger.warning('Error sending ticket email for booking %s: %s', booking.id, e)
+        metrics.EMAILS.labels('failed').inc()
         return False
+    finally:
+        metrics.EMAIL_OUTBOX.dec()
@@ -0,0 +1,274 @@
+"""Streaming CSV/XLSX exports for the admin panel.
+
+Rows are read with a server-side cursor (yield_per) and written out in
+chunks, so exporting a year of bookings keeps memory flat and the first
+bytes reach the browser immediately. XLSX files are assembled on the fly
+as a minimal SpreadsheetML zip with inline strings; no spreadsheet
+library is needed.
+"""
+import csv
+import io
+import re
+import zipfile
+from datetime import datetime, date
+from xml.sax.saxutils import escape
+
+from sqlalchemy import select, func
+
+from models import db, Trip, Booking, Customer, Route, Operator, BusType, parse_seat_numbers
+
+EXPORT_FORMATS = ['csv', 'xlsx']
+CHUNK_ROWS = 1000
+
+MIMETYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+}
+
+def _format_value(value):
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M')
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+def _stream(statement):
+    """Execute `statement` with a server-side cursor, CHUNK_ROWS at a time"""
+    return db.session.execute(statement.execution_options(yield_per=CHUNK_ROWS))
+
+# Row sources: each returns (header, iterator of row tuples)
+
+def booking_rows(conditions):
+    header = ['Reference', 'Booked At', 'Customer', 'Email', 'Phone', 'Route', 'Operator',
+              'Departure', 'Seats', 'Seat Count', 'Amount (FCFA)', 'Payment Status',
+              'Payment Method', 'Payment Reference', 'Status']
+    statement = select(
+        Booking.booking_reference, Booking.created_at, Customer.name, Customer.email, Customer.phone,
+        Route.origin, Route.destination, Operator.name, Trip.departure_time, Booking.seat_numbers,
+        Booking.total_amount, Booking.payment_status, Booking.payment_method,
+        Booking.payment_reference, Booking.status
+    ).join(Customer, Customer.id == Booking.customer_id) \
+     .join(Trip, Trip.id == Booking.trip_id) \
+     .join(Route, Route.id == Trip.route_id) \
+     .join(Operator, Operator.id == Trip.operator_id) \
+     .where(*conditions) \
+     .order_by(Booking.created_at.desc(), Booking.id.desc())
+
+    def rows():
+        for row in _stream(statement):
+            (reference, created_at, name, email, phone, origin, destination, operator, departure,
+             seat_numbers, amount, payment_status, payment_method, payment_reference, status) = tuple(row)
+            seats = parse_seat_numbers(seat_numbers)
+            yield (reference, created_at, name, email, phone, f'{origin} - {destination}', operator,
+                   departure, ', '.join(seats), len(seats), amount, payment_status, payment_method,
+                   payment_reference, status)
+
+    return header, rows()
+
+def trip_rows(conditions):
+    header = ['Trip ID', 'Route', 'Operator', 'Bus Type', 'Bus', 'Departure', 'Arrival',
+              'Seat Price (FCFA)', 'Available Seats', 'Bookings', 'Status']
+    booking_counts = select(Booking.trip_id, func.count(Booking.id).label('bookings')) \
+        .group_by(Booking.trip_id).subquery()
+    statement = select(
+        Trip.id, Route.origin, Route.destination, Operator.name, BusType.name, Trip.virtual_bus_id,
+        Trip.departure_time, Trip.arrival_time, Trip.seat_price, Trip.available_seats,
+        func.coalesce(booking_counts.c.bookings, 0), Trip.status
+    ).join(Route, Route.id == Trip.route_id) \
+     .join(Operator, Operator.id == Trip.operator_id) \
+     .outerjoin(BusType, BusType.id == Trip.bus_type_id) \
+     .outerjoin(booking_counts, booking_counts.c.trip_id == Trip.id) \
+     .where(*conditions) \
+     .order_by(Trip.departure_time.desc(), Trip.id.desc())
+
+    def rows():
+        for row in _stream(statement):
+            (trip_id, origin, destination, operator, bus_type, bus, departure, arrival,
+             price, available, bookings, status) = tuple(row)
+            yield (trip_id, f'{origin} - {destination}', operator, bus_type, bus, departure, arrival,
+                   price, available, bookings, status)
+
+    return header, rows()
+
+def settlement_rows(conditions):
+    """Per-trip settlement: paid and refunded totals owed to each operator.
+
+    Bookings are streamed in (departure, trip) order and summed trip by
+    trip, so only one trip's totals are held at a time.
+    """
+    header = ['Date', 'Operator', 'Operator Code', 'Route', 'Departure', 'Trip ID',
+              'Paid Bookings', 'Seats Sold', 'Gross Revenue (FCFA)', 'Refunded Bookings',
+              'Refunded Amount (FCFA)']
+    statement = select(
+        Trip.id, Trip.departure_time, Operator.name, Operator.code, Route.origin, Route.destination,
+        Booking.payment_status, Booking.seat_numbers, Booking.total_amount
+    ).join(Trip, Trip.id == Booking.trip_id) \
+     .join(Route, Route.id == Trip.route_id) \
+     .join(Operator, Operator.id == Trip.operator_id) \
+     .where(*conditions, Booking.payment_status.in_(['paid', 'refunded'])) \
+     .order_by(Trip.departure_time, Trip.id)
+
+    def rows():
+        current = None
+        for row in _stream(statement):
+            trip_id, departure, operator, code, origin, destination, payment_status, seat_numbers, amount = tuple(row)
+            if current is None or current['trip_id'] != trip_id:
+                if current is not None:
+                    yield _settlement_row(current)
+                current = {'trip_id': trip_id, 'departure': departure, 'operator': operator, 'code': code,
+                           'route': f'{origin} - {destination}', 'paid': 0, 'seats': 0, 'gross': 0.0,
+                           'refunded': 0, 'refunded_amount': 0.0}
+            if payment_status == 'paid':
+                current['paid'] += 1
+                current['seats'] += len(parse_seat_numbers(seat_numbers))
+                current['gross'] += amount or 0
+            else:
+                current['refunded'] += 1
+                current['refunded_amount'] += amount or 0
+        if current is not None:
+            yield _settlement_row(current)
+
+    return header, rows()
+
+def _settlement_row(totals):
+    return (totals['departure'].date(), totals['operator'], totals['code'], totals['route'],
+            totals['departure'], totals['trip_id'], totals['paid'], totals['seats'], totals['gross'],
+            totals['refunded'], totals['refunded_amount'])
+
+# Writers: each yields bytes
+
+def write_csv(header, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM so Excel opens accented names (Yaoundé, Bafoussam...) correctly
+    buffer.write('\ufeff')
+    writer.writerow(header)
+
+    for count, row in enumerate(rows, start=1):
+        writer.writerow([_format_value(value) for value in row])
+        if count % CHUNK_ROWS == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue().encode('utf-8')
+
+class _ChunkSink:
+    """Write-only file object collecting zip output between yields"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+_INVALID_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+def _column_letter(index):
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+def _xlsx_row(row_number, values):
+    cells = []
+    for index, value in enumerate(values):
+        ref = f'{_column_letter(index)}{row_number}'
+        value = _format_value(value)
+        if value is None:
+            continue
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            cells.append(f'<c r="{ref}"><v>{value}</v></c>')
+        else:
+            text = escape(_INVALID_XML_CHARS.sub('', str(value)))
+            cells.append(f'<c r="{ref}" t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>')
+    return f'<row r="{row_number}">{"".join(cells)}</row>'
+
+_XLSX_STATIC_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+def write_xlsx(header, rows, sheet_name='Export'):
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in _XLSX_STATIC_PARTS.items():
+            archive.writestr(name, content)
+        archive.writestr('xl/workbook.xml', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            f'<sheets><sheet name="{escape(sheet_name[:31])}" sheetId="1" r:id="rId1"/></sheets>'
+            '</workbook>'
+        ))
+        yield sink.drain()
+
+        with archive.open('xl/worksheets/sheet1.xml', 'w') as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            sheet.write(_xlsx_row(1, header).encode('utf-8'))
+            for row_number, row in enumerate(rows, start=2):
+                sheet.write(_xlsx_row(row_number, row).encode('utf-8'))
+                if row_number % CHUNK_ROWS == 0:
+                    yield sink.drain()
+            sheet.write(b'</sheetData></worksheet>')
+
+    yield sink.drain()
+
+ROW_SOURCES = {
+    'bookings': booking_rows,
+    'trips': trip_rows,
+    'settlement': settlement_rows
+}
+
+def export_stream(kind, conditions, export_format='csv'):
+    """Return (bytes generator, mimetype, filename) for an export"""
+    if kind not in ROW_SOURCES:
+        raise ValueError(f'Unknown export: {kind}')
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f'Unsupported export format: {export_format}')
+
+    header, rows = ROW_SOURCES[kind](conditions)
+    filename = f"{kind}_{datetime.now().strftime('%Y%m%d_%H%M')}.{export_format}"
+    if export_format == 'xlsx':
+        body = write_xlsx(header, rows, sheet_name=kind.title())
+    else:
+        body = write_csv(header, rows)
+    return body, MIMETYPES[export_format], filename
@@ -0,0 +1,19 @@
+"""gunicorn settings: keep Prometheus multiprocess metrics consistent.
+
+Run with PROMETHEUS_MULTIPROC_DIR set, e.g.
+    PROMETHEUS_MULTIPROC_DIR=/tmp/nkolo_metrics gunicorn app:app
+"""
+import os
+import shutil
+
+def on_starting(server):
+    # Samples from a previous run would otherwise be added to the new ones
+    directory = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory, exist_ok=True)
+
+def child_exit(server, worker):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
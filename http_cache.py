@@ -0,0 +1,76 @@
+"""HTTP validators for near-static JSON endpoints.
+
+    @user_bp.route('/api/routes')
+    @conditional(tags=ROUTES_CACHE_TAGS, max_age=300)
+    def api_routes(): ...
+
+The ETag and Last-Modified of a response come from the data version of its
+cache tags (see cache.data_version): the time the tables behind it were last
+written, normally by an admin edit. A repeat request carrying a matching
+If-None-Match (or If-Modified-Since) gets a 304 before the view runs, so it
+costs neither a query nor the body on the customer's mobile data.
+
+Responses whose content also depends on the clock (upcoming trips) pass
+`period`: the ETag then changes at least every `period` seconds, and there is
+no Last-Modified, which couldn't express that.
+
+The ETags are weak, since the body may be re-encoded by compression. With the
+per-worker 'simple' cache each worker only sees its own writes; use
+CACHE_TYPE=redis with several workers.
+"""
+import hashlib
+import json
+import logging
+import time
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import make_response, request
+
+from cache import data_version
+
+logger = logging.getLogger(__name__)
+
+def _validators(tags, period):
+    versions = data_version(tags)
+    # The path and query string distinguish e.g. route-operators for different routes
+    key = [request.full_path, versions]
+    if period:
+        key.append(int(time.time() // period))
+    etag = hashlib.sha1(json.dumps(key).encode()).hexdigest()[:20]
+    if period:
+        return etag, None
+    return etag, datetime.fromtimestamp(max(versions) // 10 ** 9, timezone.utc)
+
+def _not_modified(etag, last_modified):
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if last_modified is None or request.if_modified_since is None:
+        return False
+    return request.if_modified_since >= last_modified
+
+def conditional(tags, max_age=60, period=None):
+    """Add ETag, Last-Modified and Cache-Control to a GET view and answer revalidations with 304"""
+    def decorator(view):
+        @wraps(view)
+        def decorated_function(*args, **kwargs):
+            try:
+                etag, last_modified = _validators(tags, period)
+            except Exception as e:
+                logger.warning('No data version for %s: %s', request.path, e)
+                return view(*args, **kwargs)
+
+            if _not_modified(etag, last_modified):
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            if last_modified:
+                response.last_modified = last_modified
+            response.cache_control.public = True
+            response.cache_control.max_age = max_age
+            return response
+        return decorated_function
+    return decorator
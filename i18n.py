@@ -0,0 +1,112 @@
+"""Translation catalogs and the per-language JavaScript bundles built from them.
+
+translations/<lang>/LC_MESSAGES/messages.po holds the interface strings, keyed
+by id ('nav.home'), one catalog per language. ``flask --app app build-assets``
+compiles each one to messages.mo, the form Flask-Babel loads, and builds
+js/translations.<lang>.js: that language's strings followed by the
+static/js/translations.js runtime, minified, hashed and precompressed like the
+other assets. A page that needs translated strings in JavaScript loads
+
+    <script src="{{ translations_url() }}"></script>
+
+and gets only its own language (window.__('nav.home')). Without a build the
+bundle is served from /static/i18n/<lang>.js, built from the catalogs once per
+worker.
+"""
+import hashlib
+import json
+import os
+
+from babel.messages.mofile import read_mo, write_mo
+from babel.messages.pofile import read_po
+from flask import abort, current_app, make_response, request, url_for
+from flask_babel import get_locale
+
+CATALOG_DIR = 'translations'
+CATALOG_DOMAIN = 'messages'
+RUNTIME = 'js/translations.js'
+
+_catalogs = {}  # lang -> {msgid: translation}
+_bundles = {}  # lang -> (etag, source)
+
+def _catalog_path(directory, lang, extension):
+    return os.path.join(directory, lang, 'LC_MESSAGES', CATALOG_DOMAIN + extension)
+
+def catalog_languages(directory):
+    return sorted(lang for lang in os.listdir(directory) if os.path.isfile(_catalog_path(directory, lang, '.po')))
+
+def compile_catalogs(directory):
+    """Compile every messages.po under `directory` to messages.mo; returns [(lang, message count)]"""
+    compiled = []
+    for lang in catalog_languages(directory):
+        with open(_catalog_path(directory, lang, '.po'), 'rb') as f:
+            catalog = read_po(f, locale=lang)
+        with open(_catalog_path(directory, lang, '.mo'), 'wb') as f:
+            write_mo(f, catalog)
+        compiled.append((lang, len(catalog)))
+    return compiled
+
+def read_catalog(directory, lang):
+    """{msgid: translation} from the compiled catalog, or from the .po source if it is newer"""
+    po = _catalog_path(directory, lang, '.po')
+    mo = _catalog_path(directory, lang, '.mo')
+    if os.path.isfile(mo) and os.path.getmtime(mo) >= os.path.getmtime(po):
+        with open(mo, 'rb') as f:
+            catalog = read_mo(f)
+    else:
+        with open(po, 'rb') as f:
+            catalog = read_po(f, locale=lang)
+    return {message.id: message.string for message in catalog if message.id and message.string}
+
+def bundle_source(static_folder, messages):
+    """JavaScript for one language: its `messages`, then the translations.js runtime"""
+    with open(os.path.join(static_folder, RUNTIME), encoding='utf-8') as f:
+        runtime = f.read()
+    strings = json.dumps(messages, ensure_ascii=False, separators=(',', ':'), sort_keys=True)
+    return f'window.NKOLO_TRANSLATIONS={strings};\n{runtime}'
+
+def translation_bundles(app):
+    """{'js/translations.<lang>.js': source} for every catalog, for the asset build"""
+    directory = os.path.join(app.root_path, CATALOG_DIR)
+    return {
+        f'js/translations.{lang}.js': bundle_source(app.static_folder, read_catalog(directory, lang))
+        for lang in catalog_languages(directory)
+    }
+
+def load_catalog(lang):
+    """{msgid: translation} for `lang`, read once per worker"""
+    if lang not in _catalogs:
+        _catalogs[lang] = read_catalog(os.path.join(current_app.root_path, CATALOG_DIR), lang)
+    return _catalogs[lang]
+
+def translations_url(lang=None):
+    """URL of the translation bundle for `lang` (default: the page's language)"""
+    from assets import load_manifest
+
+    lang = lang or str(get_locale())
+    built = load_manifest().get(f'js/translations.{lang}.js')
+    if built:
+        return url_for('static', filename=built)
+    return url_for('i18n_bundle', lang=lang)
+
+def serve_bundle(lang):
+    """Unbuilt translation bundle, for development and deploys without build-assets"""
+    if lang not in current_app.config['LANGUAGES']:
+        abort(404)
+    if lang not in _bundles:
+        source = bundle_source(current_app.static_folder, load_catalog(lang))
+        _bundles[lang] = (hashlib.sha1(source.encode('utf-8')).hexdigest()[:20], source)
+    etag, source = _bundles[lang]
+    response = make_response(source)
+    response.mimetype = 'text/javascript'
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = 300
+    return response.make_conditional(request)
+
+def init_i18n(app):
+    """Serve unbuilt translation bundles and make translations_url() available to templates"""
+    _catalogs.clear()
+    _bundles.clear()
+    app.add_url_rule(f'{app.static_url_path}/i18n/<lang>.js', 'i18n_bundle', serve_bundle)
+    app.add_template_global(translations_url)
@@ -0,0 +1,131 @@
+"""Seat inventory: holds and confirmations, serialized per trip.
+
+Checking that seats are free and then writing the hold (or confirming a
+booking and taking its seats off the trip) has to happen atomically, or two
+customers can end up with the same seat. lock_trip() takes a lock that lasts
+until the session's transaction ends:
+
+- SQLite: BEGIN IMMEDIATE, i.e. the database write lock, taken before the
+  availability check rather than at the first write.
+- PostgreSQL: pg_advisory_xact_lock on the trip id, so holds and
+  confirmations on different trips don't wait for each other.
+- Other backends: SELECT ... FOR UPDATE on the trip row.
+
+Expired holds are deleted with FOR UPDATE SKIP LOCKED (a no-op on SQLite),
+so concurrent cleanups skip rows another transaction is already removing.
+"""
+import logging
+from datetime import datetime
+
+from sqlalchemy import delete, select, text
+
+from models import db, Booking, SeatBlock, Trip, parse_seat_numbers
+
+logger = logging.getLogger(__name__)
+
+HOLD_MINUTES = 6
+# First half of the two-key advisory lock, keeping trip ids apart from other lock users
+TRIP_LOCK_NAMESPACE = 1001
+
+class SeatUnavailable(Exception):
+    def __init__(self, seat):
+        super().__init__(f'Seat {seat} is no longer available')
+        self.seat = seat
+
+def lock_trip(trip_id):
+    """Serialize seat changes on `trip_id` until db.session commits or rolls back"""
+    connection = db.session.connection()
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        # pysqlite only opens a transaction before the first write, and once one
+        # is open the write lock is already held
+        if not connection.connection.dbapi_connection.in_transaction:
+            connection.exec_driver_sql('BEGIN IMMEDIATE')
+    elif dialect == 'postgresql':
+        connection.execute(text('SELECT pg_advisory_xact_lock(:namespace, :trip_id)'),
+                           {'namespace': TRIP_LOCK_NAMESPACE, 'trip_id': trip_id})
+    else:
+        connection.execute(select(Trip.id).where(Trip.id == trip_id).with_for_update())
+
+def unavailable_seats(trip_id, exclude_session=None, session=None):
+    """Seat numbers (as strings) booked on the trip or held by another browser session"""
+    session = session or db.session
+    taken = set()
+    booked = select(Booking.seat_numbers).where(Booking.trip_id == trip_id, Booking.status == 'confirmed')
+    for seat_numbers in session.scalars(booked):
+        taken.update(parse_seat_numbers(seat_numbers))
+
+    held = select(SeatBlock.seat_numbers).where(SeatBlock.trip_id == trip_id, SeatBlock.expires_at > datetime.utcnow())
+    if exclude_session:
+        held = held.where(SeatBlock.session_id != exclude_session)
+    for seat_numbers in session.scalars(held):
+        taken.update(parse_seat_numbers(seat_numbers))
+    return taken
+
+def release_expired_holds(trip_id=None):
+    """Delete expired holds, of one trip or all; returns how many. Doesn't commit."""
+    expired = select(SeatBlock.id).where(SeatBlock.expires_at < datetime.utcnow())
+    if trip_id is not None:
+        expired = expired.where(SeatBlock.trip_id == trip_id)
+    result = db.session.execute(
+        delete(SeatBlock).where(SeatBlock.id.in_(expired.with_for_update(skip_locked=True)))
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+def hold_seats(trip_id, seats, session_id, minutes=HOLD_MINUTES):
+    """Hold `seats` for a browser session, replacing its previous hold on the trip.
+
+    Raises SeatUnavailable if a seat is booked or held by another session.
+    """
+    lock_trip(trip_id)
+    try:
+        release_expired_holds(trip_id)
+        taken = unavailable_seats(trip_id, exclude_session=session_id)
+        for seat in seats:
+            if str(seat) in taken:
+                raise SeatUnavailable(seat)
+
+        db.session.execute(
+            delete(SeatBlock).where(SeatBlock.trip_id == trip_id, SeatBlock.session_id == session_id)
+            .execution_options(synchronize_session=False)
+        )
+        block = SeatBlock(trip_id, seats, session_id, duration_minutes=minutes)
+        db.session.add(block)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return block
+
+def confirm_booking(booking, **fields):
+    """Mark a booking paid and confirmed and take its seats off the trip.
+
+    `fields` are set on the booking as well (payment_reference, payment_method).
+    Returns False, changing nothing, if it was already confirmed: the payment
+    page, status polling and the webhook can all see the same SUCCESS.
+    """
+    trip_id = booking.trip_id
+    lock_trip(trip_id)
+    try:
+        # Re-read under the lock; another worker may have confirmed it meanwhile
+        booking = db.session.get(Booking, booking.id, populate_existing=True, with_for_update=True)
+        if booking.status == 'confirmed':
+            db.session.commit()
+            return False
+
+        booking.payment_status = 'paid'
+        booking.status = 'confirmed'
+        for name, value in fields.items():
+            setattr(booking, name, value)
+
+        trip = db.session.get(Trip, trip_id, populate_existing=True)
+        if trip:
+            trip.available_seats -= len(booking.get_seat_numbers())
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    logger.info('Booking %s confirmed', booking.id, extra={'booking_id': booking.id, 'trip_id': trip_id})
+    return True
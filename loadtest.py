@@ -0,0 +1,341 @@
+"""Load test for the booking funnel.
+
+Each virtual user loops through what a customer does: load the route list,
+pick an origin/destination and operator, search trips for a date, open the
+seat map, reserve free seats (/api/select-seats), submit passenger details
+and pay. The app must run with the payment stand-in so no real payment is
+attempted: standin_app() is the application with MeSomb replaced, for
+gunicorn only. The production entry point (app:app) has no stand-in.
+
+    # 1. Seed a throwaway database
+    python loadtest.py seed --database sqlite:////tmp/loadtest.db
+
+    # 2. Run the app against it with the payment stand-in
+    PAYMENT_STANDIN=success PAYMENT_STANDIN_LATENCY_MS=500 RATE_LIMIT_ENABLED=false \\
+        DATABASE_URL=sqlite:////tmp/loadtest.db gunicorn -w 4 -b 127.0.0.1:8000 'loadtest:standin_app()'
+
+    # 3. Generate load, save the result as a baseline, compare later runs with it
+    python loadtest.py run --base-url http://127.0.0.1:8000 --users 20 --duration 60 --save-baseline v1.4
+    python loadtest.py run --base-url http://127.0.0.1:8000 --users 20 --duration 60 --compare v1.4
+
+Per step it reports requests, throughput, latency percentiles, errors
+(connection failures and 5xx) and rejections (4xx, e.g. a seat taken by
+another user in the meantime).
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+import requests
+
+STEPS = ['routes', 'route_operators', 'search', 'seat_map', 'select_seats', 'passenger_details', 'payment']
+PERCENTILES = [50, 90, 95, 99]
+BASELINE_DIR = 'loadtest_baselines'
+BOOKED_SEATS_PATTERN = re.compile(r"const booked = JSON\.parse\('(.*?)'\)")
+
+class Recorder:
+    """Latencies and outcomes per step, shared by all virtual users"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {step: [] for step in STEPS}
+        self.errors = {step: 0 for step in STEPS}
+        self.rejected = {step: 0 for step in STEPS}
+        self.funnels_completed = 0
+
+    def record(self, step, seconds, status):
+        with self.lock:
+            self.latencies[step].append(seconds)
+            if status is None or status >= 500:
+                self.errors[step] += 1
+            elif status >= 400:
+                self.rejected[step] += 1
+
+class StandInPaymentOperation:
+    """Offline replacement for pymesomb's PaymentOperation.
+
+    Answers every collect with `outcome` (success, failed or pending) after
+    `latency_ms`, to imitate the provider.
+    """
+
+    def __init__(self, outcome, latency_ms):
+        self.outcome = outcome.upper()
+        self.latency_ms = latency_ms
+
+    def make_collect(self, amount, service, payer, trx_id, **kwargs):
+        time.sleep(self.latency_ms / 1000)
+
+        class _Response:
+            pass
+
+        response = _Response()
+        response._data = {'transaction': {
+            'pk': f'standin-{trx_id}',
+            'status': self.outcome,
+            'amount': amount,
+            'fees': 0,
+            'service': service,
+            'reference': trx_id,
+        }}
+        return response
+
+def standin_app():
+    """The application with every MeSomb client replaced by StandInPaymentOperation.
+
+    For gunicorn ('loadtest:standin_app()') against a load test database only:
+    payments are not collected. The outcome and latency come from
+    PAYMENT_STANDIN (default success) and PAYMENT_STANDIN_LATENCY_MS (default 500).
+    """
+    import mesomb_payment
+
+    outcome = os.environ.get('PAYMENT_STANDIN', 'success')
+    latency_ms = float(os.environ.get('PAYMENT_STANDIN_LATENCY_MS', 500))
+
+    class StandInMesombPayment(mesomb_payment.MesombPayment):
+        def __init__(self, *args, **kwargs):
+            self.application_key = self.access_key = self.secret_key = None
+            self.client = StandInPaymentOperation(outcome, latency_ms)
+
+    # get_mesomb_client() looks the class up on every call
+    mesomb_payment.MesombPayment = StandInMesombPayment
+
+    from app import app
+    app.logger.warning('Load test stand-in: payments answer %s and are not collected', outcome)
+    return app
+
+def _percentile(values, percentile):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(percentile / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+class VirtualUser(threading.Thread):
+    def __init__(self, base_url, recorder, deadline, days, lang, rng):
+        super().__init__(daemon=True)
+        self.base_url = base_url.rstrip('/')
+        self.recorder = recorder
+        self.deadline = deadline
+        self.days = days
+        self.lang = lang
+        self.rng = rng
+        self.http = requests.Session()
+
+    def call(self, step, method, path, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = self.http.request(method, self.base_url + path, allow_redirects=False, timeout=60, **kwargs)
+        except requests.RequestException:
+            self.recorder.record(step, time.perf_counter() - started, None)
+            return None
+        self.recorder.record(step, time.perf_counter() - started, response.status_code)
+        return response
+
+    def funnel(self):
+        response = self.call('routes', 'GET', '/api/routes')
+        if response is None or response.status_code != 200:
+            return
+        cities = response.json()
+        origin = self.rng.choice(cities['from'])
+        destinations = [city for city in cities['to'] if city != origin]
+        if not destinations:
+            return
+        destination = self.rng.choice(destinations)
+
+        response = self.call('route_operators', 'GET', '/api/route-operators', params={'from': origin, 'to': destination})
+        if response is None or response.status_code != 200 or not response.json():
+            return
+        operator = self.rng.choice(response.json())
+
+        travel_date = date.today() + timedelta(days=self.rng.randint(1, self.days))
+        response = self.call('search', 'GET', '/api/search-trips', params={
+            'from': origin, 'to': destination, 'operator': operator['id'], 'date': travel_date.isoformat()
+        })
+        if response is None or response.status_code != 200:
+            return
+        trips = [trip for trip in response.json().get('trips', []) if trip['available_seats'] > 0]
+        if not trips:
+            return
+        trip = self.rng.choice(trips)
+
+        response = self.call('seat_map', 'GET', f'/{self.lang}/booking/seats', params={'trip': trip['id']})
+        if response is None or response.status_code != 200:
+            return
+        match = BOOKED_SEATS_PATTERN.search(response.text)
+        booked = {str(seat) for seat in json.loads(match.group(1))} if match else set()
+        free = [str(seat) for seat in range(1, trip['total_seats'] + 1) if str(seat) not in booked]
+        if not free:
+            return
+        seats = self.rng.sample(free, min(len(free), self.rng.randint(1, 3)))
+
+        response = self.call('select_seats', 'POST', '/api/select-seats', json={'trip_id': trip['id'], 'seats': seats})
+        if response is None or response.status_code != 200:
+            return
+
+        number = self.rng.randint(0, 9999999)
+        response = self.call('passenger_details', 'POST', f'/{self.lang}/booking/passenger-details', data={
+            'name': f'Load Test {number}', 'email': f'loadtest{number}@example.com', 'phone': f'67{number:07d}',
+        })
+        if response is None or response.status_code >= 400:
+            return
+
+        response = self.call('payment', 'POST', f'/{self.lang}/booking/payment', data={
+            'payment_service': self.rng.choice(['MTN', 'ORANGE']), 'payment_phone': f'67{number:07d}',
+        }, headers={'X-Requested-With': 'XMLHttpRequest'})
+        if response is not None and response.status_code < 400:
+            with self.recorder.lock:
+                self.recorder.funnels_completed += 1
+
+    def run(self):
+        while time.monotonic() < self.deadline:
+            self.funnel()
+            # A fresh cookie jar per funnel, like a new customer
+            self.http.cookies.clear()
+
+def run_load(base_url, users, duration, ramp_up, days, lang, seed):
+    recorder = Recorder()
+    rng = random.Random(seed)
+    started = time.monotonic()
+    deadline = started + duration
+    threads = []
+    for index in range(users):
+        thread = VirtualUser(base_url, recorder, deadline, days, lang, random.Random(rng.random()))
+        thread.start()
+        threads.append(thread)
+        if ramp_up:
+            time.sleep(ramp_up / users)
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    steps = {}
+    for step in STEPS:
+        latencies = recorder.latencies[step]
+        if not latencies:
+            continue
+        steps[step] = {
+            'requests': len(latencies),
+            'throughput_rps': len(latencies) / elapsed,
+            'error_rate': recorder.errors[step] / len(latencies),
+            'rejected_rate': recorder.rejected[step] / len(latencies),
+            'mean_ms': sum(latencies) / len(latencies) * 1000,
+            'max_ms': max(latencies) * 1000,
+            **{f'p{p}_ms': _percentile(latencies, p) * 1000 for p in PERCENTILES},
+        }
+    return {
+        'run_at': datetime.utcnow().isoformat(timespec='seconds'),
+        'base_url': base_url,
+        'users': users,
+        'duration_s': round(elapsed, 1),
+        'funnels_completed': recorder.funnels_completed,
+        'funnels_per_minute': recorder.funnels_completed / elapsed * 60,
+        'steps': steps,
+    }
+
+def print_report(result, baseline=None):
+    print(f"{result['users']} users for {result['duration_s']}s: "
+          f"{result['funnels_completed']} bookings ({result['funnels_per_minute']:.1f}/min)")
+    header = f"{'step':<18}{'reqs':>7}{'rps':>8}{'p50':>9}{'p90':>9}{'p95':>9}{'p99':>9}{'max':>9}{'err%':>7}{'rej%':>7}"
+    print(header)
+    print('-' * len(header))
+    for step, stats in result['steps'].items():
+        print(f"{step:<18}{stats['requests']:>7}{stats['throughput_rps']:>8.1f}"
+              f"{stats['p50_ms']:>9.1f}{stats['p90_ms']:>9.1f}{stats['p95_ms']:>9.1f}{stats['p99_ms']:>9.1f}"
+              f"{stats['max_ms']:>9.1f}{stats['error_rate'] * 100:>7.1f}{stats['rejected_rate'] * 100:>7.1f}")
+        if baseline and step in baseline['steps']:
+            before = baseline['steps'][step]
+            print(f"{'  vs baseline':<18}{'':>7}{_change(before['throughput_rps'], stats['throughput_rps']):>8}"
+                  f"{_change(before['p50_ms'], stats['p50_ms']):>9}{'':>9}{_change(before['p95_ms'], stats['p95_ms']):>9}"
+                  f"{_change(before['p99_ms'], stats['p99_ms']):>9}")
+
+def _change(before, after):
+    if not before:
+        return ''
+    return f'{(after - before) / before * 100:+.0f}%'
+
+def regressions(result, baseline, tolerance):
+    """Steps whose p95 grew, or error rate rose, beyond `tolerance` (a fraction)"""
+    found = []
+    for step, stats in result['steps'].items():
+        before = baseline['steps'].get(step)
+        if not before:
+            continue
+        if before['p95_ms'] and stats['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            found.append(f"{step}: p95 {before['p95_ms']:.0f} -> {stats['p95_ms']:.0f} ms")
+        if stats['error_rate'] > before['error_rate'] + 0.01:
+            found.append(f"{step}: error rate {before['error_rate']:.1%} -> {stats['error_rate']:.1%}")
+    return found
+
+def _baseline_path(directory, name):
+    return os.path.join(directory, f'{name}.json')
+
+def seed_command(args):
+    os.environ['DATABASE_URL'] = args.database
+    from app import app
+    from db_setup import migrate
+    from seed_data import seed_dataset
+    with app.app_context():
+        migrate()
+        counts = seed_dataset(cities=args.cities, operators=args.operators, days=args.days,
+                              departures_per_day=args.departures, fill=args.fill, seed=args.seed)
+    print(', '.join(f'{count} {table}' for table, count in counts.items()))
+
+def run_command(args):
+    baseline = None
+    if args.compare:
+        with open(_baseline_path(args.baseline_dir, args.compare)) as f:
+            baseline = json.load(f)
+
+    result = run_load(args.base_url, args.users, args.duration, args.ramp_up, args.days, args.lang, args.seed)
+    print_report(result, baseline)
+
+    if args.save_baseline:
+        os.makedirs(args.baseline_dir, exist_ok=True)
+        with open(_baseline_path(args.baseline_dir, args.save_baseline), 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f'Saved baseline {args.save_baseline}')
+
+    if baseline:
+        found = regressions(result, baseline, args.tolerance)
+        for line in found:
+            print(f'REGRESSION {line}')
+        return 1 if found else 0
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    seed = commands.add_parser('seed', help='Create the load test dataset in an empty database')
+    seed.add_argument('--database', required=True, help='SQLAlchemy URL, e.g. sqlite:////tmp/loadtest.db')
+    seed.add_argument('--cities', type=int, default=6)
+    seed.add_argument('--operators', type=int, default=4)
+    seed.add_argument('--days', type=int, default=14)
+    seed.add_argument('--departures', type=int, default=4, help='Departure times per day')
+    seed.add_argument('--fill', type=float, default=0.3, help='Share of seats already booked')
+    seed.add_argument('--seed', type=int, default=42)
+    seed.set_defaults(handler=seed_command)
+
+    run = commands.add_parser('run', help='Generate load against a running app')
+    run.add_argument('--base-url', default='http://127.0.0.1:5000')
+    run.add_argument('--users', type=int, default=10, help='Concurrent virtual users')
+    run.add_argument('--duration', type=float, default=60, help='Seconds')
+    run.add_argument('--ramp-up', type=float, default=5, help='Seconds to start all users')
+    run.add_argument('--days', type=int, default=7, help='Search dates within this many days')
+    run.add_argument('--lang', default='fr')
+    run.add_argument('--seed', type=int, default=1)
+    run.add_argument('--baseline-dir', default=BASELINE_DIR)
+    run.add_argument('--save-baseline', metavar='NAME')
+    run.add_argument('--compare', metavar='NAME', help='Baseline to compare with; exit 1 on regressions')
+    run.add_argument('--tolerance', type=float, default=0.2, help='Allowed p95 growth before flagging (0.2 = 20%%)')
+    run.set_defaults(handler=run_command)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
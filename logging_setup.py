@@ -0,0 +1,147 @@
+"""Structured, leveled logging.
+
+Modules log through ``logging.getLogger(__name__)``. configure_logging()
+installs a single QueueHandler on the root logger, so request threads only
+enqueue records; a QueueListener thread formats them (JSON by default) and
+writes them to stdout.
+
+Configuration (app.config / environment):
+    LOG_LEVEL         root level, default INFO
+    LOG_FORMAT        'json' or 'text'
+    LOG_LEVELS        per-module levels, e.g. "user_routes=DEBUG,sqlalchemy.engine=WARNING"
+    LOG_SAMPLE_RATES  fraction of DEBUG/INFO records kept per module, e.g. "user_routes=0.1"
+
+A single call can also be sampled with ``extra={'sample_rate': 0.01}``.
+Warnings and errors are never sampled out.
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+
+from flask import has_request_context, request
+
+# Attributes every LogRecord has; anything else came in through `extra`
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'sample_rate'}
+
+_listener = None
+
+def parse_setting(value, convert=str):
+    """'a=1,b.c=2' -> {'a': convert('1'), 'b.c': convert('2')}"""
+    if isinstance(value, dict):
+        return {name: convert(setting) for name, setting in value.items()}
+    settings = {}
+    for item in (value or '').split(','):
+        name, _, setting = item.partition('=')
+        if name.strip() and setting.strip():
+            settings[name.strip()] = convert(setting.strip())
+    return settings
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg, extra fields, exc"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of DEBUG/INFO records for configured loggers"""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+
+    def _rate(self, name):
+        while name:
+            if name in self.rates:
+                return self.rates[name]
+            name = name.rpartition('.')[0]
+        return None
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = getattr(record, 'sample_rate', None)
+        if rate is None:
+            rate = self._rate(record.name)
+        return rate is None or random.random() < rate
+
+class RequestContextFilter(logging.Filter):
+    """Add method and path to records logged while handling a request.
+
+    Runs on the request thread, before the record is queued.
+    """
+
+    def filter(self, record):
+        if has_request_context() and not hasattr(record, 'path'):
+            record.method = request.method
+            record.path = request.path
+        return True
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Resolve the message on the caller's thread; leave formatting to the listener"""
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+def configure_logging(app):
+    """Route all logging through a queue to a stdout handler; call once per process"""
+    global _listener
+
+    root = logging.getLogger()
+    root.setLevel(app.config.get('LOG_LEVEL', 'INFO').upper())
+    for name, level in parse_setting(app.config.get('LOG_LEVELS')).items():
+        logging.getLogger(name).setLevel(level.upper())
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    if app.config.get('LOG_FORMAT', 'json') == 'json':
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+
+    queue_handler = _QueueHandler(queue.SimpleQueue())
+    queue_handler.addFilter(SamplingFilter(parse_setting(app.config.get('LOG_SAMPLE_RATES'), float)))
+    queue_handler.addFilter(RequestContextFilter())
+
+    if _listener is not None:
+        _listener.stop()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+
+    _listener = logging.handlers.QueueListener(queue_handler.queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+
+def _restart_listener_in_child():
+    # The listener thread doesn't survive fork (e.g. gunicorn --preload)
+    if _listener is not None:
+        _listener._thread = None
+        _listener.start()
+
+if hasattr(os, 'register_at_fork'):  # Not on Windows, which has no fork
+    os.register_at_fork(after_in_child=_restart_listener_in_child)
+
+@atexit.register
+def _stop_listener():
+    # Drain anything still queued
+    if _listener is not None:
+        _listener.stop()
@@ -0,0 +1,306 @@
+"""Passenger manifests (boarding lists) per trip or per operator-day.
+
+A manifest is built from two queries however many trips it covers: one
+for the trips and one batched query over Booking + Customer for all of
+their passengers. It can be rendered as printable HTML, CSV or PDF (a
+small built-in writer, no PDF library needed).
+
+Operator-day manifests are cached under instance/manifests/<date>/ and
+reused while a cheap signature query (trip ids, statuses, departure
+times, booking counts and last booking update) is unchanged. The
+``pregenerate-manifests`` CLI command, run nightly from cron, fills the
+cache for the next day's departures.
+"""
+import csv
+import hashlib
+import io
+import json
+import os
+import re
+from datetime import datetime, date, timedelta
+
+import click
+from flask import current_app, render_template
+from flask.cli import with_appcontext
+from sqlalchemy import select, func
+
+from models import db, Trip, Booking, Customer, Route, Operator, BusType, parse_seat_numbers
+
+MANIFEST_FORMATS = ['html', 'pdf', 'csv']
+
+MIMETYPES = {
+    'html': 'text/html; charset=utf-8',
+    'pdf': 'application/pdf',
+    'csv': 'text/csv; charset=utf-8'
+}
+
+# (key, header, width in characters for the PDF layout)
+COLUMNS = [
+    ('seat', 'Seat', 6),
+    ('reference', 'Booking', 12),
+    ('name', 'Passenger', 28),
+    ('phone', 'Phone', 16),
+    ('id_number', 'ID Number', 16),
+    ('payment_status', 'Payment', 9),
+]
+
+def _seat_sort_key(seat):
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', str(seat))]
+
+def day_conditions(operator_id, day):
+    """WHERE conditions on Trip for one operator's departures on `day`"""
+    start = datetime.combine(day, datetime.min.time())
+    return [
+        Trip.operator_id == int(operator_id),
+        Trip.departure_time >= start,
+        Trip.departure_time < start + timedelta(days=1)
+    ]
+
+def build_manifest(conditions):
+    """Load trips matching `conditions` with one passenger row per booked seat"""
+    trip_rows = db.session.execute(
+        select(
+            Trip.id, Trip.departure_time, Trip.arrival_time, Trip.status, Trip.virtual_bus_id,
+            Route.origin, Route.destination, Operator.name, Operator.code, BusType.name
+        ).join(Route, Route.id == Trip.route_id)
+         .join(Operator, Operator.id == Trip.operator_id)
+         .outerjoin(BusType, BusType.id == Trip.bus_type_id)
+         .where(*conditions)
+         .order_by(Trip.departure_time, Trip.id)
+    ).all()
+
+    trips = []
+    by_id = {}
+    for trip_id, departure, arrival, status, bus, origin, destination, operator, code, bus_type in trip_rows:
+        trip = {
+            'id': trip_id, 'departure_time': departure, 'arrival_time': arrival, 'status': status,
+            'bus': bus or f'Bus-{trip_id}', 'bus_type': bus_type, 'origin': origin,
+            'destination': destination, 'operator': operator, 'operator_code': code,
+            'passengers': []
+        }
+        trips.append(trip)
+        by_id[trip_id] = trip
+
+    if by_id:
+        booking_rows = db.session.execute(
+            select(
+                Booking.trip_id, Booking.booking_reference, Booking.seat_numbers, Booking.payment_status,
+                Booking.status, Customer.name, Customer.phone, Customer.id_number
+            ).join(Customer, Customer.id == Booking.customer_id)
+             .where(Booking.trip_id.in_(list(by_id)), Booking.status != 'cancelled')
+        ).all()
+
+        for row in booking_rows:
+            trip_id, reference, seat_numbers, payment_status, status, name, phone, id_number = tuple(row)
+            for seat in parse_seat_numbers(seat_numbers) or ['-']:
+                by_id[trip_id]['passengers'].append({
+                    'seat': str(seat), 'reference': reference, 'name': name, 'phone': phone,
+                    'id_number': id_number or '', 'payment_status': payment_status, 'status': status
+                })
+
+    for trip in trips:
+        trip['passengers'].sort(key=lambda passenger: _seat_sort_key(passenger['seat']))
+
+    return {'trips': trips, 'generated_at': datetime.now()}
+
+def manifest_signature(conditions):
+    """Hash of everything that changes a manifest's content, from one aggregate query"""
+    rows = db.session.execute(
+        select(
+            Trip.id, Trip.status, Trip.departure_time,
+            func.count(Booking.id), func.max(Booking.updated_at)
+        ).outerjoin(Booking, Booking.trip_id == Trip.id)
+         .where(*conditions)
+         .group_by(Trip.id, Trip.status, Trip.departure_time)
+         .order_by(Trip.id)
+    ).all()
+    return hashlib.sha1(repr([tuple(row) for row in rows]).encode()).hexdigest()
+
+# Renderers
+
+def render_html(manifest, title):
+    return render_template('admin/manifests/print.html', manifest=manifest, title=title,
+                           columns=COLUMNS).encode('utf-8')
+
+def render_csv(manifest):
+    buffer = io.StringIO()
+    buffer.write('\ufeff')
+    writer = csv.writer(buffer)
+    writer.writerow(['Departure', 'Route', 'Bus', 'Trip ID'] + [header for _, header, _ in COLUMNS] + ['Boarded'])
+    for trip in manifest['trips']:
+        for passenger in trip['passengers']:
+            writer.writerow(
+                [trip['departure_time'].strftime('%Y-%m-%d %H:%M'), f"{trip['origin']} - {trip['destination']}",
+                 trip['bus'], trip['id']] + [passenger[key] for key, _, _ in COLUMNS] + ['']
+            )
+    return buffer.getvalue().encode('utf-8')
+
+def _pdf_text(value):
+    text = str(value).encode('cp1252', errors='replace').decode('latin-1')
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+def _pdf_document(pages):
+    """Assemble a PDF from pages given as lists of (font, size, line) in Courier"""
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        None,  # page tree, filled in once page object numbers are known
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Courier /Encoding /WinAnsiEncoding >>',
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Courier-Bold /Encoding /WinAnsiEncoding >>',
+    ]
+    page_ids = []
+    for lines in pages:
+        commands = ['BT', '40 802 Td']
+        for font, size, line in lines:
+            commands.append(f'/{font} {size} Tf {size + 3} TL ({_pdf_text(line)}) Tj T*')
+        commands.append('ET')
+        stream = '\n'.join(commands).encode('latin-1')
+        objects.append(b'<< /Length %d >>\nstream\n' % len(stream) + stream + b'\nendstream')
+        objects.append(
+            b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] '
+            b'/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents %d 0 R >>' % (len(objects))
+        )
+        page_ids.append(len(objects))
+    kids = ' '.join(f'{page_id} 0 R' for page_id in page_ids)
+    objects[1] = f'<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>'.encode()
+
+    output = io.BytesIO()
+    output.write(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(output.tell())
+        output.write(b'%d 0 obj\n' % number + body + b'\nendobj\n')
+    xref = output.tell()
+    output.write(b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1))
+    for offset in offsets:
+        output.write(b'%010d 00000 n \n' % offset)
+    output.write(b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref))
+    return output.getvalue()
+
+def _pdf_row(values):
+    return ''.join(str(value)[:width - 1].ljust(width) for value, (_, _, width) in zip(values, COLUMNS)) + '[ ]'
+
+def render_pdf(manifest, title):
+    """One or more A4 pages per trip, monospaced so columns line up"""
+    lines_per_page = 60
+    pages = []
+    for trip in manifest['trips'] or [None]:
+        header = [('F2', 12, title)]
+        if trip:
+            header += [
+                ('F1', 9, f"{trip['origin']} -> {trip['destination']}  |  {trip['operator']} ({trip['operator_code']})"),
+                ('F1', 9, f"Departure {trip['departure_time'].strftime('%d/%m/%Y %H:%M')}  |  "
+                          f"Bus {trip['bus']} {trip['bus_type'] or ''}  |  Trip #{trip['id']}  |  "
+                          f"{len(trip['passengers'])} passenger(s)"),
+            ]
+        header += [('F1', 9, ''), ('F2', 9, _pdf_row([h for _, h, _ in COLUMNS]).replace('[ ]', 'Board'))]
+
+        rows = [('F1', 9, _pdf_row([p[key] for key, _, _ in COLUMNS])) for p in (trip['passengers'] if trip else [])]
+        if not rows:
+            rows = [('F1', 9, 'No passengers')]
+        for start in range(0, len(rows), lines_per_page):
+            pages.append(header + rows[start:start + lines_per_page])
+
+    pages[-1].append(('F1', 8, ''))
+    pages[-1].append(('F1', 8, f"Generated {manifest['generated_at'].strftime('%d/%m/%Y %H:%M')}"))
+    return _pdf_document(pages)
+
+def render_manifest(manifest, export_format, title):
+    if export_format not in MANIFEST_FORMATS:
+        raise ValueError(f'Unsupported manifest format: {export_format}')
+    if export_format == 'pdf':
+        return render_pdf(manifest, title)
+    if export_format == 'csv':
+        return render_csv(manifest)
+    return render_html(manifest, title)
+
+def day_overview(day):
+    """(operator, departures, bookings) for every operator departing on `day`"""
+    start = datetime.combine(day, datetime.min.time())
+    active_bookings = select(Booking.trip_id, func.count(Booking.id).label('bookings')) \
+        .where(Booking.status != 'cancelled').group_by(Booking.trip_id).subquery()
+    rows = db.session.query(
+        Operator, func.count(Trip.id), func.coalesce(func.sum(active_bookings.c.bookings), 0)
+    ).join(Trip, Trip.operator_id == Operator.id) \
+     .outerjoin(active_bookings, active_bookings.c.trip_id == Trip.id) \
+     .filter(Trip.departure_time >= start, Trip.departure_time < start + timedelta(days=1)) \
+     .group_by(Operator.id) \
+     .order_by(Operator.name).all()
+    return rows
+
+# Operator-day cache
+
+def _cache_paths(operator_id, day, export_format):
+    directory = os.path.join(current_app.instance_path, 'manifests', day.isoformat())
+    base = os.path.join(directory, f'operator_{int(operator_id)}')
+    return directory, f'{base}.{export_format}', f'{base}.json'
+
+def day_manifest_title(operator_name, day):
+    return f"Passenger Manifest - {operator_name} - {day.strftime('%d/%m/%Y')}"
+
+def get_day_manifest(operator, day, export_format):
+    """Rendered operator-day manifest, from the cache when still current"""
+    conditions = day_conditions(operator.id, day)
+    signature = manifest_signature(conditions)
+    directory, path, meta_path = _cache_paths(operator.id, day, export_format)
+
+    try:
+        with open(meta_path) as meta_file:
+            cached_signature = json.load(meta_file).get('signature')
+        if cached_signature == signature:
+            with open(path, 'rb') as cached:
+                return cached.read()
+    except (OSError, ValueError):
+        pass
+
+    content = render_manifest(build_manifest(conditions), export_format, day_manifest_title(operator.name, day))
+    _store(directory, {export_format: content}, path.rsplit('.', 1)[0], meta_path, signature)
+    return content
+
+def _store(directory, contents, base, meta_path, signature):
+    os.makedirs(directory, exist_ok=True)
+    try:
+        with open(meta_path) as meta_file:
+            if json.load(meta_file).get('signature') != signature:
+                # Stale formats from an older signature must not be served
+                for export_format in MANIFEST_FORMATS:
+                    if export_format not in contents and os.path.exists(f'{base}.{export_format}'):
+                        os.remove(f'{base}.{export_format}')
+    except (OSError, ValueError):
+        pass
+    for export_format, content in contents.items():
+        with open(f'{base}.{export_format}', 'wb') as output:
+            output.write(content)
+    with open(meta_path, 'w') as meta_file:
+        json.dump({'signature': signature, 'generated_at': datetime.now().isoformat()}, meta_file)
+
+def pregenerate_manifests(day):
+    """Render every format for each operator with departures on `day`; returns the operator count"""
+    start = datetime.combine(day, datetime.min.time())
+    operators = Operator.query.filter(
+        Operator.id.in_(
+            select(Trip.operator_id).where(Trip.departure_time >= start,
+                                           Trip.departure_time < start + timedelta(days=1))
+        )
+    ).all()
+
+    # The template context processors expect a request
+    with current_app.test_request_context():
+        for operator in operators:
+            conditions = day_conditions(operator.id, day)
+            signature = manifest_signature(conditions)
+            manifest = build_manifest(conditions)
+            title = day_manifest_title(operator.name, day)
+            directory, path, meta_path = _cache_paths(operator.id, day, 'pdf')
+            _store(directory, {export_format: render_manifest(manifest, export_format, title) for export_format in MANIFEST_FORMATS},
+                   path.rsplit('.', 1)[0], meta_path, signature)
+
+    return len(operators)
+
+@click.command('pregenerate-manifests')
+@click.option('--date', 'day', default=None, help='Departure date (YYYY-MM-DD), defaults to tomorrow')
+@with_appcontext
+def pregenerate_manifests_command(day):
+    """Pre-generate operator-day manifests (run nightly from cron)."""
+    day = datetime.strptime(day, '%Y-%m-%d').date() if day else date.today() + timedelta(days=1)
+    count = pregenerate_manifests(day)
+    click.echo(f'Generated manifests for {count} operator(s) on {day.isoformat()}')
@@ -1,16 +1,18 @@
 import hashlib
 import hmac
+import logging
 import time
 import os
 from datetime import datetime
 from flask import current_app
-from pymesomb.operations import PaymentOperation
-from pymesomb.utils import RandomGenerator
 from dotenv import load_dotenv
+import metrics
 
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 class MesombPayment:
     """MesomB Payment Gateway Integration using Official SDK with Best Practices"""
     
@@ -23,6 +25,8 @@ class MesombPayment:
         if not all([self.application_key, self.access_key, self.secret_key]):
             raise ValueError("MeSomb credentials not found. Please set MESOMB_APPLICATION_KEY, MESOMB_ACCESS_KEY, and MESOMB_SECRET_KEY in environment variables.")
         
+        # pymesomb (and its HTTP stack) loads on first use, not at worker startup
+        from pymesomb.operations import PaymentOperation
         self.client = PaymentOperation(
             self.application_key,
             self.access_key, 
@@ -46,8 +50,7 @@ class MesombPayment:
         """
         
         try:
-            print(f"\n=== Processing Bus Booking Payment ===")
-            print(f"Amount: {amount} XAF, Phone: {payer_phone}, Service: {service}")
+            logger.info('Collecting payment of %s XAF via %s for %s', amount, service, booking_reference)
             
             # Validate amount (minimum 100 XAF)
             amount = float(amount)
@@ -75,6 +78,8 @@ class MesombPayment:
             # Generate unique transaction ID using timestamp pattern
             trx_id = f"BUS{datetime.now().strftime('%Y%m%d%H%M%S')}"
             
+            from pymesomb.utils import RandomGenerator
+            
             # Prepare structured payment data
             payment_data = {
                 'amount': amount,
@@ -104,13 +109,14 @@ class MesombPayment:
                 }]
             }
             
-            print("Sending request to MeSomb API...")
-            
             # Make the payment request
-            response = self.client.make_collect(**payment_data)
-            
-            print(f"\n=== MeSomb API Response ===")
-            print(f"Response type: {type(response)}")
+            started = time.perf_counter()
+            try:
+                response = self.client.make_collect(**payment_data)
+            finally:
+                elapsed = time.perf_counter() - started
+                metrics.PROVIDER_LATENCY.labels('mesomb', 'collect', service.upper()).observe(elapsed)
+            elapsed_ms = elapsed * 1000
             
             # Get the response data using the pattern from your test implementation
             response_data = getattr(response, '_data', {})
@@ -119,13 +125,15 @@ class MesombPayment:
             if not response_data and hasattr(response, '__dict__'):
                 response_data = vars(response).get('_data', {})
             
-            print("Response data:", response_data)
+            logger.debug('MeSomb response for %s: %s', booking_reference, response_data)
             
             # Get transaction details
             transaction = response_data.get('transaction', {})
             mesomb_status = transaction.get('status', '').upper()
             
-            print(f"MeSomb Transaction Status: {mesomb_status}")
+            logger.info('MeSomb transaction status %s for %s', mesomb_status, booking_reference,
+                        extra={'service': service.upper(), 'mesomb_status': mesomb_status, 'duration_ms': round(elapsed_ms, 1)})
+            metrics.PAYMENTS.labels(service.upper(), (mesomb_status or 'unknown').lower()).inc()
             
             # Handle based on official MeSomb transaction statuses
             if mesomb_status == 'SUCCESS':
@@ -217,7 +225,8 @@ class MesombPayment:
                 
         except Exception as e:
             error_msg = f"Payment processing error: {str(e)}"
-            print(f"Exception in collect_payment: {error_msg}")
+            logger.exception('Exception in collect_payment for %s', booking_reference)
+            metrics.PAYMENTS.labels(str(service).upper(), 'error').inc()
             
             return {
                 'status': 'error',
@@ -240,8 +249,7 @@ class MesombPayment:
         """
         
         try:
-            print(f"\n=== Checking Transaction Status ===")
-            print(f"Transaction ID: {transaction_id}")
+            logger.debug('Checking transaction status for %s', transaction_id)
             
             # For now, since MeSomb doesn't provide a direct status endpoint,
             # we'll return a conservative response that doesn't prematurely fail transactions
@@ -256,7 +264,7 @@ class MesombPayment:
             }
             
         except Exception as e:
-            print(f"Transaction status check error: {str(e)}")
+            logger.warning('Transaction status check error: %s', e)
             # On error, return pending status to avoid false failures
             return {
                 "success": False,
@@ -299,7 +307,7 @@ class MesombPayment:
             return hmac.compare_digest(expected_signature, provided_signature)
             
         except Exception as e:
-            print(f"Webhook signature verification error: {str(e)}")
+            logger.warning('Webhook signature verification error: %s', e)
             return False
     
     def _format_phone_number(self, phone):
@@ -364,8 +372,7 @@ class MesombPayment:
             dict: Processed webhook information
         """
         try:
-            print(f"\n=== Processing MeSomb Webhook ===")
-            print(f"Webhook data: {webhook_data}")
+            logger.debug('Processing MeSomb webhook: %s', webhook_data)
             
             event = webhook_data.get('event')
             transaction = webhook_data.get('transaction', {})
@@ -376,7 +383,7 @@ class MesombPayment:
                 amount = transaction.get('amount')
                 service = transaction.get('service')
                 
-                print(f"Transaction {trx_id} status updated to: {status}")
+                logger.info('Transaction %s status updated to %s', trx_id, status)
                 
                 return {
                     'success': True,
@@ -396,7 +403,7 @@ class MesombPayment:
                 }
                 
         except Exception as e:
-            print(f"Webhook processing error: {str(e)}")
+            logger.exception('Webhook processing error')
             return {
                 'success': False,
                 'error': f'Webhook processing error: {str(e)}'
@@ -0,0 +1,157 @@
+"""Prometheus metrics, served at /metrics.
+
+Under gunicorn set PROMETHEUS_MULTIPROC_DIR to an empty, writable directory
+before the workers start (gunicorn.conf.py clears it and marks dead workers).
+Each worker then writes its samples to files there and /metrics, whichever
+worker answers it, aggregates all of them.
+
+Request latency, payment outcomes, payment provider latency, email sends,
+DB write time, rate-limited requests and compression savings are recorded as
+they happen. Seat holds and pending bookings are read from the database when
+/metrics is scraped.
+
+Set METRICS_TOKEN to require ``Authorization: Bearer <token>`` on /metrics.
+"""
+import os
+import time
+from datetime import datetime
+
+from flask import Response, abort, current_app, g, has_app_context, request
+from prometheus_client import (CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, multiprocess, REGISTRY)
+from prometheus_client.core import GaugeMetricFamily
+from sqlalchemy import event, func
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+
+from models import db, Booking, SeatBlock
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+PROVIDER_BUCKETS = (0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+REQUEST_LATENCY = Histogram(
+    'nkolo_http_request_duration_seconds', 'Request latency by route',
+    ['method', 'route'], buckets=LATENCY_BUCKETS,
+)
+REQUESTS = Counter(
+    'nkolo_http_requests_total', 'Requests by route and status',
+    ['method', 'route', 'status'],
+)
+PAYMENTS = Counter(
+    'nkolo_payments_total', 'Payment collection outcomes by mobile money service',
+    ['service', 'outcome'],
+)
+PROVIDER_LATENCY = Histogram(
+    'nkolo_payment_provider_duration_seconds', 'Payment provider call latency',
+    ['provider', 'operation', 'service'], buckets=PROVIDER_BUCKETS,
+)
+EMAILS = Counter(
+    'nkolo_emails_total', 'Ticket emails by outcome',
+    ['outcome'],
+)
+EMAIL_OUTBOX = Gauge(
+    'nkolo_email_outbox_depth', 'Ticket emails waiting to be sent',
+    multiprocess_mode='livesum',
+)
+DB_WRITE_WAIT = Histogram(
+    'nkolo_db_write_wait_seconds',
+    'Time spent executing write statements, including waiting for the database write lock',
+    buckets=LATENCY_BUCKETS,
+)
+DB_LOCK_ERRORS = Counter(
+    'nkolo_db_lock_errors_total', "Statements that failed with 'database is locked'",
+)
+RATE_LIMITED = Counter(
+    'nkolo_rate_limited_total', 'Requests rejected by the rate limiter',
+    ['endpoint', 'scope'],
+)
+RESPONSE_BYTES = Counter(
+    'nkolo_response_bytes_total', 'Bytes of compressed response bodies before (original) and after (sent) compression',
+    ['encoding', 'stage'],
+)
+
+# BEGIN: explicit BEGIN IMMEDIATE (inventory.lock_trip, archive) waits for the SQLite write lock
+_WRITE_PREFIXES = ('INSERT', 'UPDATE', 'DELETE', 'BEGIN')
+
+class DatabaseStateCollector:
+    """Gauges read from the database at scrape time, of the app serving /metrics"""
+
+    def __init__(self, app):
+        self.app = app
+
+    def describe(self):
+        # Keeps register() from calling collect() before the tables exist
+        return []
+
+    def collect(self):
+        holds = GaugeMetricFamily('nkolo_active_seat_holds', 'Unexpired seat holds')
+        pending = GaugeMetricFamily('nkolo_pending_bookings', 'Bookings awaiting payment')
+        app = current_app._get_current_object() if has_app_context() else self.app
+        with app.app_context():
+            holds.add_metric([], db.session.query(func.count(SeatBlock.id)).filter(SeatBlock.expires_at > datetime.utcnow()).scalar())
+            pending.add_metric([], db.session.query(func.count(Booking.id)).filter(Booking.status == 'pending').scalar())
+        yield holds
+        yield pending
+
+def _start_timer():
+    g.metrics_started = time.perf_counter()
+
+def _observe_request(response):
+    started = g.pop('metrics_started', None)
+    if started is None or request.endpoint in ('static', 'metrics'):
+        return response
+    # The URL rule, not the path, keeps label cardinality bounded
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    REQUEST_LATENCY.labels(request.method, route).observe(time.perf_counter() - started)
+    REQUESTS.labels(request.method, route, str(response.status_code)).inc()
+    return response
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if statement.lstrip()[:6].upper().startswith(_WRITE_PREFIXES):
+        context._metrics_write_started = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_metrics_write_started', None)
+    if started is not None:
+        DB_WRITE_WAIT.observe(time.perf_counter() - started)
+
+def _handle_error(context):
+    if isinstance(context.sqlalchemy_exception, OperationalError) and 'locked' in str(context.original_exception):
+        DB_LOCK_ERRORS.inc()
+
+# The collector on the global REGISTRY, shared by every app in the process
+_database_state = None
+
+def _scrape_registry():
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return registry
+
+def init_metrics(app):
+    """Record request metrics for `app` and serve them at /metrics"""
+    global _database_state
+    app.before_request(_start_timer)
+    app.after_request(_observe_request)
+
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
+
+    registry = _scrape_registry()
+    if registry is not REGISTRY:
+        registry.register(DatabaseStateCollector(app))
+    elif _database_state is None:
+        # Registering once more per create_app() would repeat its series on every scrape
+        _database_state = DatabaseStateCollector(app)
+        registry.register(_database_state)
+
+    @app.route('/metrics')
+    def metrics():
+        token = app.config.get('METRICS_TOKEN')
+        if token and request.headers.get('Authorization') != f'Bearer {token}':
+            abort(401)
+        return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
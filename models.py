@@ -4,6 +4,28 @@ import json
 
 db = SQLAlchemy()
 
+def parse_seat_numbers(seat_numbers):
+    """Parse a stored seat_numbers value (JSON list, single value or comma-separated string)"""
+    if seat_numbers:
+        # Handle integer case (single seat number)
+        if isinstance(seat_numbers, int):
+            return [str(seat_numbers)]
+        
+        # Handle string cases
+        if isinstance(seat_numbers, str):
+            try:
+                # Try to parse as JSON first
+                result = json.loads(seat_numbers)
+                # If result is a list, return it
+                if isinstance(result, list):
+                    return [str(s) for s in result]
+                # If result is an int/string, wrap in list
+                return [str(result)]
+            except (json.JSONDecodeError, TypeError, ValueError):
+                # If not JSON, assume it's comma-separated string
+                return [s.strip() for s in seat_numbers.split(',') if s.strip()]
+    return []
+
 class Operator(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -286,7 +308,7 @@ class RouteOperatorAssignment(db.Model):
 
 class Trip(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    departure_time = db.Column(db.DateTime, nullable=False)
+    departure_time = db.Column(db.DateTime, nullable=False, index=True)
     arrival_time = db.Column(db.DateTime, nullable=False)
     seat_price = db.Column(db.Float, nullable=False)  # Price per seat
     available_seats = db.Column(db.Integer, nullable=False)
@@ -362,32 +384,14 @@ class Booking(db.Model):
     status = db.Column(db.String(20), default='pending')  # pending, confirmed, cancelled
     
     # Foreign Keys
-    trip_id = db.Column(db.Integer, db.ForeignKey('trip.id'), nullable=False)
+    trip_id = db.Column(db.Integer, db.ForeignKey('trip.id'), nullable=False, index=True)
     customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=False)
     
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     def get_seat_numbers(self):
-        if self.seat_numbers:
-            # Handle integer case (single seat number)
-            if isinstance(self.seat_numbers, int):
-                return [str(self.seat_numbers)]
-            
-            # Handle string cases
-            if isinstance(self.seat_numbers, str):
-                try:
-                    # Try to parse as JSON first
-                    result = json.loads(self.seat_numbers)
-                    # If result is a list, return it
-                    if isinstance(result, list):
-                        return [str(s) for s in result]
-                    # If result is an int/string, wrap in list
-                    return [str(result)]
-                except (json.JSONDecodeError, TypeError, ValueError):
-                    # If not JSON, assume it's comma-separated string
-                    return [s.strip() for s in self.seat_numbers.split(',') if s.strip()]
-        return []
+        return parse_seat_numbers(self.seat_numbers)
 
     def set_seat_numbers(self, seats_list):
         self.seat_numbers = json.dumps(seats_list)
@@ -448,18 +452,17 @@ class SeatBlock(db.Model):
     @classmethod
     def cleanup_expired(cls):
         """Remove all expired seat blocks"""
-        expired_blocks = cls.query.filter(cls.expires_at < datetime.utcnow()).all()
-        for block in expired_blocks:
-            db.session.delete(block)
+        # SKIP LOCKED: leave rows another transaction is already deleting (ignored by SQLite)
+        expired = db.select(cls.id).where(cls.expires_at < datetime.utcnow()).with_for_update(skip_locked=True)
+        result = db.session.execute(db.delete(cls).where(cls.id.in_(expired)).execution_options(synchronize_session=False))
         db.session.commit()
-        return len(expired_blocks)
+        return result.rowcount
     
     @classmethod
     def get_blocked_seats_for_trip(cls, trip_id, exclude_session=None):
         """Get all currently blocked seats for a trip"""
-        # Clean up expired blocks first
-        cls.cleanup_expired()
-        
+        # Expired blocks are filtered out here and deleted when seats are next held
+        # (inventory.hold_seats), so viewing a seat map never writes
         query = cls.query.filter(
             cls.trip_id == trip_id,
             cls.expires_at > datetime.utcnow()
@@ -475,24 +478,78 @@ class SeatBlock(db.Model):
         
         return blocked_seats
     
-    @classmethod
-    def block_seats(cls, trip_id, seat_numbers, session_id):
-        """Block seats for a session"""
-        # Remove any existing blocks for this session
-        existing_blocks = cls.query.filter_by(
-            trip_id=trip_id,
-            session_id=session_id
-        ).all()
-        
-        for block in existing_blocks:
-            db.session.delete(block)
-        
-        # Create new block
-        new_block = cls(trip_id, seat_numbers, session_id)
-        db.session.add(new_block)
-        db.session.commit()
-        
-        return new_block
-    
     def __repr__(self):
         return f'<SeatBlock Trip:{self.trip_id} Seats:{self.get_seat_numbers()} Session:{self.session_id}>'
+
+class DailyRouteStats(db.Model):
+    """Daily rollup of sales and capacity per route, operator and bus category.
+    
+    Rows are keyed by the trip's departure date and kept up to date by the
+    flush listeners in analytics.py, so reports never scan booking/trip.
+    """
+    __tablename__ = 'daily_route_stats'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    stat_date = db.Column(db.Date, nullable=False, index=True)
+    route_id = db.Column(db.Integer, db.ForeignKey('route.id'), nullable=False)
+    operator_id = db.Column(db.Integer, db.ForeignKey('operator.id'), nullable=False)
+    bus_category = db.Column(db.String(20), nullable=False, default='regular')  # 'vip' or 'regular'
+    
+    trips = db.Column(db.Integer, nullable=False, default=0)  # Non-cancelled departures
+    seats_offered = db.Column(db.Integer, nullable=False, default=0)
+    seats_sold = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+    bookings_confirmed = db.Column(db.Integer, nullable=False, default=0)
+    bookings_cancelled = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (db.UniqueConstraint('stat_date', 'route_id', 'operator_id', 'bus_category', name='unique_daily_route_stats'),)
+    
+    @property
+    def load_factor(self):
+        """Share of offered seats that were sold (0.0 - 1.0)"""
+        return (self.seats_sold / self.seats_offered) if self.seats_offered else 0.0
+    
+    def __repr__(self):
+        return f'<DailyRouteStats {self.stat_date} route:{self.route_id} operator:{self.operator_id} {self.bus_category}>'
+
+class AuditLog(db.Model):
+    """Append-only record of admin actions, written in batches by audit.py"""
+    __tablename__ = 'audit_log'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    actor = db.Column(db.String(120), nullable=False)  # Admin email
+    action = db.Column(db.String(50), nullable=False)  # e.g. 'booking.cancel'
+    entity_type = db.Column(db.String(50), nullable=False)
+    entity_id = db.Column(db.String(50))
+    details = db.Column(db.Text)  # JSON
+    ip_address = db.Column(db.String(45))
+    
+    __table_args__ = (
+        db.Index('ix_audit_log_actor_created', 'actor', 'created_at'),
+        db.Index('ix_audit_log_entity_created', 'entity_type', 'entity_id', 'created_at'),
+    )
+    
+    def get_details(self):
+        return json.loads(self.details) if self.details else {}
+    
+    def __repr__(self):
+        return f'<AuditLog {self.action} {self.entity_type}:{self.entity_id} by {self.actor}>'
+
+class WebSession(db.Model):
+    """Server-side session data, keyed by the id in the session cookie (see sessions.py)"""
+    __tablename__ = 'web_session'
+    
+    id = db.Column(db.String(64), primary_key=True)
+    data = db.Column(db.Text, nullable=False)  # Tagged JSON
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+def ensure_indexes():
+    """Create indexes declared on the models that are missing from existing tables.
+    
+    db.create_all() only creates missing tables, so indexes added to a model
+    after its table exists have to be created separately.
+    """
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
@@ -0,0 +1,98 @@
+"""Keyset (cursor) pagination for the admin listings.
+
+Pages are addressed by an opaque cursor holding the sort key of the last
+(or first) row shown, so fetching page 500 costs the same indexed range
+scan as page 1, unlike OFFSET. Totals come from the shared cache (see
+cache.py) instead of a COUNT(*) on every request.
+"""
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import tuple_
+
+from cache import cached
+
+DEFAULT_PER_PAGE = 25
+MAX_PER_PAGE = 200
+COUNT_CACHE_SECONDS = 60
+
+def encode_cursor(sort_value, row_id):
+    payload = json.dumps([sort_value.isoformat() if isinstance(sort_value, datetime) else sort_value, row_id])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Return (sort_value, row_id) or None for a missing/invalid cursor"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        return datetime.fromisoformat(sort_value), int(row_id)
+    except (ValueError, TypeError):
+        return None
+
+def cached_count(key, query, tags):
+    """COUNT(*) of `query`, cached for COUNT_CACHE_SECONDS or until a write to `tags`"""
+    cache_key = 'count:' + json.dumps(key, default=str, separators=(',', ':'))
+    return cached(cache_key, lambda: query.order_by(None).count(), tags=tags, timeout=COUNT_CACHE_SECONDS)
+
+class KeysetPage:
+    """One page of keyset-paginated results"""
+
+    def __init__(self, items, per_page, next_cursor, prev_cursor, total=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    def to_dict(self, serialize):
+        return {
+            'items': [serialize(item) for item in self.items],
+            'per_page': self.per_page,
+            'next_cursor': self.next_cursor,
+            'prev_cursor': self.prev_cursor,
+            'total': self.total
+        }
+
+def keyset_paginate(query, sort_column, id_column, after=None, before=None, per_page=DEFAULT_PER_PAGE, total=None):
+    """Paginate `query` in descending (sort_column, id_column) order.
+
+    `after` continues past the cursor (next page), `before` goes back
+    (previous page). Without either the first page is returned.
+    """
+    per_page = max(1, min(per_page or DEFAULT_PER_PAGE, MAX_PER_PAGE))
+    after_key = decode_cursor(after)
+    before_key = decode_cursor(before)
+    key = tuple_(sort_column, id_column)
+
+    if before_key:
+        rows = query.filter(key > before_key) \
+            .order_by(sort_column.asc(), id_column.asc()) \
+            .limit(per_page + 1).all()
+        has_more_before = len(rows) > per_page
+        items = list(reversed(rows[:per_page]))
+        has_more_after = True
+    else:
+        if after_key:
+            query = query.filter(key < after_key)
+        rows = query.order_by(sort_column.desc(), id_column.desc()).limit(per_page + 1).all()
+        has_more_after = len(rows) > per_page
+        items = rows[:per_page]
+        has_more_before = after_key is not None
+
+    sort_attr = sort_column.key
+    id_attr = id_column.key
+    next_cursor = encode_cursor(getattr(items[-1], sort_attr), getattr(items[-1], id_attr)) if items and has_more_after else None
+    prev_cursor = encode_cursor(getattr(items[0], sort_attr), getattr(items[0], id_attr)) if items and has_more_before else None
+
+    return KeysetPage(items, per_page, next_cursor, prev_cursor, total)
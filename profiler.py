@@ -0,0 +1,196 @@
+"""Per-request timing and SQL query profiling.
+
+For every request the wall time, number of SQL statements and time spent
+in them are recorded per endpoint in a ring buffer (PROFILER_BUFFER_SIZE
+requests). A statement that runs PROFILER_N_PLUS_ONE_THRESHOLD or more times
+in one request with only its parameters changing is flagged as an N+1
+pattern. Statements slower than PROFILER_SLOW_QUERY_MS go into a second
+ring buffer with their parameters, so the admin profiler page can show
+their EXPLAIN plans.
+
+Responses to logged-in admins also get a Server-Timing header (app and db
+time), which browser dev tools show next to the request. Off by default: set
+PROFILER_ENABLED=true to turn it on.
+
+Buffers live in memory, per worker process.
+"""
+import logging
+import re
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+
+from flask import g, has_request_context, request, session
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+
+from models import db
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUFFER_SIZE = 1000
+DEFAULT_SLOW_QUERY_MS = 50
+DEFAULT_N_PLUS_ONE_THRESHOLD = 5
+SLOW_QUERY_BUFFER_SIZE = 200
+IGNORED_ENDPOINTS = {'static'}
+
+_requests = deque(maxlen=DEFAULT_BUFFER_SIZE)
+_slow_queries = deque(maxlen=SLOW_QUERY_BUFFER_SIZE)
+_lock = threading.Lock()
+_settings = {}
+
+_IN_LIST = re.compile(r'\((?:\s*\?\s*,)+\s*\?\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+def normalize_statement(statement):
+    """Collapse whitespace and expanded IN lists so repeats compare equal"""
+    statement = _WHITESPACE.sub(' ', statement).strip()
+    return _IN_LIST.sub('(?...)', statement)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'profile' in g:
+        context._profiler_started = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_profiler_started', None)
+    if started is None or not has_request_context() or 'profile' not in g:
+        return
+
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    profile = g.profile
+    profile['queries'] += 1
+    profile['query_ms'] += elapsed_ms
+    normalized = normalize_statement(statement)
+    profile['statements'][normalized] += 1
+
+    if elapsed_ms >= _settings['slow_query_ms']:
+        with _lock:
+            _slow_queries.append({
+                'at': datetime.utcnow(),
+                'endpoint': request.endpoint,
+                'statement': statement,
+                'normalized': normalized,
+                'parameters': parameters if not executemany else None,
+                'duration_ms': elapsed_ms,
+            })
+
+def _start_request():
+    if request.endpoint in IGNORED_ENDPOINTS:
+        return
+    g.profile = {'started': time.perf_counter(), 'queries': 0, 'query_ms': 0.0, 'statements': Counter()}
+
+def _finish_request(response):
+    profile = g.pop('profile', None)
+    if profile is None:
+        return response
+
+    wall_ms = (time.perf_counter() - profile['started']) * 1000
+    threshold = _settings['n_plus_one_threshold']
+    repeated = [(statement, count) for statement, count in profile['statements'].most_common() if count >= threshold]
+    entry = {
+        'at': datetime.utcnow(),
+        'endpoint': request.endpoint or request.path,
+        'method': request.method,
+        'path': request.path,
+        'status': response.status_code,
+        'wall_ms': wall_ms,
+        'queries': profile['queries'],
+        'query_ms': profile['query_ms'],
+        'n_plus_one': repeated,
+    }
+    with _lock:
+        _requests.append(entry)
+
+    if repeated:
+        logger.warning('Possible N+1 in %s: %d queries, %s repeated %d times',
+                       entry['endpoint'], profile['queries'], repeated[0][0][:120], repeated[0][1],
+                       extra={'endpoint': entry['endpoint'], 'queries': profile['queries']})
+
+    if 'admin_id' in session:
+        response.headers.add('Server-Timing', f"app;dur={wall_ms:.1f}")
+        response.headers.add('Server-Timing', f'db;dur={profile["query_ms"]:.1f};desc="{profile["queries"]} queries"')
+    return response
+
+def init_profiler(app):
+    """Hook the profiler into `app` if PROFILER_ENABLED"""
+    global _requests
+    if not app.config.get('PROFILER_ENABLED', False):
+        return
+
+    _settings['slow_query_ms'] = app.config.get('PROFILER_SLOW_QUERY_MS', DEFAULT_SLOW_QUERY_MS)
+    _settings['n_plus_one_threshold'] = app.config.get('PROFILER_N_PLUS_ONE_THRESHOLD', DEFAULT_N_PLUS_ONE_THRESHOLD)
+    _requests = deque(_requests, maxlen=app.config.get('PROFILER_BUFFER_SIZE', DEFAULT_BUFFER_SIZE))
+
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def endpoint_stats():
+    """Per-endpoint aggregates over the buffered requests, slowest total time first"""
+    with _lock:
+        entries = list(_requests)
+
+    grouped = {}
+    for entry in entries:
+        grouped.setdefault(entry['endpoint'], []).append(entry)
+
+    stats = []
+    for endpoint, items in grouped.items():
+        wall = [item['wall_ms'] for item in items]
+        stats.append({
+            'endpoint': endpoint,
+            'requests': len(items),
+            'avg_ms': sum(wall) / len(items),
+            'p95_ms': _percentile(wall, 0.95),
+            'max_ms': max(wall),
+            'total_ms': sum(wall),
+            'avg_queries': sum(item['queries'] for item in items) / len(items),
+            'max_queries': max(item['queries'] for item in items),
+            'avg_query_ms': sum(item['query_ms'] for item in items) / len(items),
+            'n_plus_one': sum(1 for item in items if item['n_plus_one']),
+            'repeated': max((item['n_plus_one'] for item in items), key=lambda r: r[0][1] if r else 0),
+        })
+    return sorted(stats, key=lambda stat: stat['total_ms'], reverse=True)
+
+def slowest_queries(limit=20):
+    """Slowest captured statements, one (the slowest run) per normalized statement"""
+    with _lock:
+        queries = list(_slow_queries)
+
+    slowest = {}
+    for query in queries:
+        current = slowest.get(query['normalized'])
+        if current is None:
+            slowest[query['normalized']] = dict(query, runs=1)
+        else:
+            current['runs'] += 1
+            if query['duration_ms'] > current['duration_ms']:
+                current.update(query, runs=current['runs'])
+    return sorted(slowest.values(), key=lambda query: query['duration_ms'], reverse=True)[:limit]
+
+def explain(query):
+    """Query plan rows for a captured SELECT, or None"""
+    if not query['statement'].lstrip().upper().startswith(('SELECT', 'WITH')):
+        return None
+    prefix = 'EXPLAIN QUERY PLAN ' if db.engine.dialect.name == 'sqlite' else 'EXPLAIN '
+    try:
+        with db.engine.connect() as connection:
+            rows = connection.exec_driver_sql(prefix + query['statement'], query['parameters'] or ()).all()
+    except Exception as e:
+        return [f'EXPLAIN failed: {e}']
+    if db.engine.dialect.name == 'sqlite':
+        # (id, parent, notused, detail)
+        return [row[-1] for row in rows]
+    return [row[0] for row in rows]
+
+def reset():
+    with _lock:
+        _requests.clear()
+        _slow_queries.clear()
@@ -0,0 +1,207 @@
+"""Token-bucket rate limiting for the public endpoints.
+
+A limit such as '10 per minute' is a bucket of 10 tokens refilled at 10 per
+minute: bursts up to 10 requests pass, after that one every 6 seconds. Each
+limited endpoint has a bucket per client IP and, once the browser has a
+session (session['session_id']), one per session. IP limits are kept looser
+than session limits, since many mobile customers share a carrier NAT address.
+
+    @user_bp.route('/api/retrieve-tickets')
+    @rate_limit(per_session='10 per minute', per_ip='60 per minute')
+    def api_retrieve_tickets(): ...
+
+Every other /api/ endpoint gets API_RATE_LIMIT per IP unless it is marked
+@rate_limit_exempt (the MeSomb webhook). The check runs before the view, so
+a rejected request never reaches the database: /api/ paths get a JSON 429,
+pages a plain one, both with Retry-After.
+
+Buckets live in API_RATE_LIMIT_STORAGE_URL: ``memory://`` keeps them in the
+worker (each gunicorn worker then allows the full limit), ``redis://...``
+shares them between workers through an atomic Lua script. If Redis is
+unreachable requests are let through and a warning is logged.
+
+Behind a reverse proxy set RATE_LIMIT_PROXY_COUNT to the number of proxies
+that append to X-Forwarded-For, so the client address is read from it.
+"""
+import logging
+import math
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, jsonify, request, session
+from werkzeug.exceptions import TooManyRequests
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+STORE_KEY = 'nkolo_rate_limit_store'
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+MEMORY_MAX_BUCKETS = 10000
+
+# KEYS[1] bucket; ARGV capacity, refill per second, now. Returns {allowed, tokens left}
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+  allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+def parse_limit(limit):
+    """'100 per hour' -> (capacity, tokens per second)"""
+    try:
+        count, per, period = limit.split()
+        count = int(count)
+        seconds = PERIODS[period.rstrip('s')]
+    except (ValueError, KeyError):
+        raise ValueError(f'Invalid rate limit: {limit!r} (expected e.g. "10 per minute")')
+    if per != 'per' or count < 1:
+        raise ValueError(f'Invalid rate limit: {limit!r} (expected e.g. "10 per minute")')
+    return count, count / seconds
+
+class MemoryStore:
+    """Buckets in this worker's memory"""
+
+    def __init__(self):
+        self._buckets = {}  # key -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate):
+        """Take a token; returns (allowed, tokens left)"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated_at) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            if len(self._buckets) >= MEMORY_MAX_BUCKETS and key not in self._buckets:
+                self._prune(now)
+            self._buckets[key] = (tokens, now)
+        return allowed, tokens
+
+    def _prune(self, now):
+        # Buckets idle for an hour have refilled under any sensible limit
+        idle = [key for key, (_, updated_at) in self._buckets.items() if now - updated_at > 3600]
+        for key in idle:
+            del self._buckets[key]
+        if len(self._buckets) >= MEMORY_MAX_BUCKETS:
+            self._buckets.clear()
+
+class RedisStore:
+    """Buckets shared by all workers in a Redis-protocol server"""
+
+    def __init__(self, url, key_prefix='nkolo:', socket_timeout=0.5):
+        import redis  # only needed with a redis:// storage URL
+
+        client = redis.Redis.from_url(url, socket_timeout=socket_timeout, socket_connect_timeout=socket_timeout)
+        self._script = client.register_script(TOKEN_BUCKET_SCRIPT)
+        self.prefix = key_prefix
+
+    def take(self, key, capacity, rate):
+        allowed, tokens = self._script(keys=[self.prefix + key], args=[capacity, rate, time.time()])
+        return bool(allowed), float(tokens)
+
+def create_store(url, key_prefix='nkolo:'):
+    if url.startswith('memory://'):
+        return MemoryStore()
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisStore(url, key_prefix)
+    raise ValueError(f'Unsupported API_RATE_LIMIT_STORAGE_URL: {url}')
+
+def client_ip():
+    """Client address, taken from X-Forwarded-For only behind RATE_LIMIT_PROXY_COUNT proxies"""
+    proxies = current_app.config.get('RATE_LIMIT_PROXY_COUNT', 0)
+    if proxies:
+        forwarded = [part.strip() for part in request.headers.get('X-Forwarded-For', '').split(',') if part.strip()]
+        if len(forwarded) >= proxies:
+            return forwarded[-proxies]
+    return request.remote_addr or 'unknown'
+
+def _check(endpoint, scope, identity, limit):
+    """Take a token from one bucket; returns seconds to wait if it is empty, else None"""
+    capacity, rate = parse_limit(limit)
+    try:
+        allowed, tokens = current_app.extensions[STORE_KEY].take(f'rl:{endpoint}:{scope}:{identity}', capacity, rate)
+    except Exception as e:
+        logger.warning('Rate limit store unavailable, allowing request: %s', e)
+        return None
+    if allowed:
+        return None
+    metrics.RATE_LIMITED.labels(endpoint, scope).inc()
+    return max(1, math.ceil((1 - tokens) / rate))
+
+def _reject(retry_after, scope):
+    logger.info('Rate limited %s %s (%s)', request.method, request.path, scope,
+                extra={'client_ip': client_ip(), 'scope': scope})
+    if request.path.startswith('/api/'):
+        response = jsonify({'success': False, 'error': 'Too many requests, please try again shortly'})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(retry_after)
+        return response
+    raise TooManyRequests(retry_after=retry_after)
+
+def _enforce(endpoint, per_session=None, per_ip=None):
+    """Response to send instead of the view, or None if the request may proceed"""
+    if not current_app.config.get('RATE_LIMIT_ENABLED', True):
+        return None
+    # The IP bucket goes first so a rejected request doesn't also spend a session token
+    if per_ip:
+        retry_after = _check(endpoint, 'ip', client_ip(), per_ip)
+        if retry_after:
+            return _reject(retry_after, 'ip')
+    session_id = session.get('session_id')
+    if per_session and session_id:
+        retry_after = _check(endpoint, 'session', session_id, per_session)
+        if retry_after:
+            return _reject(retry_after, 'session')
+    return None
+
+def rate_limit(per_session=None, per_ip=None):
+    """Limit a view per browser session and/or per client IP (e.g. '10 per minute')"""
+    for limit in (per_session, per_ip):
+        if limit:
+            parse_limit(limit)  # fail at import, not on the first request
+
+    def decorator(view):
+        @wraps(view)
+        def decorated_function(*args, **kwargs):
+            rejected = _enforce(request.endpoint, per_session, per_ip)
+            if rejected is not None:
+                return rejected
+            return view(*args, **kwargs)
+        decorated_function.rate_limited = True
+        return decorated_function
+    return decorator
+
+def rate_limit_exempt(view):
+    """Keep an /api/ view out of the default API_RATE_LIMIT"""
+    view.rate_limited = True
+    return view
+
+def _default_api_limit():
+    if not request.path.startswith('/api/') or request.endpoint is None:
+        return None
+    view = current_app.view_functions.get(request.endpoint)
+    if getattr(view, 'rate_limited', False):
+        return None
+    return _enforce('api', per_ip=current_app.config['API_RATE_LIMIT'])
+
+def init_rate_limiter(app):
+    """Create the bucket store and apply API_RATE_LIMIT to undecorated /api/ views"""
+    parse_limit(app.config['API_RATE_LIMIT'])
+    app.extensions[STORE_KEY] = create_store(app.config['API_RATE_LIMIT_STORAGE_URL'],
+                                             app.config.get('CACHE_KEY_PREFIX', 'nkolo:'))
+    app.before_request(_default_api_limit)
@@ -0,0 +1,188 @@
+"""Full-text search index for booking lookup.
+
+On SQLite the ``booking_search`` FTS5 table holds one row per booking
+(rowid = booking.id) with the booking reference and the customer's name,
+email and phone. Triggers on ``booking`` and ``customer`` keep it current,
+so bulk deletes and raw SQL are covered too. Phone numbers are stored as
+digits only, both with and without the 237 country code, so "+237 6 77..",
+"677.." and "2376 77.." all find the same customer.
+
+Searches use prefix matching ("NKP4" finds "NKP4X7Q2A"). On databases
+without FTS5 (e.g. PostgreSQL) booking_search_condition() falls back to the
+previous ILIKE filters.
+"""
+import logging
+import re
+
+from sqlalchemy import text, column, bindparam, or_, false
+from sqlalchemy.exc import OperationalError
+
+from models import db, Booking, Customer
+
+logger = logging.getLogger(__name__)
+
+SEARCH_FIELDS = ['reference', 'name', 'email', 'phone']
+COUNTRY_CODE = '237'
+NATIONAL_NUMBER_LENGTH = 9
+
+# Cached per worker: None = not checked yet
+_fts_available = None
+
+def _phone_digits_sql(expr):
+    """SQL expression stripping common separators from a phone number"""
+    for char in [' ', '+', '-', '(', ')', '.', '/']:
+        expr = f"replace({expr}, '{char}', '')"
+    return expr
+
+def _phone_tokens_sql(expr):
+    digits = _phone_digits_sql(f"coalesce({expr}, '')")
+    return (
+        f"{digits} || CASE WHEN {digits} LIKE '{COUNTRY_CODE}%' AND length({digits}) > {NATIONAL_NUMBER_LENGTH} "
+        f"THEN ' ' || substr({digits}, {len(COUNTRY_CODE) + 1}) ELSE '' END"
+    )
+
+def _index_insert_sql(where=''):
+    """INSERT ... SELECT indexing the bookings matched by `where`"""
+    return f"""
+        INSERT INTO booking_search(rowid, reference, name, email, phone)
+        SELECT b.id, b.booking_reference, c.name, c.email, {_phone_tokens_sql('c.phone')}
+        FROM booking b JOIN customer c ON c.id = b.customer_id {where}
+    """
+
+def _schema_statements():
+    return [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS booking_search USING fts5("
+        "reference, name, email, phone, tokenize = 'unicode61 remove_diacritics 2')",
+
+        f"""CREATE TRIGGER IF NOT EXISTS booking_search_ai AFTER INSERT ON booking BEGIN
+            {_index_insert_sql('WHERE b.id = new.id')};
+        END""",
+
+        f"""CREATE TRIGGER IF NOT EXISTS booking_search_au AFTER UPDATE OF booking_reference, customer_id ON booking BEGIN
+            DELETE FROM booking_search WHERE rowid = old.id;
+            {_index_insert_sql('WHERE b.id = new.id')};
+        END""",
+
+        """CREATE TRIGGER IF NOT EXISTS booking_search_ad AFTER DELETE ON booking BEGIN
+            DELETE FROM booking_search WHERE rowid = old.id;
+        END""",
+
+        f"""CREATE TRIGGER IF NOT EXISTS customer_search_au AFTER UPDATE OF name, email, phone ON customer BEGIN
+            UPDATE booking_search SET name = new.name, email = new.email, phone = {_phone_tokens_sql('new.phone')}
+            WHERE rowid IN (SELECT id FROM booking WHERE customer_id = new.id);
+        END""",
+    ]
+
+def ensure_search_index():
+    """Create the FTS table and triggers if missing, backfilling existing bookings"""
+    global _fts_available
+
+    if db.engine.dialect.name != 'sqlite':
+        _fts_available = False
+        return False
+
+    try:
+        with db.engine.begin() as connection:
+            exists = connection.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'booking_search'")
+            ).first()
+            for statement in _schema_statements():
+                connection.execute(text(statement))
+            if not exists:
+                connection.execute(text(_index_insert_sql()))
+        _fts_available = True
+    except OperationalError as e:
+        # SQLite built without FTS5
+        logger.warning('Booking search index unavailable: %s', e)
+        _fts_available = False
+
+    return _fts_available
+
+def fts_available():
+    """Whether the FTS table exists; looked up once per worker unless
+    ensure_search_index() already ran in this process"""
+    global _fts_available
+    if _fts_available is None:
+        if db.engine.dialect.name != 'sqlite':
+            _fts_available = False
+        else:
+            with db.engine.connect() as connection:
+                _fts_available = connection.execute(
+                    text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'booking_search'")
+                ).first() is not None
+            if not _fts_available:
+                logger.warning('Booking search index missing; run `flask --app app migrate`')
+    return _fts_available
+
+def rebuild_search_index():
+    """Drop and repopulate the search index from booking/customer"""
+    if not fts_available():
+        return 0
+    with db.engine.begin() as connection:
+        connection.execute(text("DELETE FROM booking_search"))
+        connection.execute(text(_index_insert_sql()))
+        return connection.execute(text("SELECT count(*) FROM booking_search")).scalar()
+
+def normalize_phone(value):
+    """Digits-only phone number without the country code"""
+    digits = re.sub(r'\D', '', value or '')
+    if digits.startswith(COUNTRY_CODE) and len(digits) > NATIONAL_NUMBER_LENGTH:
+        return digits[len(COUNTRY_CODE):]
+    return digits
+
+def _looks_like_phone(term):
+    return bool(re.fullmatch(r'[\d\s+\-().\/]+', term)) and len(re.sub(r'\D', '', term)) >= 3
+
+def build_match_query(term, fields=None):
+    """Translate user input into an FTS5 MATCH expression with prefix matching"""
+    fields = [f for f in (fields or SEARCH_FIELDS) if f in SEARCH_FIELDS]
+    term = (term or '').strip()
+
+    if _looks_like_phone(term):
+        tokens = [normalize_phone(term)]
+        if 'phone' in fields and 'reference' not in fields:
+            fields = ['phone']
+    else:
+        tokens = re.findall(r'\w+', term)
+
+    if not tokens or not fields:
+        return None
+
+    prefix_terms = ' AND '.join(f'"{token}"*' for token in tokens)
+    return f"{{{' '.join(fields)}}} : ({prefix_terms})"
+
+def _ilike_condition(term, fields):
+    pattern = f'%{term}%'
+    conditions = []
+    if 'reference' in fields:
+        conditions.append(Booking.booking_reference.ilike(pattern))
+    customer_conditions = []
+    if 'name' in fields:
+        customer_conditions.append(Customer.name.ilike(pattern))
+    if 'email' in fields:
+        customer_conditions.append(Customer.email.ilike(pattern))
+    if 'phone' in fields:
+        customer_conditions.append(Customer.phone.ilike(pattern))
+    if customer_conditions:
+        conditions.append(Booking.customer.has(or_(*customer_conditions)))
+    return or_(*conditions)
+
+def booking_search_condition(term, fields=None):
+    """WHERE condition on Booking matching `term` in the given fields.
+
+    fields is a subset of SEARCH_FIELDS (default: all of them).
+    """
+    fields = fields or SEARCH_FIELDS
+
+    if not fts_available():
+        return _ilike_condition(term, fields)
+
+    match_query = build_match_query(term, fields)
+    if not match_query:
+        return false()
+
+    # unique=True so several search conditions can be combined in one query
+    matching_ids = text("SELECT rowid FROM booking_search WHERE booking_search MATCH :match_query") \
+        .bindparams(bindparam('match_query', match_query, unique=True)) \
+        .columns(column('rowid'))
+    return Booking.id.in_(matching_ids)
@@ -0,0 +1,139 @@
+"""Deterministic demo dataset for load tests and benchmarks.
+
+seed_dataset() fills an empty database with operators, routes between
+CITIES (both directions), operator bus type configurations, a regular and a
+VIP trip per departure time for each operator and route over the coming
+days, and confirmed bookings filling part of each bus. The same arguments
+always produce the same data.
+"""
+import json
+import random
+from datetime import datetime, timedelta
+
+from analytics import rebuild_daily_stats
+from models import (db, BusType, Operator, OperatorBusType, Route, RouteOperatorAssignment,
+                    Trip, Booking, Customer)
+
+CITIES = ['Douala', 'Yaounde', 'Bafoussam', 'Bamenda', 'Kribi', 'Limbe', 'Buea', 'Ebolowa']
+DEPARTURE_TIMES = ['06:00', '08:00', '10:00', '12:00', '14:00', '16:00', '18:00', '20:00']
+
+def _bus_types():
+    regular = BusType.query.filter(BusType.category.ilike('regular')).first()
+    vip = BusType.query.filter(BusType.category.ilike('vip')).first()
+    if not regular:
+        regular = BusType(name='Regular', category='regular', capacity=70, seats_per_row=5)
+        db.session.add(regular)
+    if not vip:
+        vip = BusType(name='VIP', category='vip', capacity=40, seats_per_row=4)
+        db.session.add(vip)
+    db.session.flush()
+    return regular, vip
+
+def seed_dataset(cities=6, operators=4, days=14, departures_per_day=4, fill=0.3, seed=42):
+    """Insert the dataset; returns counts per table. Expects no operators yet."""
+    if Operator.query.first():
+        raise ValueError('Database already has operators; seed an empty database')
+
+    rng = random.Random(seed)
+    regular, vip = _bus_types()
+    city_names = CITIES[:cities]
+    times = DEPARTURE_TIMES[:departures_per_day]
+
+    operator_rows = []
+    for index in range(operators):
+        operator = Operator(name=f'Load Test Express {index + 1}', code=f'LT{index + 1:02d}',
+                            phone=f'6{index + 1:08d}', email=f'operator{index + 1}@example.com')
+        db.session.add(operator)
+        operator_rows.append(operator)
+        for bus_type in (regular, vip):
+            config = OperatorBusType(operator=operator, bus_type=bus_type, capacity=bus_type.capacity,
+                                     seats_per_row=bus_type.seats_per_row)
+            config.set_seat_layout(config.generate_default_layout())
+            db.session.add(config)
+
+    routes = []
+    for origin in city_names:
+        for destination in city_names:
+            if origin != destination:
+                route = Route(name=f'{origin} → {destination}', origin=origin, destination=destination,
+                              distance_km=rng.randint(80, 400), estimated_duration=rng.randint(120, 420))
+                db.session.add(route)
+                routes.append(route)
+    db.session.flush()
+
+    prices = {}
+    for route in routes:
+        for operator in operator_rows:
+            regular_price = rng.randint(3, 9) * 1000
+            prices[(route.id, operator.id)] = (regular_price, regular_price + 3000)
+            db.session.add(RouteOperatorAssignment(route_id=route.id, operator_id=operator.id,
+                                                   regular_seat_price=regular_price, vip_seat_price=regular_price + 3000,
+                                                   trips_per_day=len(times), departure_times=json.dumps(times)))
+
+    customers = [Customer(name=f'Passenger {index}', phone=f'67{index:07d}', email=f'passenger{index}@example.com')
+                 for index in range(500)]
+    db.session.add_all(customers)
+    db.session.flush()
+
+    start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    trips = []
+    for day in range(days):
+        date = start + timedelta(days=day)
+        for route in routes:
+            for operator in operator_rows:
+                regular_price, vip_price = prices[(route.id, operator.id)]
+                for time_index, time_str in enumerate(times):
+                    hour, minute = map(int, time_str.split(':'))
+                    departure = date.replace(hour=hour, minute=minute)
+                    for bus_type, price, prefix in ((regular, regular_price, 'REG'), (vip, vip_price, 'VIP')):
+                        trips.append({
+                            'departure_time': departure,
+                            'arrival_time': departure + timedelta(minutes=route.estimated_duration),
+                            'seat_price': price,
+                            'available_seats': bus_type.capacity,
+                            'status': 'scheduled',
+                            'virtual_bus_id': f'{prefix}-{time_index + 1}',
+                            'route_id': route.id,
+                            'operator_id': operator.id,
+                            'bus_type_id': bus_type.id,
+                            'created_at': datetime.utcnow(),
+                        })
+    db.session.execute(Trip.__table__.insert(), trips)
+
+    capacities = {regular.id: regular.capacity, vip.id: vip.capacity}
+    bookings = []
+    seat_updates = []
+    for trip_id, bus_type_id, price in db.session.query(Trip.id, Trip.bus_type_id, Trip.seat_price):
+        capacity = capacities[bus_type_id]
+        free = list(range(1, capacity + 1))
+        rng.shuffle(free)
+        taken = 0
+        while taken < capacity * fill:
+            seats = [free.pop() for _ in range(min(rng.randint(1, 3), len(free)))]
+            taken += len(seats)
+            bookings.append({
+                'booking_reference': f'LT{len(bookings):07d}',
+                'seat_numbers': json.dumps([str(seat) for seat in seats]),
+                'total_amount': price * len(seats),
+                'payment_status': 'paid',
+                'payment_method': rng.choice(['MTN', 'ORANGE']),
+                'status': 'confirmed',
+                'trip_id': trip_id,
+                'customer_id': rng.choice(customers).id,
+                'created_at': datetime.utcnow(),
+                'updated_at': datetime.utcnow(),
+            })
+        seat_updates.append({'trip_id': trip_id, 'available': capacity - taken})
+    db.session.execute(Booking.__table__.insert(), bookings)
+    db.session.execute(
+        Trip.__table__.update().where(Trip.__table__.c.id == db.bindparam('trip_id'))
+        .values(available_seats=db.bindparam('available')),
+        seat_updates
+    )
+    db.session.commit()
+
+    # Core inserts bypass the rollup listeners
+    rebuild_daily_stats()
+
+    return {'operators': len(operator_rows), 'routes': len(routes), 'trips': len(trips),
+            'bookings': len(bookings), 'customers': len(customers)}
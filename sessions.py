@@ -0,0 +1,229 @@
+"""Server-side sessions: the cookie carries only a random session id.
+
+SESSION_TYPE selects where the data lives:
+
+- ``sqlalchemy`` (default): the ``web_session`` table of the main database,
+  shared by all workers. Created by ``flask --app app migrate``.
+- ``cache``: the shared cache (cache.py). Only use it with CACHE_TYPE=redis;
+  the per-worker 'simple' cache would lose a session whenever a request lands
+  on another worker.
+- ``cookie``: Flask's signed cookie, as before.
+
+Data is stored as compact tagged JSON (the same format Flask signs into its
+cookie, without the signature and base64). A session is written only when a
+view changed it, or when less than half of SESSION_LIFETIME is left, so
+browsing with an unchanged session costs one primary-key read per request and
+no write. Static files, /metrics and /health never load the session.
+
+Expired rows are deleted at most every SESSION_SWEEP_INTERVAL seconds per
+worker, on a write; ``flask --app app sweep-sessions`` does the same from cron.
+"""
+import logging
+import re
+import secrets
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from flask.sessions import SecureCookieSessionInterface, SessionInterface, SessionMixin
+from sqlalchemy import delete, insert, select, update
+from werkzeug.datastructures import CallbackDict
+
+from models import db, WebSession
+
+logger = logging.getLogger(__name__)
+
+SESSION_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{43}$')  # secrets.token_urlsafe(32)
+# Paths that never read or write the session, besides the static folder. Flask
+# opens the session before matching the URL, so there is no endpoint to check yet
+SKIP_PATHS = ('/metrics', '/health')
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, expires_at=None):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.expires_at = expires_at
+        self.modified = False
+        self.regenerated = False
+        self.previous_sid = None
+
+class SqlAlchemyStore:
+    """Sessions in the web_session table"""
+
+    def __init__(self):
+        self._last_sweep = 0.0
+
+    def load(self, sid):
+        with db.engine.connect() as connection:
+            row = connection.execute(
+                select(WebSession.data, WebSession.expires_at).where(WebSession.id == sid)
+            ).first()
+        if row is None or row.expires_at < datetime.utcnow():
+            return None, None
+        return row.data, row.expires_at
+
+    def save(self, sid, data, expires_at):
+        with db.engine.begin() as connection:
+            updated = connection.execute(
+                update(WebSession).where(WebSession.id == sid).values(data=data, expires_at=expires_at)
+            )
+            if not updated.rowcount:
+                connection.execute(insert(WebSession).values(id=sid, data=data, expires_at=expires_at))
+
+    def delete(self, sid):
+        with db.engine.begin() as connection:
+            connection.execute(delete(WebSession).where(WebSession.id == sid))
+
+    def sweep(self):
+        """Delete expired sessions; returns how many"""
+        with db.engine.begin() as connection:
+            return connection.execute(delete(WebSession).where(WebSession.expires_at < datetime.utcnow())).rowcount
+
+    def maybe_sweep(self, interval):
+        if time.monotonic() - self._last_sweep < interval:
+            return
+        self._last_sweep = time.monotonic()
+        removed = self.sweep()
+        if removed:
+            logger.info('Removed %d expired session(s)', removed)
+
+class CacheStore:
+    """Sessions in the shared cache, which expires them itself"""
+
+    def load(self, sid):
+        from cache import get_cache
+
+        entry = get_cache().get(f'session:{sid}')
+        if entry is None:
+            return None, None
+        data, expires_at = entry
+        return data, datetime.fromtimestamp(expires_at)
+
+    def save(self, sid, data, expires_at):
+        from cache import get_cache
+
+        timeout = (expires_at - datetime.utcnow()).total_seconds()
+        get_cache().set(f'session:{sid}', [data, expires_at.timestamp()], timeout)
+
+    def delete(self, sid):
+        from cache import get_cache
+
+        get_cache().delete(f'session:{sid}')
+
+    def sweep(self):
+        return 0
+
+    def maybe_sweep(self, interval):
+        pass
+
+class ServerSideSessionInterface(SessionInterface):
+    serializer = SecureCookieSessionInterface.serializer  # Flask's tagged JSON
+
+    def __init__(self, store, lifetime, sweep_interval, skip_paths=SKIP_PATHS):
+        self.store = store
+        self.lifetime = timedelta(seconds=lifetime)
+        self.sweep_interval = sweep_interval
+        self.skip_paths = tuple(skip_paths)
+
+    def open_session(self, app, request):
+        if request.path.startswith(self.skip_paths):
+            return self.make_null_session(app)
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if not sid or not SESSION_ID_PATTERN.match(sid):
+            return ServerSideSession()
+        try:
+            data, expires_at = self.store.load(sid)
+        except Exception as e:
+            logger.warning('Session store unavailable, starting an empty session: %s', e)
+            return ServerSideSession()
+        if data is None:
+            return ServerSideSession()
+        try:
+            return ServerSideSession(self.serializer.loads(data), sid=sid, expires_at=expires_at)
+        except ValueError:
+            logger.warning('Unreadable session %s..., starting an empty one', sid[:8])
+            return ServerSideSession()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        try:
+            if session.previous_sid:
+                self.store.delete(session.previous_sid)
+            if not session:
+                # Emptied (e.g. logout): drop the stored data and the cookie
+                if session.sid and session.modified:
+                    self.store.delete(session.sid)
+                    response.delete_cookie(name, domain=domain, path=path)
+                return
+            now = datetime.utcnow()
+            renew = session.expires_at is None or session.expires_at - now < self.lifetime / 2
+            if not (session.modified or renew):
+                return
+
+            is_new = session.sid is None
+            if is_new:
+                session.sid = secrets.token_urlsafe(32)
+            session.expires_at = now + self.lifetime
+            self.store.save(session.sid, self.serializer.dumps(dict(session)), session.expires_at)
+            self.store.maybe_sweep(self.sweep_interval)
+        except Exception as e:
+            logger.error('Could not save session: %s', e)
+            return
+
+        if is_new or session.regenerated or session.permanent:
+            response.vary.add('Cookie')
+            response.set_cookie(
+                name, session.sid,
+                expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app),
+                domain=domain,
+                path=path,
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app),
+            )
+
+def regenerate_session(session):
+    """Give `session` a new id, e.g. on login, so an id planted beforehand is useless"""
+    if isinstance(session, ServerSideSession) and session.sid:
+        session.previous_sid = session.sid
+        session.sid = secrets.token_urlsafe(32)
+        session.regenerated = True
+        session.modified = True
+
+def create_store(session_type):
+    if session_type == 'sqlalchemy':
+        return SqlAlchemyStore()
+    if session_type == 'cache':
+        return CacheStore()
+    raise ValueError(f'Unsupported SESSION_TYPE: {session_type}')
+
+def init_sessions(app):
+    """Keep session data on the server unless SESSION_TYPE is 'cookie'"""
+    session_type = app.config.get('SESSION_TYPE', 'sqlalchemy')
+    if session_type == 'cookie':
+        return
+    if session_type == 'cache' and app.config.get('CACHE_TYPE') != 'redis':
+        logger.warning('SESSION_TYPE=cache without CACHE_TYPE=redis: sessions are lost between workers')
+    app.session_interface = ServerSideSessionInterface(
+        create_store(session_type),
+        app.config.get('SESSION_LIFETIME', 86400),
+        app.config.get('SESSION_SWEEP_INTERVAL', 600),
+        SKIP_PATHS + ((app.static_url_path + '/',) if app.static_url_path else ()),
+    )
+
+@click.command('sweep-sessions')
+@with_appcontext
+def sweep_sessions_command():
+    """Delete expired server-side sessions."""
+    interface = current_app.session_interface
+    if not isinstance(interface, ServerSideSessionInterface):
+        click.echo('Sessions are stored in cookies, nothing to sweep')
+        return
+    click.echo(f'Removed {interface.store.sweep()} expired session(s)')
@@ -0,0 +1,49 @@
+"""{% cache %} tag: render a template fragment once per language and data version.
+
+    {% cache 'index.content' %} ...static markup... {% endcache %}
+    {% cache 'index.stats', 'route', 'operator' %} ...uses routes/operators... {% endcache %}
+
+The first argument names the fragment; any further ones are cache tags (table
+names, see cache.py). The rendered HTML is stored in the shared cache under
+the name, the request language and the template file's modification time, and
+is rendered again once a tag is invalidated, the template file changes or
+CACHE_DEFAULT_TIMEOUT passes.
+
+Only the language may vary inside a fragment: anything read from the request,
+the session or flashed messages would be served to the next visitor.
+"""
+import os
+
+from flask_babel import get_locale
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+from cache import cached
+
+class FragmentCacheExtension(Extension):
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+
+        # Templates are recompiled when their file changes; the new mtime
+        # keeps fragments rendered from the old markup from being reused
+        try:
+            version = int(os.path.getmtime(parser.filename)) if parser.filename else 0
+        except OSError:
+            version = 0
+        call = self.call_method('_render', [nodes.Const(parser.name), nodes.Const(version), nodes.List(args)])
+        return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def _render(self, template, version, args, caller):
+        name, *tags = args
+        key = f'fragment:{template}:{version}:{name}:{get_locale()}'
+        return Markup(cached(key, lambda: str(caller()), tags=tags))
+
+def init_template_cache(app):
+    app.jinja_env.add_extension(FragmentCacheExtension)
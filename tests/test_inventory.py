@@ -0,0 +1,118 @@
+"""Seat holds and booking confirmation (inventory.py)"""
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from inventory import SeatUnavailable, confirm_booking, hold_seats, release_expired_holds, unavailable_seats
+from models import db, Booking, SeatBlock, Trip
+
+def expire(block):
+    block.expires_at = datetime.utcnow() - timedelta(minutes=1)
+    db.session.commit()
+
+def test_hold_seats(trip):
+    block = hold_seats(trip.id, ['1', '2'], 'session-a')
+
+    assert block.get_seat_numbers() == ['1', '2']
+    assert unavailable_seats(trip.id, exclude_session='session-b') == {'1', '2'}
+    assert unavailable_seats(trip.id, exclude_session='session-a') == set()
+
+def test_hold_seats_rejects_seat_held_by_another_session(trip):
+    hold_seats(trip.id, ['1', '2'], 'session-a')
+
+    with pytest.raises(SeatUnavailable) as excinfo:
+        hold_seats(trip.id, ['2', '3'], 'session-b')
+
+    assert excinfo.value.seat == '2'
+    assert db.session.scalar(db.select(db.func.count(SeatBlock.id))) == 1
+
+def test_hold_seats_replaces_previous_hold_of_same_session(trip):
+    hold_seats(trip.id, ['1', '2'], 'session-a')
+    hold_seats(trip.id, ['2', '3'], 'session-a')
+
+    blocks = SeatBlock.query.filter_by(trip_id=trip.id).all()
+    assert [block.get_seat_numbers() for block in blocks] == [['2', '3']]
+
+def test_hold_seats_rejects_confirmed_seat(trip, make_booking):
+    confirm_booking(make_booking(['5']))
+
+    with pytest.raises(SeatUnavailable):
+        hold_seats(trip.id, ['5'], 'session-a')
+
+def test_hold_seats_takes_over_expired_hold(trip):
+    expire(hold_seats(trip.id, ['1'], 'session-a'))
+
+    hold_seats(trip.id, ['1'], 'session-b')
+
+    assert [block.session_id for block in SeatBlock.query.all()] == ['session-b']
+
+def test_concurrent_holds_on_same_seat(app, trip):
+    trip_id = trip.id
+    db.session.remove()  # the threads use their own sessions
+    barrier = threading.Barrier(2)
+    outcomes = []
+
+    def hold(session_id):
+        with app.app_context():
+            barrier.wait()
+            try:
+                hold_seats(trip_id, ['7'], session_id)
+                outcomes.append('held')
+            except SeatUnavailable:
+                outcomes.append('unavailable')
+            finally:
+                db.session.remove()
+
+    threads = [threading.Thread(target=hold, args=(f'session-{n}',)) for n in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(outcomes) == ['held', 'unavailable']
+    assert db.session.scalar(db.select(db.func.count(SeatBlock.id))) == 1
+
+def test_confirm_booking(trip, make_booking):
+    booking = make_booking(['3', '4'])
+
+    assert confirm_booking(booking, payment_reference='TX-1', payment_method='MTN') is True
+
+    booking = db.session.get(Booking, booking.id)
+    assert (booking.status, booking.payment_status, booking.payment_reference) == ('confirmed', 'paid', 'TX-1')
+    assert db.session.get(Trip, trip.id).available_seats == 46
+
+def test_confirm_booking_twice(trip, make_booking):
+    booking = make_booking(['3', '4'])
+    assert confirm_booking(booking, payment_reference='TX-1') is True
+
+    assert confirm_booking(booking, payment_reference='TX-2') is False
+
+    booking = db.session.get(Booking, booking.id)
+    assert booking.payment_reference == 'TX-1'
+    assert db.session.get(Trip, trip.id).available_seats == 46
+
+def test_release_expired_holds(trip):
+    expired = hold_seats(trip.id, ['1'], 'session-a')
+    hold_seats(trip.id, ['2'], 'session-b')
+    expire(expired)
+
+    assert release_expired_holds() == 1
+    db.session.commit()
+
+    assert [block.session_id for block in SeatBlock.query.all()] == ['session-b']
+
+def test_release_expired_holds_of_one_trip(trip):
+    expire(hold_seats(trip.id, ['1'], 'session-a'))
+
+    assert release_expired_holds(trip.id + 1) == 0
+    assert release_expired_holds(trip.id) == 1
+    db.session.commit()
+
+def test_cleanup_expired(trip):
+    expired = hold_seats(trip.id, ['1'], 'session-a')
+    hold_seats(trip.id, ['2'], 'session-b')
+    expire(expired)
+
+    assert SeatBlock.cleanup_expired() == 1
+    assert SeatBlock.query.count() == 1
@@ -0,0 +1,156 @@
+"""Set-based bulk operations on trips.
+
+Each operation runs as a handful of SQL statements over the trips matching
+the admin list filters (or an explicit id list), instead of loading and
+deleting/updating trips one at a time. The "has bookings" check is a single
+NOT EXISTS anti-join.
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update, delete, func, exists, and_
+
+from models import db, Trip, Booking, SeatBlock
+
+TRIP_STATUSES = ['scheduled', 'departed', 'arrived', 'cancelled']
+BULK_ACTIONS = ['delete', 'cancel', 'status', 'reschedule']
+
+def parse_trip_filters(source):
+    """Read the trips list filters from request.args / request.form"""
+    return {
+        'status': source.get('status', ''),
+        'date_from': source.get('date_from', ''),
+        'date_to': source.get('date_to', ''),
+        'route_id': source.get('route_id', ''),
+        'operator_id': source.get('operator_id', '')
+    }
+
+def trip_filter_conditions(filters, trip_ids=None):
+    """Build WHERE conditions on Trip from list filters and/or explicit ids.
+
+    date_to is inclusive: trips departing at any time on that day match.
+    """
+    conditions = []
+
+    if trip_ids:
+        conditions.append(Trip.id.in_([int(trip_id) for trip_id in trip_ids]))
+
+    if filters.get('status'):
+        conditions.append(Trip.status == filters['status'])
+
+    if filters.get('date_from'):
+        date_from = datetime.strptime(filters['date_from'], '%Y-%m-%d')
+        conditions.append(Trip.departure_time >= date_from)
+
+    if filters.get('date_to'):
+        date_to = datetime.strptime(filters['date_to'], '%Y-%m-%d') + timedelta(days=1)
+        conditions.append(Trip.departure_time < date_to)
+
+    if filters.get('route_id'):
+        conditions.append(Trip.route_id == int(filters['route_id']))
+
+    if filters.get('operator_id'):
+        conditions.append(Trip.operator_id == int(filters['operator_id']))
+
+    return conditions
+
+def _has_bookings():
+    return exists().where(Booking.trip_id == Trip.id)
+
+def _matched_summary(conditions):
+    """Count matched trips, how many have bookings, and their departure range"""
+    row = db.session.execute(
+        select(
+            func.count(Trip.id),
+            func.count(Trip.id).filter(_has_bookings()),
+            func.min(Trip.departure_time),
+            func.max(Trip.departure_time)
+        ).where(*conditions)
+    ).one()
+    return {'matched': row[0], 'with_bookings': row[1], 'first_departure': row[2], 'last_departure': row[3]}
+
+def _refresh_rollups(first_departure, last_departure, shift=None):
+    """Recompute analytics rollups for the days touched by a bulk statement"""
+    if not first_departure:
+        return
+    from analytics import recompute_dates
+
+    ranges = [(first_departure, last_departure)]
+    if shift:
+        ranges.append((first_departure + shift, last_departure + shift))
+
+    dates = set()
+    for start, end in ranges:
+        current = start.date()
+        while current <= end.date():
+            dates.add(current)
+            current += timedelta(days=1)
+    recompute_dates(db.session.connection(), dates)
+
+def _shifted(column, shift):
+    """column + shift, keeping SQLite's stored DateTime text format"""
+    if db.session.get_bind().dialect.name == 'sqlite':
+        minutes = int(shift.total_seconds() // 60)
+        return func.strftime('%Y-%m-%d %H:%M:%S.000000', column, f'{minutes:+d} minutes')
+    return column + shift
+
+def bulk_delete(conditions):
+    """Delete matched trips that have no bookings"""
+    summary = _matched_summary(conditions)
+    deletable = and_(*conditions, ~_has_bookings())
+    deletable_ids = select(Trip.id).where(deletable)
+
+    db.session.execute(
+        delete(SeatBlock).where(SeatBlock.trip_id.in_(deletable_ids)).execution_options(synchronize_session=False)
+    )
+    result = db.session.execute(
+        delete(Trip).where(deletable).execution_options(synchronize_session=False)
+    )
+    _refresh_rollups(summary['first_departure'], summary['last_departure'])
+    db.session.commit()
+
+    return {'affected': result.rowcount, 'skipped': summary['with_bookings'], 'matched': summary['matched']}
+
+def bulk_set_status(conditions, status, only_status=None):
+    """Set the status of matched trips (optionally only those currently in `only_status`)"""
+    if status not in TRIP_STATUSES:
+        raise ValueError(f'Invalid trip status: {status}')
+    if only_status:
+        conditions = conditions + [Trip.status == only_status]
+
+    summary = _matched_summary(conditions)
+    result = db.session.execute(
+        update(Trip).where(*conditions, Trip.status != status).values(status=status).execution_options(synchronize_session=False)
+    )
+    _refresh_rollups(summary['first_departure'], summary['last_departure'])
+    db.session.commit()
+
+    return {'affected': result.rowcount, 'skipped': summary['matched'] - result.rowcount, 'matched': summary['matched']}
+
+def bulk_cancel(conditions):
+    """Cancel matched trips that are still scheduled"""
+    return bulk_set_status(conditions, 'cancelled', only_status='scheduled')
+
+def bulk_reschedule(conditions, shift_minutes, include_booked=False):
+    """Move departure and arrival of matched scheduled trips by `shift_minutes`.
+
+    Trips that already have bookings are left alone unless include_booked is set.
+    """
+    if not shift_minutes:
+        raise ValueError('Please enter a non-zero shift in minutes')
+    shift = timedelta(minutes=shift_minutes)
+
+    conditions = conditions + [Trip.status == 'scheduled']
+    summary = _matched_summary(conditions)
+    if not include_booked:
+        conditions = conditions + [~_has_bookings()]
+
+    result = db.session.execute(
+        update(Trip).where(*conditions).values(
+            departure_time=_shifted(Trip.departure_time, shift),
+            arrival_time=_shifted(Trip.arrival_time, shift)
+        ).execution_options(synchronize_session=False)
+    )
+    _refresh_rollups(summary['first_departure'], summary['last_departure'], shift=shift)
+    db.session.commit()
+
+    return {'affected': result.rowcount, 'skipped': summary['matched'] - result.rowcount, 'matched': summary['matched']}
@@ -1,17 +1,38 @@
-from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash, session, g
+from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash, session, g, abort, current_app
 from models import db, Operator, Route, Trip, Booking, Customer, OperatorBusType, OperatorLocation, RouteOperatorAssignment, BusType, SeatBlock
 from mesomb_payment import get_mesomb_client
+from search_index import booking_search_condition
+from archive import find_archived_booking, archived_bookings_for_customers, matching_customer_ids
+from inventory import hold_seats, confirm_booking, lock_trip, SeatUnavailable
+from db_backend import read_session
+from cache import cached
+from ratelimit import rate_limit, rate_limit_exempt
+from http_cache import conditional
 from datetime import datetime, timedelta
 import json
 from functools import wraps
 from jinja2 import TemplateNotFound
+import logging
 
 user_bp = Blueprint('user', __name__)
+logger = logging.getLogger(__name__)
 
 # Language configuration
 SUPPORTED_LANGUAGES = ['en', 'fr']
 DEFAULT_LANGUAGE = 'fr'
 
+# Cached API responses and the tables they are read from (see cache.py)
+ROUTES_CACHE_TAGS = ('route',)
+ROUTE_OPERATORS_CACHE_TAGS = ('route', 'route_operator_assignment', 'operator')
+SEARCH_CACHE_TAGS = ('route', 'trip', 'operator', 'operator_bus_type', 'bus_type')
+UPCOMING_TRIPS_TAGS = ('route', 'trip', 'operator', 'bus_type')
+# Not a table: the widget settings live in .env and are saved from admin > Settings
+CONTACT_SETTINGS_TAGS = ('contact_settings',)
+# Short, since results for today drop trips as they pass the booking cutoff
+SEARCH_CACHE_SECONDS = 30
+# Likewise for the homepage feed, which drops trips as they depart
+UPCOMING_TRIPS_CACHE_SECONDS = 30
+
 def get_language_from_url():
     """Extract language from URL path"""
     path_parts = request.path.strip('/').split('/')
@@ -39,14 +60,21 @@ def language_required(f):
     return decorated_function
 
 # Helper to render language-specific booking templates with fallback
+# (lang, template name) -> template to render, resolved once per worker
+_booking_templates = {}
+
 def render_booking_template(lang: str, template_name: str, **context):
-    """Try to render booking/<lang>/<template>.html, fallback to booking/<template>.html"""
-    lang_template = f"booking/{lang}/{template_name}"
-    default_template = f"booking/{template_name}"
-    try:
-        return render_template(lang_template, **context)
-    except TemplateNotFound:
-        return render_template(default_template, **context)
+    """Render booking/<lang>/<template>.html if there is one, else booking/<template>.html"""
+    key = (lang, template_name)
+    if key not in _booking_templates:
+        # A miss isn't cached by Jinja: it would search every template folder on each request
+        lang_template = f"booking/{lang}/{template_name}"
+        try:
+            current_app.jinja_env.get_template(lang_template)
+            _booking_templates[key] = lang_template
+        except TemplateNotFound:
+            _booking_templates[key] = f"booking/{template_name}"
+    return render_template(_booking_templates[key], **context)
 
 # Root redirect to default language
 @user_bp.route('/')
@@ -68,14 +96,13 @@ def search_results(lang):
     # Get search parameters from URL
     from_city = request.args.get('from')
     to_city = request.args.get('to')
-    operator_id = request.args.get('operator')
+    operator_id = request.args.get('operator', type=int)
     travel_date = request.args.get('date')
     
     # Get operator name if operator_id is provided
     operator_name = None
     if operator_id:
-        operator = Operator.query.get(operator_id)
-        operator_name = operator.name if operator else None
+        operator_name = cached(f'operator-name:{operator_id}', lambda: _operator_name(operator_id), tags=('operator',))
     
     return render_template('search_results.html',
                          from_city=from_city,
@@ -85,11 +112,20 @@ def search_results(lang):
                          travel_date=travel_date,
                          language=g.language)
 
+def _operator_name(operator_id):
+    operator = read_session().get(Operator, operator_id)
+    return operator.name if operator else None
+
 # API Routes
 @user_bp.route('/api/routes')
+@conditional(tags=ROUTES_CACHE_TAGS)
 def api_routes():
     """Get all active routes for search form"""
-    routes = Route.query.filter_by(is_active=True).all()
+    return jsonify(cached('routes:cities', _route_cities, tags=ROUTES_CACHE_TAGS))
+
+def _route_cities():
+    reads = read_session()
+    routes = reads.query(Route).filter_by(is_active=True).all()
     
     # Extract unique cities for from and to dropdowns
     from_cities = list(set([r.origin for r in routes]))
@@ -99,21 +135,35 @@ def api_routes():
     from_cities.sort()
     to_cities.sort()
     
-    return jsonify({
+    return {
         'from': from_cities,
         'to': to_cities
-    })
+    }
 
 @user_bp.route('/api/upcoming-trips')
+@conditional(tags=UPCOMING_TRIPS_TAGS, max_age=30, period=60)
 def api_upcoming_trips():
     """Get upcoming trips from different agencies"""
-    from datetime import datetime
+    # The homepage feed: built once per UPCOMING_TRIPS_CACHE_SECONDS, or as
+    # soon as a booking (available_seats) or an admin edit writes to a tagged table
+    return jsonify(cached('upcoming-trips', _upcoming_trips,
+                          tags=UPCOMING_TRIPS_TAGS, timeout=UPCOMING_TRIPS_CACHE_SECONDS))
+
+def _upcoming_trips():
+    """Up to 12 bookable trips in the next 7 days, in one query"""
+    reads = read_session()
     
     # Get trips for the next 7 days
     now = datetime.now()
     end_date = now + timedelta(days=7)
     
-    trips = Trip.query.filter(
+    rows = reads.query(
+        Trip.id, Trip.departure_time, Trip.seat_price, Trip.available_seats,
+        Route.origin, Route.destination, Operator.name.label('operator_name'), BusType.category
+    ).join(Route, Trip.route_id == Route.id) \
+     .join(Operator, Trip.operator_id == Operator.id) \
+     .outerjoin(BusType, Trip.bus_type_id == BusType.id) \
+     .filter(
         Trip.departure_time >= now,
         Trip.departure_time <= end_date,
         Trip.status == 'scheduled',
@@ -123,27 +173,28 @@ def api_upcoming_trips():
     trip_list = []
     seen_routes = set()  # To ensure variety from different routes
     
-    for trip in trips:
-        route_key = f"{trip.route.origin}-{trip.route.destination}"
+    for row in rows:
+        route_key = f"{row.origin}-{row.destination}"
         if route_key not in seen_routes or len(trip_list) < 6:
             seen_routes.add(route_key)
             trip_list.append({
-                'id': trip.id,
-                'route': f"{trip.route.origin} → {trip.route.destination}",
-                'from': trip.route.origin,
-                'to': trip.route.destination,
-                'operator': trip.operator.name,
-                'bus_type': trip.bus_type.category if trip.bus_type else 'regular',
-                'departure_time': trip.departure_time.strftime('%H:%M'),
-                'departure_date': trip.departure_time.strftime('%Y-%m-%d'),
-                'date': trip.departure_time.strftime('%d/%m'),
-                'price': f"{trip.seat_price:,.0f}",
-                'available_seats': trip.available_seats
+                'id': row.id,
+                'route': f"{row.origin} → {row.destination}",
+                'from': row.origin,
+                'to': row.destination,
+                'operator': row.operator_name,
+                'bus_type': row.category or 'regular',
+                'departure_time': row.departure_time.strftime('%H:%M'),
+                'departure_date': row.departure_time.strftime('%Y-%m-%d'),
+                'date': row.departure_time.strftime('%d/%m'),
+                'price': f"{row.seat_price:,.0f}",
+                'available_seats': row.available_seats
             })
     
-    return jsonify(trip_list)
+    return trip_list
 
 @user_bp.route('/api/route-operators')
+@conditional(tags=ROUTE_OPERATORS_CACHE_TAGS)
 def api_route_operators():
     """Get operators for a specific route"""
     from_city = request.args.get('from')
@@ -152,8 +203,15 @@ def api_route_operators():
     if not from_city or not to_city:
         return jsonify([])
     
+    return jsonify(cached(f'route-operators:{from_city}|{to_city}',
+                          lambda: _route_operators(from_city, to_city),
+                          tags=ROUTE_OPERATORS_CACHE_TAGS))
+
+def _route_operators(from_city, to_city):
+    reads = read_session()
+    
     # Find the route
-    route = Route.query.filter_by(
+    route = reads.query(Route).filter_by(
         origin=from_city,
         destination=to_city,
         is_active=True
@@ -162,16 +220,16 @@ def api_route_operators():
     if not route:
         # If no direct route found, return all active operators as fallback
         # This ensures users can still search even if route assignments aren't set up
-        operators = Operator.query.filter_by(is_active=True).all()
-        return jsonify([{
+        operators = reads.query(Operator).filter_by(is_active=True).all()
+        return [{
             'id': op.id,
             'name': op.name,
             'code': op.code,
             'logo_url': op.logo_url
-        } for op in operators])
+        } for op in operators]
     
     # Get operators assigned to this route
-    assignments = RouteOperatorAssignment.query.filter_by(
+    assignments = reads.query(RouteOperatorAssignment).filter_by(
         route_id=route.id,
         is_active=True
     ).all()
@@ -188,7 +246,7 @@ def api_route_operators():
     
     # If no operators are assigned to this route, return all active operators
     if not operators:
-        all_operators = Operator.query.filter_by(is_active=True).all()
+        all_operators = reads.query(Operator).filter_by(is_active=True).all()
         operators = [{
             'id': op.id,
             'name': op.name,
@@ -196,19 +254,17 @@ def api_route_operators():
             'logo_url': op.logo_url
         } for op in all_operators]
     
-    return jsonify(operators)
+    return operators
 
 @user_bp.route('/api/search-trips')
 def api_search_trips():
     """Search for available trips"""
-    
     from_city = request.args.get('from')
     to_city = request.args.get('to')
     operator_id = request.args.get('operator', type=int)
     travel_date = request.args.get('date')
     
-    print(f"\n=== Trip Search Debug ===")
-    print(f"From: {from_city}, To: {to_city}, Operator: {operator_id}, Date: {travel_date}")
+    logger.debug('Trip search from=%s to=%s operator=%s date=%s', from_city, to_city, operator_id, travel_date)
     
     # Validate required parameters
     if not from_city or not to_city or not travel_date:
@@ -228,6 +284,15 @@ def api_search_trips():
     except ValueError:
         return jsonify({'trips': [], 'error': 'Invalid date format'}), 400
     
+    key = f'search-trips:{from_city}|{to_city}|{operator_id}|{date_obj.isoformat()}'
+    return jsonify(cached(key, lambda: _search_trips(from_city, to_city, operator_id, date_obj),
+                          tags=SEARCH_CACHE_TAGS, timeout=SEARCH_CACHE_SECONDS))
+
+def _search_trips(from_city, to_city, operator_id, date_obj):
+    """Search results as a dict; api_search_trips has validated the arguments"""
+    reads = read_session()
+    travel_date = date_obj.isoformat()
+    
     # Get current time in Cameroon timezone using app configuration
     from app import get_cameroon_time, get_cameroon_time_utc
     current_time_cameroon = get_cameroon_time()
@@ -236,39 +301,36 @@ def api_search_trips():
     # Add 30 minutes buffer for booking cutoff
     booking_cutoff = current_time_utc + timedelta(minutes=30)
     
-    print(f"Current time (Cameroon): {current_time_cameroon}")
-    print(f"Current time (UTC): {current_time_utc}")
-    print(f"Booking cutoff (UTC): {booking_cutoff}")
-    print(f"Search date: {date_obj}")
-    print(f"Current date (UTC): {current_time_utc.date()}")
+    logger.debug('Trip search times: cameroon=%s utc=%s cutoff=%s search_date=%s',
+                 current_time_cameroon, current_time_utc, booking_cutoff, date_obj)
     
     # Don't allow searching for past dates
     if date_obj < current_time_utc.date():
-        return jsonify({'trips': [], 'message': 'Cannot search for trips in the past'})
+        return {'trips': [], 'message': 'Cannot search for trips in the past'}
     
     # Find the route
-    route = Route.query.filter_by(
+    route = reads.query(Route).filter_by(
         origin=from_city,
         destination=to_city,
         is_active=True
     ).first()
     
-    print(f"Direct route found: {route}")
+    logger.debug('Direct route found: %s', route)
     
     if not route:
         # Check for reverse route (for return trips)
-        route = Route.query.filter_by(
+        route = reads.query(Route).filter_by(
             origin=to_city,
             destination=from_city,
             is_active=True
         ).first()
-        print(f"Reverse route found: {route}")
+        logger.debug('Reverse route found: %s', route)
         
         if not route:
-            # Debug: Show all available routes
-            all_routes = Route.query.filter_by(is_active=True).all()
-            print(f"Available routes: {[(r.origin, r.destination) for r in all_routes]}")
-            return jsonify({'trips': [], 'message': 'No route found between these cities'})
+            if logger.isEnabledFor(logging.DEBUG):
+                all_routes = reads.query(Route).filter_by(is_active=True).all()
+                logger.debug('No route; available routes: %s', [(r.origin, r.destination) for r in all_routes])
+            return {'trips': [], 'message': 'No route found between these cities'}
     
     # Get trips for this route and date
     start_datetime = datetime.combine(date_obj, datetime.min.time())
@@ -278,14 +340,12 @@ def api_search_trips():
     if date_obj == current_time_utc.date():
         # Today's trips - exclude those departing within 30 minutes
         min_departure_time = booking_cutoff
-        print(f"Today's search - minimum departure time: {min_departure_time}")
     else:
         # Future dates - show all trips from start of day
         min_departure_time = start_datetime
-        print(f"Future date search - minimum departure time: {min_departure_time}")
     
     # Build query with required operator and exclude trips departing too soon
-    query = Trip.query.filter(
+    query = reads.query(Trip).filter(
         Trip.route_id == route.id,
         Trip.operator_id == operator_id,  # Operator is now required
         Trip.departure_time >= min_departure_time,
@@ -295,18 +355,17 @@ def api_search_trips():
     
     trips = query.order_by(Trip.departure_time).all()
     
-    print(f"Found {len(trips)} trips for route {route.id} on {travel_date}")
-    if trips:
-        print(f"Sample trip: {trips[0].departure_time}, Operator: {trips[0].operator_id}")
+    logger.debug('Found %d trips for route %s on %s (minimum departure %s)',
+                 len(trips), route.id, travel_date, min_departure_time)
     
     # Format trips for response
     trip_list = []
     for trip in trips:
         # Get operator info for each trip
-        trip_operator = Operator.query.get(trip.operator_id)
+        trip_operator = reads.get(Operator, trip.operator_id)
         
         # Get bus type configuration
-        config = OperatorBusType.query.filter_by(
+        config = reads.query(OperatorBusType).filter_by(
             operator_id=trip.operator_id,
             bus_type_id=trip.bus_type_id
         ).first()
@@ -330,7 +389,7 @@ def api_search_trips():
             'stops': route.get_waypoints() if route else []
         })
     
-    return jsonify({
+    return {
         'trips': trip_list,
         'total_trips': len(trip_list),
         'route': {
@@ -339,7 +398,7 @@ def api_search_trips():
             'distance': route.distance_km,
             'duration': route.estimated_duration
         }
-    })
+    }
 
 @user_bp.route('/<lang>/booking/seats')
 @language_required
@@ -519,8 +578,8 @@ def payment(lang):
                 products=products
             )
             
-            # Check payment result status
-            print(f"Payment result: {payment_result}")
+            # Full request/response is only logged at DEBUG (it carries customer data)
+            logger.debug('Payment result for %s: %s', booking_reference, payment_result)
             
             # Ensure payment_result is a dict
             if not isinstance(payment_result, dict):
@@ -528,7 +587,7 @@ def payment(lang):
                 return redirect(url_for('user.payment', lang=g.language, booking_id=booking.id))
             
         except Exception as e:
-            print(f"Payment processing exception: {str(e)}")
+            logger.exception('Payment processing exception for booking %s', booking.id)
             flash('Payment processing error. Please try again.', 'error')
             return redirect(url_for('user.payment', lang=g.language, booking_id=booking.id))
         
@@ -536,26 +595,26 @@ def payment(lang):
         mesomb_status = payment_result.get('mesomb_status', '').upper()
         payment_status = payment_result.get('status')
         
-        print(f"Processing payment result - Status: {payment_status}, MeSomb Status: {mesomb_status}")
+        logger.info('Payment result for booking %s: status=%s mesomb_status=%s',
+                    booking.id, payment_status, mesomb_status,
+                    extra={'booking_id': booking.id, 'service': payment_service, 'mesomb_status': mesomb_status})
         
         if mesomb_status == 'SUCCESS':
             # FINAL STATUS: Payment completed successfully - ONLY confirm booking here
-            booking.payment_reference = payment_result.get('transaction_id') or payment_result.get('trx_id')
-            booking.payment_method = payment_result.get('service', 'Mobile Money')
-            booking.payment_status = 'paid'
-            booking.status = 'confirmed'
-            
-            # Update available seats
-            trip.available_seats -= len(seat_list)
+            confirmed = confirm_booking(
+                booking,
+                payment_reference=payment_result.get('transaction_id') or payment_result.get('trx_id'),
+                payment_method=payment_result.get('service', 'Mobile Money'),
+            )
             
             # Send email ticket after successful payment
-            try:
-                from email_utils import send_ticket_email
-                send_ticket_email(booking)
-            except Exception as e:
-                print(f"Error sending ticket email: {str(e)}")
-                # Don't fail the booking if email fails
-            db.session.commit()
+            if confirmed:
+                try:
+                    from email_utils import send_ticket_email
+                    send_ticket_email(booking)
+                except Exception as e:
+                    logger.warning('Error sending ticket email for booking %s: %s', booking.id, e)
+                    # Don't fail the booking if email fails
             
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
                 return jsonify({
@@ -649,29 +708,20 @@ def payment_success(booking_id):
         mesomb = get_mesomb_client()
         status_result = mesomb.check_transaction_status(booking.payment_reference)
         
-        if status_result.get('status') == 'SUCCESS':
-            booking.payment_status = 'paid'
-            booking.status = 'confirmed'
-            
-            # Update available seats
-            trip = Trip.query.get(booking.trip_id)
-            seat_count = len(booking.get_seat_numbers())
-            trip.available_seats -= seat_count
-            
+        if status_result.get('status') == 'SUCCESS' and confirm_booking(booking):
             # Send email ticket after confirmation
             try:
                 from email_utils import send_ticket_email
                 send_ticket_email(booking)
             except Exception as e:
-                print(f"Error sending ticket email: {str(e)}")
-            
-            db.session.commit()
+                logger.warning('Error sending ticket email for booking %s: %s', booking.id, e)
     
     flash('Payment successful! Your booking has been confirmed.', 'success')
     return redirect(url_for('user.booking_confirmation', booking_id=booking.id))
 
 @user_bp.route('/<lang>/booking/status/<int:booking_id>')
 @language_required
+@rate_limit(per_session='20 per minute', per_ip='120 per minute')
 def check_booking_status(lang, booking_id):
     """Check and update booking payment status with MesomB"""
     booking = Booking.query.get_or_404(booking_id)
@@ -689,15 +739,7 @@ def check_booking_status(lang, booking_id):
         
         if status_result.get('success') and status_result.get('status') == 'SUCCESS':
             # Update booking to confirmed
-            booking.payment_status = 'paid'
-            booking.status = 'confirmed'
-            
-            # Update available seats
-            trip = Trip.query.get(booking.trip_id)
-            seat_count = len(booking.get_seat_numbers())
-            trip.available_seats -= seat_count
-            
-            db.session.commit()
+            confirm_booking(booking)
             
             flash('Payment confirmed! Your booking is complete.', 'success')
             return redirect(url_for('user.booking_confirmation', lang=g.language, booking_id=booking.id))
@@ -727,6 +769,7 @@ def booking_confirmation(lang, booking_id):
 
 @user_bp.route('/<lang>/booking/payment-status/<int:booking_id>')
 @language_required
+@rate_limit(per_session='20 per minute', per_ip='120 per minute')
 def payment_status_check(lang, booking_id):
     """Payment status checking page for users who left and returned"""
     booking = Booking.query.get_or_404(booking_id)
@@ -770,6 +813,7 @@ def generate_booking_reference():
 
 # Session management for seat selection
 @user_bp.route('/api/select-seats', methods=['POST'])
+@rate_limit(per_session='30 per minute', per_ip='120 per minute')
 def api_select_seats():
     """Store selected seats in session and block them temporarily"""
     data = request.json
@@ -791,25 +835,13 @@ def api_select_seats():
         session_id = str(uuid.uuid4())
         session['session_id'] = session_id
     
-    # Get already booked seats
-    bookings = Booking.query.filter_by(trip_id=trip_id, status='confirmed').all()
-    booked_seats = []
-    for booking in bookings:
-        booked_seats.extend(booking.get_seat_numbers())
-    
-    # Get blocked seats (excluding current session)
-    blocked_seats = SeatBlock.get_blocked_seats_for_trip(trip_id, exclude_session=session_id)
-    
-    # Check if any selected seat is already booked or blocked
-    unavailable_seats = set(booked_seats + blocked_seats)
-    for seat in seats:
-        if seat in unavailable_seats:
-            return jsonify({'error': f'Seat {seat} is no longer available'}), 400
-    
-    # Block the selected seats for 6 minutes
+    # Check availability and block the selected seats for 6 minutes, under the trip's lock
     try:
-        SeatBlock.block_seats(trip_id, seats, session_id)
+        hold_seats(trip_id, seats, session_id)
+    except SeatUnavailable as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
+        logger.warning('Failed to hold seats on trip %s: %s', trip_id, e)
         return jsonify({'error': 'Failed to reserve seats. Please try again.'}), 500
     
     # Store in session
@@ -843,6 +875,7 @@ def retrieve_ticket_page():
     return render_template('booking/retrieve_ticket.html')
 
 @user_bp.route('/api/retrieve-tickets')
+@rate_limit(per_session='10 per minute', per_ip='60 per minute')
 def api_retrieve_tickets():
     """API to retrieve tickets by phone, email, or reference"""
     method = request.args.get('method')
@@ -861,6 +894,7 @@ def api_retrieve_tickets():
                 customer_id=customer.id,
                 status='confirmed'
             ).order_by(Booking.created_at.desc()).all()
+            bookings += archived_bookings_for_customers([customer.id], status='confirmed')
             
             for booking in bookings:
                 tickets.append({
@@ -881,6 +915,7 @@ def api_retrieve_tickets():
                 customer_id=customer.id,
                 status='confirmed'
             ).order_by(Booking.created_at.desc()).all()
+            bookings += archived_bookings_for_customers([customer.id], status='confirmed')
             
             for booking in bookings:
                 tickets.append({
@@ -900,6 +935,12 @@ def api_retrieve_tickets():
             status='confirmed'
         ).first()
         
+        if not booking:
+            # Older trips live in the archive files
+            booking = find_archived_booking(reference=value)
+            if booking and booking.status != 'confirmed':
+                booking = None
+        
         if booking:
             tickets.append({
                 'id': booking.id,
@@ -915,6 +956,7 @@ def api_retrieve_tickets():
 
 # MesomB webhook handler
 @user_bp.route('/api/mesomb-webhook', methods=['POST'])
+@rate_limit_exempt
 def mesomb_webhook():
     """Handle MesomB payment webhook notifications"""
     try:
@@ -953,17 +995,7 @@ def mesomb_webhook():
         # Update booking based on payment status
         if status == 'SUCCESS':
             # Payment successful - confirm booking
-            booking.payment_status = 'paid'
-            booking.status = 'confirmed'
-            booking.payment_method = transaction.get('service', 'Mobile Money')
-            
-            # Update available seats
-            trip = Trip.query.get(booking.trip_id)
-            if trip:
-                seat_count = len(booking.get_seat_numbers())
-                trip.available_seats -= seat_count
-            
-            db.session.commit()
+            confirm_booking(booking, payment_method=transaction.get('service', 'Mobile Money'))
             
             return jsonify({
                 'status': 'success',
@@ -992,10 +1024,11 @@ def mesomb_webhook():
             }), 200
             
     except Exception as e:
-        print(f"MesomB webhook error: {str(e)}")
+        logger.exception('MeSomb webhook error')
         return jsonify({'error': 'Internal server error'}), 500
 
 @user_bp.route('/api/payment-status/<int:booking_id>')
+@rate_limit(per_session='30 per minute', per_ip='300 per minute')
 def api_payment_status(booking_id):
     """API endpoint to check payment status for AJAX calls with intelligent status checking"""
     booking = Booking.query.get_or_404(booking_id)
@@ -1016,15 +1049,13 @@ def api_payment_status(booking_id):
                 
                 # ONLY update if we get a SUCCESS - let MeSomb handle failures via webhooks
                 if mesomb_status == 'SUCCESS':
-                    booking.payment_status = 'paid'
-                    booking.status = 'confirmed'
-                    db.session.commit()
-                    print(f"✅ Payment SUCCESS detected for booking {booking.id}")
+                    confirm_booking(booking)
+                    logger.info('Payment SUCCESS detected for booking %s', booking.id)
                 # For any other status (PENDING, FAILED, etc.), keep current status
                 # Let the 120-second window complete naturally
                 
         except Exception as e:
-            print(f"MeSomb status check error (non-critical): {str(e)}")
+            logger.warning('MeSomb status check error (non-critical): %s', e)
             # Continue with current booking status - errors are non-critical
     
     # Determine status message and actions based on current booking status
@@ -1089,6 +1120,7 @@ def api_payment_status(booking_id):
     return jsonify(status_info)
 
 @user_bp.route('/api/booking-status/<int:booking_id>')
+@rate_limit(per_session='30 per minute', per_ip='300 per minute')
 def api_booking_status(booking_id):
     """API endpoint to check booking payment status - for AJAX polling"""
     try:
@@ -1117,24 +1149,13 @@ def api_booking_status(booking_id):
                     mesomb_status = status_result.get('status', 'UNKNOWN')
                     
                     if mesomb_status == 'SUCCESS':
-                        # Update booking to confirmed
-                        booking.payment_status = 'paid'
-                        booking.status = 'confirmed'
-                        
-                        # Update available seats
-                        trip = Trip.query.get(booking.trip_id)
-                        if trip:
-                            seat_count = len(booking.get_seat_numbers())
-                            trip.available_seats -= seat_count
-                        
-                        # Send email ticket after confirmation
-                        try:
-                            from email_utils import send_ticket_email
-                            send_ticket_email(booking)
-                        except Exception as e:
-                            print(f"Error sending ticket email: {str(e)}")
-                        
-                        db.session.commit()
+                        # Update booking to confirmed; only the request that confirms it sends the ticket
+                        if confirm_booking(booking):
+                            try:
+                                from email_utils import send_ticket_email
+                                send_ticket_email(booking)
+                            except Exception as e:
+                                logger.warning('Error sending ticket email for booking %s: %s', booking.id, e)
                         
                         return jsonify({
                             'booking_status': 'confirmed',
@@ -1181,7 +1202,7 @@ def api_booking_status(booking_id):
                     })
                     
             except Exception as e:
-                print(f"Error checking MeSomb status: {str(e)}")
+                logger.warning('Error checking MeSomb status for booking %s: %s', booking.id, e)
                 return jsonify({
                     'booking_status': booking.status,
                     'payment_status': booking.payment_status,
@@ -1202,7 +1223,7 @@ def api_booking_status(booking_id):
             })
             
     except Exception as e:
-        print(f"Error in booking status API: {str(e)}")
+        logger.exception('Error in booking status API')
         return jsonify({
             'error': True,
             'message': 'Error checking booking status',
@@ -1210,8 +1231,12 @@ def api_booking_status(booking_id):
         }), 500
 
 @user_bp.route('/api/contact-settings')
+@conditional(tags=CONTACT_SETTINGS_TAGS, max_age=300)
 def api_contact_settings():
     """API endpoint to get contact settings for the widget"""
+    return jsonify(cached('contact-settings', _contact_settings, tags=CONTACT_SETTINGS_TAGS))
+
+def _contact_settings():
     import os
     
     contact_settings = {}
@@ -1230,15 +1255,15 @@ def api_contact_settings():
     widget_enabled = contact_settings.get('contact_widget_enabled', 'true').lower() == 'true'
     
     if not widget_enabled:
-        return jsonify({'enabled': False})
+        return {'enabled': False}
     
-    return jsonify({
+    return {
         'enabled': True,
         'phone': contact_settings.get('support_phone', ''),
         'email': contact_settings.get('support_email', ''),
         'whatsapp': contact_settings.get('whatsapp_number', ''),
         'business_hours': contact_settings.get('business_hours', '24/7')
-    })
+    }
 
 # My Bookings Management
 @user_bp.route('/<lang>/my-bookings')
@@ -1258,24 +1283,14 @@ def my_bookings_search(lang):
         
         if booking_ref:
             # Search by booking reference with optional verification
-            query = query.filter(Booking.booking_reference.ilike(f'%{booking_ref}%'))
+            query = query.filter(booking_search_condition(booking_ref, ['reference']))
             
             if verify_input:
                 # Additional verification with phone or email
-                query = query.filter(
-                    db.or_(
-                        Customer.phone.ilike(f'%{verify_input}%'),
-                        Customer.email.ilike(f'%{verify_input}%')
-                    )
-                )
+                query = query.filter(booking_search_condition(verify_input, ['phone', 'email']))
         elif search_query:
             # Search by phone or email
-            query = query.filter(
-                db.or_(
-                    Customer.phone.ilike(f'%{search_query}%'),
-                    Customer.email.ilike(f'%{search_query}%')
-                )
-            )
+            query = query.filter(booking_search_condition(search_query, ['phone', 'email']))
         
         # Apply status filter if provided
         if status_filter:
@@ -1283,6 +1298,15 @@ def my_bookings_search(lang):
         
         # Order by creation date (newest first)
         bookings = query.order_by(Booking.created_at.desc()).all()
+        
+        # Bookings for departed trips that have been archived
+        if booking_ref:
+            archived = find_archived_booking(reference=booking_ref)
+            if archived and (not verify_input or archived.customer_id in matching_customer_ids(verify_input)) \
+                    and (not status_filter or archived.status == status_filter):
+                bookings.append(archived)
+        else:
+            bookings += archived_bookings_for_customers(matching_customer_ids(search_query), status=status_filter)
     
     return render_booking_template(
         g.language,
@@ -1297,10 +1321,10 @@ def my_bookings_search(lang):
 def view_ticket(lang, booking_id):
     """View individual ticket in POS style"""
     try:
-        booking = Booking.query.get_or_404(booking_id)
-        print(f"DEBUG: Found booking {booking.id} - {booking.booking_reference}")
-        print(f"DEBUG: Booking status: {booking.status}")
-        print(f"DEBUG: Trip: {booking.trip.route.origin} -> {booking.trip.route.destination}")
+        booking = Booking.query.get(booking_id) or find_archived_booking(booking_id=booking_id)
+        if booking is None:
+            abort(404)
+        logger.debug('Viewing ticket %s (%s), status %s', booking.id, booking.booking_reference, booking.status)
         
         # Try direct template rendering first for debugging
         try:
@@ -1309,14 +1333,14 @@ def view_ticket(lang, booking_id):
                                  current_language=g.language,
                                  site_name="Nkolo Pass")
         except Exception as template_error:
-            print(f"Template error: {str(template_error)}")
+            logger.warning('Ticket template error: %s', template_error)
             return render_booking_template(
                 g.language,
                 'ticket.html',
                 booking=booking
             )
     except Exception as e:
-        print(f"ERROR in view_ticket: {str(e)}")
+        logger.exception('Error in view_ticket for booking %s', booking_id)
         flash(f'Error loading ticket: {str(e)}', 'error')
         return redirect(url_for('user.my_bookings_search', lang=g.language))
 
@@ -1477,7 +1501,8 @@ def api_change_seats(lang):
         if booking.trip.departure_time <= datetime.utcnow() + timedelta(hours=2):
             return jsonify({'success': False, 'message': 'Cannot modify bookings less than 2 hours before departure'}), 400
         
-        # Check if new seats are available
+        # Check if new seats are available, holding the trip's lock until the commit below
+        lock_trip(booking.trip_id)
         other_bookings = Booking.query.filter(
             Booking.trip_id == booking.trip.id,
             Booking.status == 'confirmed',
@@ -1504,7 +1529,7 @@ def api_change_seats(lang):
         })
         
     except Exception as e:
-        print(f"Error changing seats: {str(e)}")
+        logger.exception('Error changing seats')
         return jsonify({'success': False, 'message': 'Internal server error'}), 500
 
 @user_bp.route('/<lang>/api/change-trip', methods=['POST'])
@@ -1563,7 +1588,7 @@ def api_change_trip(lang):
         })
         
     except Exception as e:
-        print(f"Error changing trip: {str(e)}")
+        logger.exception('Error changing trip')
         return jsonify({'success': False, 'message': 'Internal server error'}), 500
 
 # Booking Management Verification Route